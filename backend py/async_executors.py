@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Executors dedicados para el trabajo bloqueante de las APIs
+Snowflake y RPC de blockchain corren en pools propios con backpressure (503 + Retry-After)
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from snowflake_pool import PoolTimeoutError, is_connection_broken
+
+
+class ExecutorSaturatedError(Exception):
+    """El executor tiene todos sus workers y su cola ocupados"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Servicio saturado ({name}), intente de nuevo en {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """ThreadPoolExecutor con límite de trabajos en vuelo; rechaza en lugar de encolar sin fin"""
+
+    def __init__(self, name, max_workers, max_queue=None, retry_after=1, processes=False):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue if max_queue is not None else max_workers * 2
+        self.retry_after = retry_after
+        # processes=True para trabajo de CPU (bcrypt): fn y argumentos deben ser picklables.
+        # Workers con forkserver (spawn donde no existe): un fork del servidor copiaría sus
+        # hilos, locks tomados y conexiones abiertas del pool
+        if processes:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+
+    def _acquire_slot(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise ExecutorSaturatedError(self.name, self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """Ejecutar fn en el pool; lanza ExecutorSaturatedError si no hay capacidad"""
+        self._acquire_slot()
+        try:
+            return await self.run_unbounded(fn, *args, **kwargs)
+        finally:
+            self._release_slot()
+
+    def call(self, fn, *args, **kwargs):
+        """Versión bloqueante de run() para rutas síncronas"""
+        self._acquire_slot()
+        try:
+            return self._executor.submit(fn, *args, **kwargs).result()
+        finally:
+            self._release_slot()
+
+    async def run_unbounded(self, fn, *args, **kwargs):
+        """Ejecutar sin control de capacidad (limpieza que no debe rechazarse)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def warehouse_executor_from_env():
+    """Executor para consultas a Snowflake (por defecto, tantos workers como conexiones)"""
+    workers = int(os.getenv("WAREHOUSE_WORKERS", os.getenv("SNOWFLAKE_POOL_MAX_SIZE", "10")))
+    return BoundedExecutor(
+        "warehouse", workers,
+        max_queue=int(os.getenv("WAREHOUSE_QUEUE", str(workers * 2))),
+        retry_after=int(os.getenv("WAREHOUSE_RETRY_AFTER", "2")),
+    )
+
+
+def rpc_executor_from_env():
+    """Executor para llamadas RPC de blockchain"""
+    workers = int(os.getenv("RPC_WORKERS", "8"))
+    return BoundedExecutor(
+        "rpc", workers,
+        max_queue=int(os.getenv("RPC_QUEUE", str(workers * 2))),
+        retry_after=int(os.getenv("RPC_RETRY_AFTER", "1")),
+    )
+
+
+def make_async_connection_dependency(pool, executor):
+    """
+    Dependencia FastAPI async: toma la conexión del pool y la devuelve al terminar el request.
+    La espera por una conexión bloquea un hilo, así que no corre en el executor del warehouse:
+    si todos sus workers esperaran conexiones, los requests que ya tienen una no podrían ejecutar
+    su SQL ni devolverla. Las esperas van a un executor propio, acotado igual que el del warehouse
+    """
+    acquirer = BoundedExecutor(
+        f"{executor.name}-acquire", executor.max_workers + executor.max_queue,
+        max_queue=0, retry_after=executor.retry_after,
+    )
+
+    async def get_db_connection():
+        try:
+            conn = await acquirer.run(pool.acquire)
+        except (PoolTimeoutError, ExecutorSaturatedError):
+            raise
+        except Exception as e:
+            from fastapi import HTTPException
+
+            print(f"Error conectando a Snowflake: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
+        try:
+            yield conn
+        except Exception:
+            await executor.run_unbounded(pool.release, conn, discard=is_connection_broken(conn))
+            raise
+        else:
+            await executor.run_unbounded(pool.release, conn)
+
+    get_db_connection.acquirer = acquirer
+    return get_db_connection
+
+
+def install_backpressure_handlers(app):
+    """Traducir saturación de executors y del pool a 503 con Retry-After"""
+    from fastapi.responses import JSONResponse
+
+    @app.exception_handler(ExecutorSaturatedError)
+    async def executor_saturated_handler(request, exc):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(exc)},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    @app.exception_handler(PoolTimeoutError)
+    async def pool_timeout_handler(request, exc):
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(exc)},
+            headers={"Retry-After": "1"},
+        )
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Almacén columnar de auditoría (eventos AuditLogCreated y RecordAccessed de MedicalAudit)
+Los eventos confirmados del índice de eventos se vuelcan a segmentos de columnas NumPy
+ordenados por tiempo, con índices ordenados por usuario y por registro; los segmentos se
+abren con mmap y las consultas son búsquedas binarias. Los segmentos se compactan en uno
+cuando pasan de `max_segments`
+
+Uso:
+    python3 "backend py/audit_store.py" sync
+    python3 "backend py/audit_store.py" usuario 0xABC... --desde 2026-03-01 --hasta 2026-04-01
+    python3 "backend py/audit_store.py" registro 0x1234... --evento RecordAccessed
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+
+from contract_registry import BLOCKCHAIN_DIR
+
+AUDIT_CONTRACT = "MedicalAudit"
+
+# Código del evento = posición en la tupla
+EVENT_KINDS = ("AuditLogCreated", "RecordAccessed")
+AUDIT_LOG, RECORD_ACCESSED = 0, 1
+
+# Columnas de cada segmento (un .npy por columna)
+COLUMNS = {
+    "ts": np.int64, "block": np.int64, "log_index": np.int32, "kind": np.int8,
+    "user": "S20", "record": "S32", "log_hash": "S32", "tx": "S32", "action": np.int32,
+}
+
+MANIFEST = "manifest.json"
+
+
+def _key(value, size):
+    """Dirección o hash hex -> bytes de `size` (clave de las columnas S20/S32)"""
+    text = value[2:] if value.startswith(("0x", "0X")) else value
+    raw = bytes.fromhex(text)
+    if len(raw) != size:
+        raise ValueError(f"Se esperaban {size} bytes en {value}")
+    return raw
+
+
+def _to_hex(raw, size):
+    # NumPy recorta los bytes nulos finales de las columnas S
+    return "0x" + bytes(raw).ljust(size, b"\0").hex()
+
+
+def parse_time(value):
+    """Epoch (segundos) desde un entero o una fecha ISO (sin zona = UTC)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if value.isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def _write_segment(path, columns, actions, details):
+    """Ordenar por (ts, bloque, log_index), construir índices y escribir el segmento"""
+    os.makedirs(path)
+    order = np.lexsort((columns["log_index"], columns["block"], columns["ts"]))
+    columns = {name: np.asarray(values, dtype=COLUMNS[name])[order] for name, values in columns.items()}
+    for name, values in columns.items():
+        np.save(os.path.join(path, f"{name}.npy"), values)
+
+    # Índices: permutaciones estables, dentro de cada usuario/registro quedan en orden de tiempo
+    by_user = np.argsort(columns["user"], kind="stable")
+    np.save(os.path.join(path, "by_user.npy"), by_user)
+    np.save(os.path.join(path, "user_sorted.npy"), columns["user"][by_user])
+    accesses = np.flatnonzero(columns["kind"] == RECORD_ACCESSED)
+    by_record = accesses[np.argsort(columns["record"][accesses], kind="stable")]
+    np.save(os.path.join(path, "by_record.npy"), by_record)
+    np.save(os.path.join(path, "record_sorted.npy"), columns["record"][by_record])
+
+    # Detalles de longitud variable: un blob utf-8 y offsets
+    encoded = [details[i] for i in order]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.array([len(item) for item in encoded], dtype=np.int64))
+    np.save(os.path.join(path, "details_offsets.npy"), offsets)
+    with open(os.path.join(path, "details.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    with open(os.path.join(path, "actions.json"), "w") as f:
+        json.dump(actions, f, ensure_ascii=False)
+
+
+class _Segment:
+    """Segmento inmutable abierto con mmap"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in COLUMNS:
+            setattr(self, name, load(name))
+        self.by_user = load("by_user")
+        self.user_sorted = load("user_sorted")
+        self.by_record = load("by_record")
+        self.record_sorted = load("record_sorted")
+        self.details_offsets = load("details_offsets")
+        blob_path = os.path.join(path, "details.bin")
+        self.details = (
+            np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.zeros(0, np.uint8)
+        )
+        with open(os.path.join(path, "actions.json")) as f:
+            self.actions = json.load(f)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def select(self, user=None, record=None, start=None, end=None, kind=None):
+        """Filas (ordenadas por tiempo) que cumplen los filtros; rango [start, end)"""
+        if user is not None:
+            lo = np.searchsorted(self.user_sorted, user, "left")
+            hi = np.searchsorted(self.user_sorted, user, "right")
+            rows = np.asarray(self.by_user[lo:hi])
+            if record is not None:
+                # Los AuditLogCreated guardan record=b"", igual al hash cero en una columna S32
+                rows = rows[(self.record[rows] == record) & (self.kind[rows] == RECORD_ACCESSED)]
+        elif record is not None:
+            lo = np.searchsorted(self.record_sorted, record, "left")
+            hi = np.searchsorted(self.record_sorted, record, "right")
+            rows = np.asarray(self.by_record[lo:hi])
+        else:
+            lo = np.searchsorted(self.ts, start, "left") if start is not None else 0
+            hi = np.searchsorted(self.ts, end, "left") if end is not None else len(self)
+            rows = np.arange(lo, hi)
+            start = end = None
+
+        if start is not None or end is not None:
+            times = self.ts[rows]
+            lo = np.searchsorted(times, start, "left") if start is not None else 0
+            hi = np.searchsorted(times, end, "left") if end is not None else len(rows)
+            rows = rows[lo:hi]
+        if kind is not None:
+            rows = rows[self.kind[rows] == kind]
+        return rows
+
+    def row(self, i):
+        kind = int(self.kind[i])
+        action = int(self.action[i])
+        ts = int(self.ts[i])
+        details = bytes(self.details[self.details_offsets[i]:self.details_offsets[i + 1]]).decode("utf-8")
+        return {
+            "event": EVENT_KINDS[kind],
+            "timestamp": ts,
+            "fecha": datetime.fromtimestamp(ts, timezone.utc).isoformat(),
+            "block": int(self.block[i]),
+            "log_index": int(self.log_index[i]),
+            "transaction": _to_hex(self.tx[i], 32),
+            "user": _to_hex(self.user[i], 20),
+            "record_hash": _to_hex(self.record[i], 32) if kind == RECORD_ACCESSED else None,
+            "log_hash": _to_hex(self.log_hash[i], 32) if kind == AUDIT_LOG else None,
+            "action": self.actions[action] if action >= 0 else None,
+            "details": details if kind == AUDIT_LOG else None,
+        }
+
+    def size_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+
+class AuditStore:
+    """Segmentos columnares + manifiesto con el último bloque volcado"""
+
+    def __init__(self, path, segment_size=500000, max_segments=8, read_window=10000):
+        self.path = path
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.read_window = read_window
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._segments = []
+
+    # --- manifiesto ----------------------------------------------------------
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.path, MANIFEST)
+
+    def _load(self):
+        """Releer el manifiesto si otro proceso (p. ej. el CLI `sync`) lo cambió"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.manifest_path)
+            except FileNotFoundError:
+                mtime = None
+            if self._manifest is not None and mtime == self._manifest_mtime:
+                return self._segments
+            if mtime is None:
+                manifest = {"last_block": -1, "segments": []}
+            else:
+                with open(self.manifest_path) as f:
+                    manifest = json.load(f)
+            self._segments = [_Segment(os.path.join(self.path, name)) for name in manifest["segments"]]
+            self._manifest, self._manifest_mtime = manifest, mtime
+            return self._segments
+
+    def _save_manifest(self, manifest):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+        self._manifest = None
+
+    @property
+    def last_block(self):
+        self._load()
+        return self._manifest["last_block"]
+
+    # --- ingesta -----------------------------------------------------------
+
+    def ingest(self, event_store, block_timestamp=None):
+        """
+        Volcar los eventos de MedicalAudit indexados después de `last_block`.
+        `block_timestamp(bloque)` da la hora de los AuditLogCreated (el evento no la trae).
+        Devuelve el número de eventos nuevos
+        """
+        with self._lock:
+            self._load()
+            to_block = event_store.indexed_block(AUDIT_CONTRACT)
+            last_block = self._manifest["last_block"]
+            if to_block is None or to_block <= last_block:
+                return 0
+
+            buffer, nuevos = [], 0
+            from_block = last_block + 1
+            while from_block <= to_block:
+                window_end = min(from_block + self.read_window - 1, to_block)
+                buffer.extend(event_store.events(AUDIT_CONTRACT, from_block=from_block, to_block=window_end))
+                if len(buffer) >= self.segment_size:
+                    nuevos += self._flush(buffer, window_end, block_timestamp)
+                    buffer = []
+                from_block = window_end + 1
+            nuevos += self._flush(buffer, to_block, block_timestamp)
+
+            if len(self._manifest["segments"]) > self.max_segments:
+                self.compact()
+            return nuevos
+
+    def _flush(self, events, last_block, block_timestamp):
+        manifest = dict(self._manifest)
+        if events:
+            name = f"seg-{events[0]['block']:012d}-{last_block:012d}-{uuid.uuid4().hex[:6]}"
+            _write_segment(os.path.join(self.path, name), *self._columns(events, block_timestamp))
+            manifest["segments"] = manifest["segments"] + [name]
+        manifest["last_block"] = last_block
+        self._save_manifest(manifest)
+        self._load()
+        return len(events)
+
+    @staticmethod
+    def _columns(events, block_timestamp):
+        # RecordAccessed trae timestamp: sirve también para los AuditLogCreated del mismo bloque
+        block_times = {
+            e["block"]: int(e["args"]["timestamp"]) for e in events if e["event"] == "RecordAccessed"
+        }
+        columns = {name: [] for name in COLUMNS}
+        actions, action_codes, details = [], {}, []
+        for e in events:
+            args = e["args"]
+            if e["event"] == "RecordAccessed":
+                kind, ts = RECORD_ACCESSED, int(args["timestamp"])
+                record, log_hash, action, detail = _key(args["recordHash"], 32), b"", -1, b""
+            else:
+                if e["block"] not in block_times:
+                    if block_timestamp is None:
+                        raise ValueError("Se necesita block_timestamp para fechar AuditLogCreated")
+                    block_times[e["block"]] = int(block_timestamp(e["block"]))
+                kind, ts = AUDIT_LOG, block_times[e["block"]]
+                record, log_hash = b"", _key(args["logHash"], 32)
+                if args.get("action") not in action_codes:
+                    action_codes[args.get("action")] = len(actions)
+                    actions.append(args.get("action"))
+                action, detail = action_codes[args.get("action")], (args.get("details") or "").encode("utf-8")
+            columns["ts"].append(ts)
+            columns["block"].append(e["block"])
+            columns["log_index"].append(e["log_index"])
+            columns["kind"].append(kind)
+            columns["user"].append(_key(args["user"], 20))
+            columns["record"].append(record)
+            columns["log_hash"].append(log_hash)
+            columns["tx"].append(_key(e["transaction"], 32))
+            columns["action"].append(action)
+            details.append(detail)
+        return columns, actions, details
+
+    # --- compactación --------------------------------------------------------
+
+    def compact(self):
+        """Fusionar todos los segmentos en uno (reordena y reconstruye los índices)"""
+        with self._lock:
+            segments = self._load()
+            if len(segments) <= 1:
+                return len(segments)
+            columns = {name: np.concatenate([np.asarray(getattr(seg, name)) for seg in segments])
+                       for name in COLUMNS}
+
+            # Los diccionarios de acciones son por segmento: se reasignan los códigos
+            actions, codes, remapped = [], {}, []
+            for seg in segments:
+                mapping = []
+                for action in seg.actions:
+                    if action not in codes:
+                        codes[action] = len(actions)
+                        actions.append(action)
+                    mapping.append(codes[action])
+                # El -1 (sin acción) apunta al último elemento, que también es -1
+                mapping = np.array(mapping + [-1], dtype=np.int32)
+                remapped.append(mapping[np.asarray(seg.action)])
+            columns["action"] = np.concatenate(remapped)
+
+            details = []
+            for seg in segments:
+                blob = bytes(seg.details)
+                offsets = np.asarray(seg.details_offsets).tolist()
+                details.extend(blob[offsets[i]:offsets[i + 1]] for i in range(len(seg)))
+
+            name = f"seg-compact-{int(time.time())}-{uuid.uuid4().hex[:6]}"
+            _write_segment(os.path.join(self.path, name), columns, actions, details)
+            old = [seg.path for seg in segments]
+            self._save_manifest({**self._manifest, "segments": [name]})
+            self._load()
+            # Los lectores con mmap abiertos conservan los archivos borrados hasta cerrarlos
+            for path in old:
+                shutil.rmtree(path, ignore_errors=True)
+            return 1
+
+    # --- consultas ---------------------------------------------------------
+
+    def query(self, user=None, record_hash=None, start=None, end=None, event=None,
+              limit=100, newest_first=False):
+        """
+        Eventos por usuario, hash de registro y/o rango [start, end) (epoch o fecha ISO).
+        Devuelve {"total", "events"}; `events` trae como máximo `limit` filas
+        """
+        user_key = np.bytes_(_key(user, 20)) if user else None
+        record_key = np.bytes_(_key(record_hash, 32)) if record_hash else None
+        if record_key is not None and not record_key.rstrip(b"\0"):
+            # NumPy recorta los bytes nulos: el hash cero coincidiría con los logs sin registro
+            raise ValueError("El hash de registro no puede ser cero")
+        kind = EVENT_KINDS.index(event) if event else None
+        start, end = parse_time(start), parse_time(end)
+
+        parts = []
+        for seg in self._load():
+            rows = seg.select(user_key, record_key, start, end, kind)
+            if len(rows):
+                parts.append((seg, rows))
+        total = sum(len(rows) for _, rows in parts)
+        if not parts:
+            return {"total": 0, "events": []}
+
+        times = np.concatenate([seg.ts[rows] for seg, rows in parts])
+        owners = np.concatenate([np.full(len(rows), i) for i, (_, rows) in enumerate(parts)])
+        rows = np.concatenate([rows for _, rows in parts])
+        order = np.argsort(times, kind="stable")
+        if newest_first:
+            order = order[::-1]
+        if limit is not None:
+            order = order[:limit]
+        return {"total": total, "events": [parts[owners[i]][0].row(rows[i]) for i in order]}
+
+    def count(self, **filters):
+        return self.query(limit=0, **filters)["total"]
+
+    def stats(self):
+        segments = self._load()
+        return {
+            "path": self.path,
+            "last_block": self._manifest["last_block"],
+            "segments": len(segments),
+            "rows": sum(len(seg) for seg in segments),
+            "size_bytes": sum(seg.size_bytes() for seg in segments),
+        }
+
+
+def audit_store_from_env():
+    """AuditStore configurado con AUDIT_STORE_*"""
+    return AuditStore(
+        os.getenv("AUDIT_STORE_PATH", os.path.join(BLOCKCHAIN_DIR, "audit-store")),
+        segment_size=int(os.getenv("AUDIT_STORE_SEGMENT_SIZE", "500000")),
+        max_segments=int(os.getenv("AUDIT_STORE_MAX_SEGMENTS", "8")),
+    )
+
+
+def _print_events(result, elapsed):
+    print(f"📊 {result['total']} eventos en {elapsed * 1000:.1f} ms")
+    for event in result["events"]:
+        if event["event"] == "RecordAccessed":
+            print(f"   🕒 {event['fecha']}  👤 {event['user']}  📄 acceso a {event['record_hash']}")
+        else:
+            print(f"   🕒 {event['fecha']}  👤 {event['user']}  📝 {event['action']}: {event['details']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacén columnar de auditoría médica")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    sync = sub.add_parser("sync", help="indexar eventos nuevos y volcarlos al almacén")
+    sync.add_argument("--follow", action="store_true", help="seguir la cadena en bucle")
+    sync.add_argument("--interval", type=float, default=5.0)
+
+    for nombre, ayuda in (("usuario", "dirección del usuario"), ("registro", "hash del registro")):
+        consulta = sub.add_parser(nombre, help=f"eventos por {ayuda}")
+        consulta.add_argument("valor", help=ayuda)
+    sub.add_parser("rango", help="eventos en un rango de fechas")
+    for consulta in (sub.choices["usuario"], sub.choices["registro"], sub.choices["rango"]):
+        consulta.add_argument("--desde", help="fecha ISO o epoch (incluida)")
+        consulta.add_argument("--hasta", help="fecha ISO o epoch (excluida)")
+        consulta.add_argument("--evento", choices=EVENT_KINDS)
+        consulta.add_argument("--limit", type=int, default=20)
+        consulta.add_argument("--json", action="store_true", help="imprimir el resultado como JSON")
+
+    sub.add_parser("compactar", help="fusionar los segmentos en uno")
+    sub.add_parser("stats", help="filas, segmentos y tamaño en disco")
+    args = parser.parse_args()
+
+    store = audit_store_from_env()
+
+    if args.comando == "sync":
+        from blockchain_monitor import BlockchainMonitor
+
+        monitor = BlockchainMonitor()
+        block_timestamp = lambda block: monitor.w3.eth.get_block(block)["timestamp"]
+        while True:
+            monitor.sync_events()
+            nuevos = store.ingest(monitor.indexer.store, block_timestamp)
+            print(f"✅ Eventos de auditoría volcados: {nuevos} (hasta el bloque {store.last_block})")
+            if not args.follow:
+                break
+            time.sleep(args.interval)
+    elif args.comando == "compactar":
+        started = time.perf_counter()
+        store.compact()
+        print(f"✅ Compactado en {time.perf_counter() - started:.2f}s")
+        print(json.dumps(store.stats(), indent=2))
+    elif args.comando == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        filtros = {"start": args.desde, "end": args.hasta, "event": args.evento, "limit": args.limit}
+        if args.comando == "usuario":
+            filtros["user"] = args.valor
+        elif args.comando == "registro":
+            filtros["record_hash"] = args.valor
+        started = time.perf_counter()
+        result = store.query(**filtros)
+        elapsed = time.perf_counter() - started
+        if args.json:
+            print(json.dumps(result, indent=2, ensure_ascii=False))
+        else:
+            _print_events(result, elapsed)
+
+
+if __name__ == "__main__":
+    main()
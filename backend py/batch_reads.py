@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Lecturas de contratos agrupadas en lotes JSON-RPC
+Muchas llamadas eth_call (getMedicalRecord, getConsent...) viajan en una sola petición HTTP
+por lote; los resultados se devuelven en el mismo orden y los registros inmutables se cachean
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class BatchCallError(Exception):
+    """Error devuelto por el nodo para una llamada individual del lote"""
+
+
+class BatchUnsupportedError(Exception):
+    """El nodo respondió al lote con algo que no es un lote: no admite JSON-RPC batch"""
+
+
+def _is_batch_rejection(body, status_ok):
+    """¿La respuesta a un array JSON-RPC indica que el nodo no acepta lotes?"""
+    if body is None or isinstance(body, list):
+        return False
+    error = body.get("error") if isinstance(body, dict) else None
+    if isinstance(error, dict):
+        # -32600 (Invalid Request) es lo que responde un nodo que no reconoce el array
+        if error.get("code") == -32600 or "batch" in str(error.get("message", "")).lower():
+            return True
+    # Un 200 con un objeto suelto en lugar de la lista de respuestas; un 5xx es de transporte
+    return status_ok
+
+
+def _encode_call(contract, fn_name, args):
+    # web3 v7 usa encode_abi; v6 encodeABI
+    if hasattr(contract, "encode_abi"):
+        return contract.encode_abi(fn_name, args=list(args))
+    return contract.encodeABI(fn_name=fn_name, args=list(args))
+
+
+def _output_types(contract, fn_name):
+    for item in contract.abi:
+        if item.get("type") == "function" and item.get("name") == fn_name:
+            return [output["type"] for output in item.get("outputs", [])]
+    raise ValueError(f"Función {fn_name} no encontrada en el ABI")
+
+
+def _checksum_addresses(types, values):
+    # eth_call vía web3 devuelve direcciones con checksum; eth_abi en minúsculas
+    from web3 import Web3
+
+    return tuple(
+        Web3.to_checksum_address(value) if abi_type == "address" else value
+        for abi_type, value in zip(types, values)
+    )
+
+
+class BatchContractReader:
+    """eth_call en lotes sobre una sesión HTTP keep-alive, con caché LRU opcional por clave"""
+
+    def __init__(self, w3, batch_size=100, cache_size=10000, session=None, retries=2, retry_delay=0.2):
+        self.w3 = w3
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._session = session
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._batch_supported = True
+        self._stats = {"calls": 0, "http_requests": 0, "cache_hits": 0, "fallback_calls": 0, "retries": 0}
+
+    @property
+    def endpoint(self):
+        return getattr(self.w3.provider, "endpoint_uri", None)
+
+    def _http(self):
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+        return self._session
+
+    # --- caché -------------------------------------------------------------
+
+    def _cache_get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._stats["cache_hits"] += 1
+                return True, self._cache[key]
+        return False, None
+
+    def _cache_put(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # --- llamadas ----------------------------------------------------------
+
+    def call_many(self, contract, fn_name, args_list, cache_if=None, cache_prefix=None):
+        """
+        Resultado decodificado (tupla) o BatchCallError por cada elemento de `args_list`, en orden.
+        `cache_if(resultado)` decide qué resultados son inmutables y se pueden cachear.
+        """
+        args_list = [tuple(args) for args in args_list]
+        results = [None] * len(args_list)
+        missing = []
+        for index, args in enumerate(args_list):
+            if cache_if is not None:
+                hit, value = self._cache_get((cache_prefix or fn_name, contract.address, args))
+                if hit:
+                    results[index] = value
+                    continue
+            missing.append(index)
+
+        # Llamadas repetidas dentro del mismo lote se piden una sola vez
+        unique = list(OrderedDict.fromkeys(args_list[i] for i in missing))
+        fetched = {}
+        for start in range(0, len(unique), self.batch_size):
+            chunk = unique[start:start + self.batch_size]
+            for args, value in zip(chunk, self._fetch(contract, fn_name, chunk)):
+                fetched[args] = value
+
+        for index in missing:
+            value = fetched[args_list[index]]
+            results[index] = value
+            if cache_if is not None and not isinstance(value, Exception) and cache_if(value):
+                self._cache_put((cache_prefix or fn_name, contract.address, args_list[index]), value)
+        return results
+
+    def _fetch(self, contract, fn_name, chunk):
+        self._stats["calls"] += len(chunk)
+        if self._batch_supported and self.endpoint:
+            try:
+                return self._fetch_batch_with_retries(contract, fn_name, chunk)
+            except BatchUnsupportedError as e:
+                # Solo una respuesta del nodo que rechaza el lote desactiva los lotes
+                print(f"⚠️ Lotes JSON-RPC no disponibles ({str(e)}); usando eth_call individuales")
+                self._batch_supported = False
+        return self._fetch_sequential(contract, fn_name, chunk)
+
+    def _fetch_batch_with_retries(self, contract, fn_name, chunk):
+        """Errores de transporte (timeout, conexión, 5xx) se reintentan y luego se propagan"""
+        for attempt in range(self.retries + 1):
+            try:
+                return self._fetch_batch(contract, fn_name, chunk)
+            except BatchUnsupportedError:
+                raise
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                self._stats["retries"] += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _fetch_batch(self, contract, fn_name, chunk):
+        from eth_abi import decode
+
+        types = _output_types(contract, fn_name)
+        requests_by_id = {}
+        payload = []
+        for args in chunk:
+            request_id = next(self._ids)
+            requests_by_id[request_id] = args
+            payload.append({
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": "eth_call",
+                "params": [{"to": contract.address, "data": _encode_call(contract, fn_name, args)}, "latest"],
+            })
+        self._stats["http_requests"] += 1
+        response = self._http().post(self.endpoint, json=payload, timeout=30)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        if _is_batch_rejection(body, response.ok):
+            raise BatchUnsupportedError(body.get("error", body) if isinstance(body, dict) else body)
+        response.raise_for_status()
+        if not isinstance(body, list):
+            raise ValueError(f"Respuesta inesperada del nodo (HTTP {response.status_code}): {body}")
+
+        # El nodo puede responder en cualquier orden: se reordena por id
+        by_args = {}
+        for item in body:
+            args = requests_by_id.get(item.get("id"))
+            if args is None:
+                continue
+            if "error" in item:
+                by_args[args] = BatchCallError(item["error"].get("message", str(item["error"])))
+                continue
+            data = bytes.fromhex(item["result"][2:])
+            if not data:
+                by_args[args] = BatchCallError("Respuesta vacía (¿contrato no desplegado?)")
+                continue
+            by_args[args] = _checksum_addresses(types, decode(types, data))
+        return [by_args.get(args, BatchCallError("Sin respuesta del nodo")) for args in chunk]
+
+    def _fetch_sequential(self, contract, fn_name, chunk):
+        results = []
+        for args in chunk:
+            self._stats["fallback_calls"] += 1
+            try:
+                value = getattr(contract.functions, fn_name)(*args).call()
+                results.append(tuple(value) if isinstance(value, (list, tuple)) else (value,))
+            except Exception as e:
+                results.append(BatchCallError(str(e)))
+        return results
+
+    def metrics(self):
+        with self._lock:
+            cached = len(self._cache)
+        return {**self._stats, "cached": cached, "batch_supported": self._batch_supported}
+
+
+def batch_reader_from_env(w3, session=None):
+    """BatchContractReader configurado con BLOCKCHAIN_READ_*"""
+    return BatchContractReader(
+        w3,
+        batch_size=int(os.getenv("BLOCKCHAIN_READ_BATCH_SIZE", "100")),
+        cache_size=int(os.getenv("BLOCKCHAIN_READ_CACHE_SIZE", "10000")),
+        session=session,
+        retries=int(os.getenv("BLOCKCHAIN_READ_RETRIES", "2")),
+    )
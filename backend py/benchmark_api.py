@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark de latencia de la API (main_simple) bajo tráfico concurrente
+Usa una base sqlite local en lugar de Snowflake y reporta p50/p99 por ruta
+
+Uso: python3 benchmark_api.py --concurrency 50 --requests 2000 --latency-ms 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+# main_simple resuelve rutas relativas a este directorio
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.getcwd())
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def drive(client, method, path, total, concurrency, headers=None, json_body=None):
+    """Lanzar `total` requests con `concurrency` clientes simultáneos"""
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker():
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            response = await client.request(method, path, headers=headers, json=json_body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses
+
+
+def summarize(name, latencies, statuses, elapsed):
+    return {
+        "route": name,
+        "requests": len(latencies),
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+    }
+
+
+async def run(args):
+    import httpx
+    from sqlite_warehouse import SQLiteWarehouse
+    import main_simple
+
+    warehouse = SQLiteWarehouse(latency=args.latency_ms / 1000.0)
+    warehouse.seed_pacientes(args.patients)
+    main_simple.snowflake_pool._connect = warehouse.connect
+
+    token = main_simple.create_access_token({"sub": "doctor1", "rol": "doctor", "user_id": 1})
+    auth = {"Authorization": f"Bearer {token}"}
+
+    transport = httpx.ASGITransport(app=main_simple.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Calentar el pool
+        await drive(client, "GET", "/api/pacientes", 10, 5, headers=auth)
+
+        # Tráfico mixto: las rutas de warehouse y las estáticas compiten a la vez
+        start = time.perf_counter()
+        mixed = await asyncio.gather(
+            drive(client, "GET", "/api/pacientes", args.requests, args.concurrency, headers=auth),
+            drive(client, "GET", "/login", args.requests, args.concurrency),
+            drive(client, "POST", "/api/auth/login", args.requests, args.concurrency,
+                  json_body={"username": "doctor1", "password": "password123"}),
+        )
+        elapsed = time.perf_counter() - start
+        for name, (latencies, statuses) in zip(
+            ["GET /api/pacientes", "GET /login", "POST /api/auth/login"], mixed
+        ):
+            results.append(summarize(name, latencies, statuses, elapsed))
+
+    report = {
+        "benchmark": "api_latency",
+        "concurrency": args.concurrency,
+        "requests_per_route": args.requests,
+        "warehouse_latency_ms": args.latency_ms,
+        "results": results,
+        "pool": main_simple.snowflake_pool.metrics(),
+        "executors": {
+            "warehouse": main_simple.warehouse_executor.metrics(),
+            "rpc": main_simple.rpc_executor.metrics(),
+        },
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latencia de la API médica")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="latencia simulada por consulta")
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE LATENCIA - API MÉDICA")
+    print("=" * 50)
+    report = asyncio.run(run(args))
+    for result in report["results"]:
+        print(f"📊 {result['route']:<24} p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+              f"rps={result['throughput_rps']} status={result['statuses']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del costo de autenticación por request
+Compara jwt.decode en cada request contra TokenVerifier con cache de claims
+
+Uso: python3 benchmark_auth.py --iterations 100000 --users 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SECRET_KEY = "benchmark-secret"
+ALGORITHM = "HS256"
+
+
+def medir(nombre, iterations, tokens, fn, repeats):
+    """Microsegundos por verificación (mediana de `repeats` corridas)"""
+    corridas = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(iterations):
+            fn(tokens[i % len(tokens)])
+        corridas.append((time.perf_counter() - start) / iterations * 1e6)
+    return {
+        "metodo": nombre,
+        "us_por_request": round(statistics.median(corridas), 3),
+        "verificaciones_por_segundo": round(1e6 / statistics.median(corridas)),
+    }
+
+
+def run(args):
+    import jwt
+    from token_verifier import TokenVerifier
+
+    expire = datetime.utcnow() + timedelta(minutes=30)
+    tokens = [
+        f"Bearer {jwt.encode({'sub': f'user{i}', 'rol': 'doctor', 'user_id': i, 'exp': expire}, SECRET_KEY, algorithm=ALGORITHM)}"
+        for i in range(args.users)
+    ]
+
+    def decode_por_request(header):
+        # Lo que hacía verify_token antes: parsear el header y verificar la firma HMAC
+        token = header.split(" ")[1]
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    verifier = TokenVerifier(SECRET_KEY, ALGORITHM, max_entries=args.users * 2)
+
+    results = [
+        medir("jwt.decode", args.iterations, tokens, decode_por_request, args.repeats),
+        medir("TokenVerifier", args.iterations, tokens, verifier.verify_header, args.repeats),
+    ]
+    return {
+        "benchmark": "auth_por_request",
+        "iterations": args.iterations,
+        "usuarios": args.users,
+        "results": results,
+        "speedup": round(results[0]["us_por_request"] / results[1]["us_por_request"], 1),
+        "verifier": verifier.metrics(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark de verificación de JWT")
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=200, help="tokens distintos en rotación")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ MICROBENCHMARK DE AUTENTICACIÓN")
+    print("=" * 50)
+    report = run(args)
+    for result in report["results"]:
+        print(f"📊 {result['metodo']:<14} {result['us_por_request']} µs/request "
+              f"({result['verificaciones_por_segundo']} verificaciones/s)")
+    print(f"🚀 Aceleración: {report['speedup']}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark de lecturas de registros médicos contra un nodo Hardhat local
+Compara un eth_call por registro contra las lecturas en lote de BatchContractReader
+
+Requiere: cd blockchain && npx hardhat node  (y el deploy de deploy-medical.js)
+Uso: python3 "backend py/benchmark_batch_reads.py" --records 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+# MedicalBlockchain lee blockchain/... relativo a la raíz del proyecto
+os.chdir(os.path.dirname(BACKEND_DIR))
+
+
+async def crear_registros(blockchain, records):
+    results = await asyncio.gather(*(
+        blockchain.create_medical_record_async(f"READ_{i:06d}", "Diagnóstico", "Tratamiento")
+        for i in range(records)
+    ))
+    return [r["record_hash"] for r in results if r["success"]]
+
+
+def medir(nombre, fn, hashes):
+    start = time.perf_counter()
+    results = fn(hashes)
+    elapsed = time.perf_counter() - start
+    return {
+        "metodo": nombre,
+        "registros": len(hashes),
+        "ms_total": round(elapsed * 1000, 2),
+        "ms_por_registro": round(elapsed * 1000 / len(hashes), 3),
+        "ok": sum(1 for r in results if r["success"]),
+    }
+
+
+def run(args):
+    from web3 import Web3
+    from web3_medical_integration import MedicalBlockchain
+
+    blockchain = MedicalBlockchain()
+    if not blockchain.get_connection_status().get("connected"):
+        raise SystemExit("❌ Nodo no disponible")
+
+    hashes = asyncio.run(crear_registros(blockchain, args.records))
+    blockchain.pipeline.close()
+
+    def secuencial(record_hashes):
+        # Lo que hacía get_medical_record: un eth_call por registro
+        contract = blockchain.medical_records_contract
+        return [
+            MedicalBlockchain._medical_record_dict(
+                contract.functions.getMedicalRecord(Web3.to_bytes(hexstr=h)).call()
+            )
+            for h in record_hashes
+        ]
+
+    results = [
+        medir("eth_call secuencial", secuencial, hashes),
+        medir("lotes (caché fría)", blockchain.get_medical_records, hashes),
+        medir("lotes (caché caliente)", blockchain.get_medical_records, hashes),
+    ]
+    return {
+        "benchmark": "batch_reads",
+        "records": len(hashes),
+        "batch_size": blockchain.reader.batch_size,
+        "results": results,
+        "reader": blockchain.reader.metrics(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de lecturas de registros en lote")
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE LECTURAS BLOCKCHAIN")
+    print("=" * 50)
+    report = run(args)
+    for result in report["results"]:
+        print(f"📊 {result['metodo']:<24} {result['ms_total']} ms "
+              f"({result['ms_por_registro']} ms/registro, ok={result['ok']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de las operaciones blockchain contra un nodo Hardhat local
+Arranca (o reutiliza) un nodo, despliega MedicalRecords, PatientConsent y MedicalAudit con los
+artifacts compilados y lanza registros médicos, consentimientos y logs de auditoría con la
+concurrencia indicada. Reporta throughput, percentiles de latencia, gas por operación y
+modos de fallo en JSON para seguir regresiones
+
+Uso:
+    python3 "backend py/benchmark_blockchain_load.py" --start-node --records 500 --consents 200 --audits 300
+    python3 "backend py/benchmark_blockchain_load.py" --rpc-url http://127.0.0.1:8545 --deploy --concurrency 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+# MedicalBlockchain lee blockchain/... relativo a la raíz del proyecto
+os.chdir(os.path.dirname(BACKEND_DIR))
+
+# Operación -> función del contrato (clave de las métricas de gas de FeeStrategy)
+OPERATIONS = {
+    "medical_record": "createMedicalRecord",
+    "consent": "updateConsent",
+    "audit_log": "createAuditLog",
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def failure_mode(error):
+    """Clasificar un error para el resumen de fallos"""
+    from tx_pipeline import is_nonce_error
+
+    message = str(error).lower()
+    if is_nonce_error(message):
+        return "nonce"
+    if "revert" in message:
+        return "revert"
+    if "timeout" in message or "timed out" in message:
+        return "timeout"
+    if "insufficient funds" in message:
+        return "fondos"
+    if "saturad" in message or "saturated" in message:
+        return "saturado"
+    return "otro"
+
+
+# --- nodo y despliegue ---------------------------------------------------------
+
+def start_node(port, log_path):
+    """Lanzar `npx hardhat node` en blockchain/ y esperar a que responda"""
+    from contract_registry import BLOCKCHAIN_DIR
+    from web3 import Web3
+
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        ["npx", "hardhat", "node", "--port", str(port)],
+        cwd=BLOCKCHAIN_DIR, stdout=log, stderr=subprocess.STDOUT
+    )
+    w3 = Web3(Web3.HTTPProvider(f"http://127.0.0.1:{port}"))
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ El nodo Hardhat terminó al arrancar (ver {log_path})")
+        if w3.is_connected():
+            return process
+        time.sleep(0.5)
+    process.terminate()
+    raise SystemExit(f"❌ El nodo Hardhat no respondió en 60s (ver {log_path})")
+
+
+def ensure_artifacts():
+    from contract_registry import BLOCKCHAIN_DIR, CONTRACT_NAMES, artifact_path
+
+    if not all(os.path.exists(artifact_path(name)) for name in CONTRACT_NAMES):
+        print("🔧 Compilando contratos (npx hardhat compile)...")
+        subprocess.run(["npx", "hardhat", "compile"], cwd=BLOCKCHAIN_DIR, check=True)
+
+
+def deploy_contracts(w3, addresses_file):
+    """Desplegar los tres contratos con la primera cuenta del nodo; devuelve gas de despliegue"""
+    from contract_registry import CONTRACT_NAMES, artifact_path
+
+    deployer = w3.eth.accounts[0]
+    addresses, gas = {}, {}
+    for name in CONTRACT_NAMES:
+        with open(artifact_path(name)) as f:
+            artifact = json.load(f)
+        factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+        receipt = w3.eth.wait_for_transaction_receipt(factory.constructor().transact({"from": deployer}))
+        addresses[name] = receipt.contractAddress
+        gas[name] = receipt.gasUsed
+        print(f"✅ {name} desplegado en {receipt.contractAddress} ({receipt.gasUsed} gas)")
+    addresses["network"] = "localhost"
+    with open(addresses_file, "w") as f:
+        json.dump(addresses, f, indent=2)
+    return gas
+
+
+# --- carga ---------------------------------------------------------------------
+
+def build_workload(args):
+    """Operaciones mezcladas en orden aleatorio reproducible"""
+    workload = (
+        [("medical_record", i) for i in range(args.records)]
+        + [("consent", i) for i in range(args.consents)]
+        + [("audit_log", i) for i in range(args.audits)]
+    )
+    random.Random(args.seed).shuffle(workload)
+    return workload
+
+
+def call_operation(blockchain, operation, i):
+    if operation == "medical_record":
+        return blockchain.create_medical_record_async(
+            f"LOAD_{i:06d}", f"Diagnóstico de carga {i}", "Tratamiento de carga"
+        )
+    if operation == "consent":
+        return blockchain.update_patient_consent_async(i % 2 == 0, i % 3 == 0, True)
+    return blockchain.create_audit_log_async("LOAD_TEST", f"Acceso de prueba {i}", f"0x{i:064x}")
+
+
+def operation_report(samples, elapsed, gas_stats):
+    latencies = [latency for latency, _ in samples]
+    errores = [error for _, error in samples if error is not None]
+    modos = {}
+    for error in errores:
+        modo = failure_mode(error)
+        modos[modo] = modos.get(modo, 0) + 1
+    ok = len(samples) - len(errores)
+    return {
+        "operaciones": len(samples),
+        "ok": ok,
+        "errores": len(errores),
+        "throughput_ops": round(ok / elapsed, 2) if elapsed else None,
+        "latencia_ms": {
+            "p50": round(percentile(latencies, 50), 2) if latencies else None,
+            "p90": round(percentile(latencies, 90), 2) if latencies else None,
+            "p99": round(percentile(latencies, 99), 2) if latencies else None,
+            "max": round(max(latencies), 2) if latencies else None,
+            "mean": round(statistics.mean(latencies), 2) if latencies else None,
+        },
+        "gas": gas_stats,
+        "modos_fallo": modos,
+        "ejemplos_error": [str(error) for error in errores[:3]],
+    }
+
+
+def gas_by_operation(fee_metrics):
+    """Agregar las métricas de FeeStrategy (por función y bucket de tamaño) por operación"""
+    result = {}
+    for operation, fn_name in OPERATIONS.items():
+        stats = [s for key, s in fee_metrics["functions"].items() if key.split(":")[0] == fn_name]
+        transactions = sum(s["transactions"] for s in stats)
+        if not transactions:
+            result[operation] = None
+            continue
+        gas_used = sum(s["gas_used"] for s in stats)
+        predicted = sum(s["predicted_gas"] for s in stats)
+        result[operation] = {
+            "transacciones": transactions,
+            "gas_medio": gas_used // transactions,
+            "gas_max": max(s["max_gas_used"] for s in stats),
+            "gas_previsto_medio": predicted // transactions,
+            "costo_medio_wei": sum(s["cost_wei"] for s in stats) // transactions,
+            "fuera_de_margen": sum(s["out_of_margin"] for s in stats),
+        }
+    return result
+
+
+async def drive(blockchain, workload, concurrency):
+    from async_executors import ExecutorSaturatedError
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = {operation: [] for operation in OPERATIONS}
+
+    async def ejecutar(operation, i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await call_operation(blockchain, operation, i)
+                error = None if result["success"] else result["error"]
+            except ExecutorSaturatedError as e:
+                error = f"saturado: {str(e)}"
+            samples[operation].append(((time.perf_counter() - start) * 1000, error))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(ejecutar(operation, i) for operation, i in workload))
+    return samples, time.perf_counter() - start
+
+
+def run(args):
+    # La carga firma con la cuenta del nodo local, no con la PRIVATE_KEY de Sepolia del .env
+    os.environ["PRIVATE_KEY"] = args.private_key or ""
+
+    from contract_registry import ContractRegistry
+    from web3_medical_integration import MedicalBlockchain
+
+    workdir = tempfile.mkdtemp(prefix="predisalud_load_")
+    node = None
+    rpc_url = args.rpc_url
+    if args.start_node:
+        rpc_url = f"http://127.0.0.1:{args.port}"
+        print(f"🚀 Arrancando nodo Hardhat en {rpc_url}...")
+        node = start_node(args.port, os.path.join(workdir, "hardhat-node.log"))
+
+    try:
+        addresses_file = args.addresses
+        deploy_gas = None
+        if args.start_node or args.deploy:
+            ensure_artifacts()
+            addresses_file = os.path.join(workdir, "contract-addresses.json")
+            registry = ContractRegistry(rpc_url, addresses_file)
+            deploy_gas = deploy_contracts(registry.w3, addresses_file)
+        else:
+            registry = ContractRegistry(rpc_url, addresses_file)
+
+        w3 = registry.w3
+        if args.interval_mining:
+            # Bloques cada N ms en lugar de uno por transacción (más parecido a una red real)
+            w3.provider.make_request("evm_setAutomine", [False])
+            w3.provider.make_request("evm_setIntervalMining", [args.interval_mining])
+
+        blockchain = MedicalBlockchain(registry=registry)
+        workload = build_workload(args)
+        first_block = w3.eth.block_number
+        print(f"⏱️ {len(workload)} operaciones con concurrencia {args.concurrency}...")
+        samples, elapsed = asyncio.run(drive(blockchain, workload, args.concurrency))
+        last_block = w3.eth.block_number
+        pipeline = blockchain.pipeline.metrics()
+        blockchain.close()
+    finally:
+        if node is not None:
+            node.terminate()
+            node.wait(timeout=10)
+
+    gas = gas_by_operation(pipeline["fees"])
+    operaciones = {
+        operation: operation_report(samples[operation], elapsed, gas[operation])
+        for operation in OPERATIONS if samples[operation]
+    }
+    todas = [sample for operation in OPERATIONS for sample in samples[operation]]
+    total = operation_report(todas, elapsed, None)
+    del total["gas"]
+    bloques = last_block - first_block
+    return {
+        "benchmark": "blockchain_load",
+        "rpc_url": rpc_url,
+        "nodo_propio": bool(args.start_node),
+        "interval_mining_ms": args.interval_mining,
+        "concurrencia": args.concurrency,
+        "segundos": round(elapsed, 3),
+        "bloques": bloques,
+        "tx_por_bloque": round(pipeline["mined"] / bloques, 2) if bloques else None,
+        "gas_despliegue": deploy_gas,
+        "total": total,
+        "operaciones": operaciones,
+        "pipeline": {key: value for key, value in pipeline.items() if key != "fees"},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de las operaciones blockchain médicas")
+    parser.add_argument("--rpc-url", default=os.getenv("ETHEREUM_RPC_URL", "http://127.0.0.1:8545"))
+    parser.add_argument("--start-node", action="store_true", help="arrancar un nodo Hardhat propio (implica --deploy)")
+    parser.add_argument("--port", type=int, default=8546, help="puerto del nodo propio")
+    parser.add_argument("--deploy", action="store_true", help="desplegar contratos nuevos en el nodo indicado")
+    parser.add_argument("--addresses", default="contract-addresses.json",
+                        help="direcciones existentes (relativo a blockchain/) si no se despliega")
+    parser.add_argument("--private-key", help="firmar con esta clave en lugar de la cuenta del nodo")
+    parser.add_argument("--records", type=int, default=300)
+    parser.add_argument("--consents", type=int, default=100)
+    parser.add_argument("--audits", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--interval-mining", type=int, default=0, metavar="MS",
+                        help="minar un bloque cada MS milisegundos (0 = un bloque por transacción)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ PRUEBA DE CARGA BLOCKCHAIN")
+    print("=" * 50)
+    report = run(args)
+    total = report["total"]
+    print(f"📊 {total['ok']}/{total['operaciones']} operaciones en {report['segundos']}s "
+          f"({total['throughput_ops']} ops/s, {report['bloques']} bloques)")
+    for operation, stats in report["operaciones"].items():
+        latencia = stats["latencia_ms"]
+        gas = stats["gas"] or {}
+        print(f"   {operation:<15} {stats['throughput_ops']} ops/s p50={latencia['p50']}ms "
+              f"p99={latencia['p99']}ms gas={gas.get('gas_medio')} errores={stats['errores']}")
+    if total["modos_fallo"]:
+        print(f"⚠️ Modos de fallo: {total['modos_fallo']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escritura en blockchain contra un nodo Hardhat local
+Lanza registros médicos concurrentes por el pipeline de transacciones y reporta
+registros por segundo, latencia y errores de nonce
+
+Requiere: cd blockchain && npx hardhat node  (y el deploy de deploy-medical.js)
+Uso: python3 "backend py/benchmark_blockchain_tx.py" --records 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+# MedicalBlockchain lee blockchain/... relativo a la raíz del proyecto
+os.chdir(os.path.dirname(BACKEND_DIR))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(args):
+    from tx_pipeline import is_nonce_error
+    from web3_medical_integration import MedicalBlockchain
+
+    blockchain = MedicalBlockchain()
+    status = blockchain.get_connection_status()
+    if not status.get("connected"):
+        raise SystemExit(f"❌ Nodo no disponible: {status}")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errores = [], []
+
+    async def registrar(i):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await blockchain.create_medical_record_async(
+                f"BENCH_{i:06d}", "Diagnóstico de prueba", "Tratamiento de prueba"
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not result["success"]:
+                errores.append(result["error"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(registrar(i) for i in range(args.records)))
+    elapsed = time.perf_counter() - start
+    blockchain.pipeline.close()
+
+    return {
+        "benchmark": "blockchain_tx",
+        "records": args.records,
+        "concurrency": args.concurrency,
+        "segundos": round(elapsed, 3),
+        "registros_por_segundo": round(args.records / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "errores": len(errores),
+        "errores_nonce": sum(1 for e in errores if is_nonce_error(e)),
+        "ejemplos_error": errores[:5],
+        "pipeline": blockchain.pipeline.metrics(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de transacciones médicas")
+    parser.add_argument("--records", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE TRANSACCIONES BLOCKCHAIN")
+    print("=" * 50)
+    report = asyncio.run(run(args))
+    print(f"📊 {report['records']} registros en {report['segundos']}s "
+          f"({report['registros_por_segundo']} registros/s) "
+          f"p50={report['p50_ms']}ms p99={report['p99_ms']}ms")
+    print(f"⚠️ Errores: {report['errores']} (nonce: {report['errores_nonce']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
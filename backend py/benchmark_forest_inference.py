@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inferencia compilada de los bosques de riesgo
+Compara la latencia por paciente de RandomForestClassifier.predict_proba con la de FlatForest
+(forest_inference.py) sobre el mismo modelo y verifica que las predicciones sean idénticas.
+Usa el modelo activo del registro o entrena uno de prueba sobre características sintéticas
+
+Uso: python3 "backend py/benchmark_forest_inference.py" --model risk_classification --calls 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_or_train_model(name, X, estimators, max_depth):
+    """Bosque activo del registro o uno entrenado sobre etiquetas heurísticas"""
+    import joblib
+
+    from model_registry import ARTIFACT, model_registry_from_env
+
+    registry = model_registry_from_env()
+    version = registry.current_version(name)
+    if version is not None:
+        return joblib.load(os.path.join(registry._dir(name, version), ARTIFACT)), f"{name} {version}"
+
+    from sklearn.ensemble import RandomForestClassifier
+
+    from benchmark_ml_scoring import synthetic_features
+    from ml_integration import simple_risk_scores
+
+    sample = synthetic_features(20000, seed=7)
+    _, labels = simple_risk_scores(sample)
+    # Ruido en las etiquetas: árboles profundos como los de un modelo real
+    labels = np.where(np.random.default_rng(7).random(len(labels)) < 0.2, (labels + 1) % 3, labels)
+    model = RandomForestClassifier(n_estimators=estimators, max_depth=max_depth, random_state=42)
+    return model.fit(sample, labels), "sintético"
+
+
+def single_row_latencies(predict, X, calls):
+    latencies = []
+    for i in range(calls):
+        row = X[i % len(X)].reshape(1, -1)
+        start = time.perf_counter()
+        predict(row)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies):
+    return {
+        "p50_ms": round(percentile(latencies, 50), 4),
+        "p90_ms": round(percentile(latencies, 90), 4),
+        "p99_ms": round(percentile(latencies, 99), 4),
+        "mean_ms": round(sum(latencies) / len(latencies), 4),
+    }
+
+
+def run(args):
+    from benchmark_ml_scoring import synthetic_features
+    from forest_inference import FlatForest
+
+    X = synthetic_features(args.rows, args.seed)
+    model, origen = load_or_train_model(args.model, X, args.estimators, args.max_depth)
+    # Predicción de un hilo en ambos caminos: se mide el despacho, no el paralelismo
+    model.n_jobs = 1
+
+    start = time.perf_counter()
+    flat = FlatForest.from_sklearn(model)
+    export_seconds = time.perf_counter() - start
+
+    identical = bool(np.array_equal(model.predict_proba(X), flat.predict_proba(X))
+                     and np.array_equal(model.predict(X), flat.predict(X)))
+
+    sklearn_latencies = single_row_latencies(model.predict_proba, X, args.calls)
+    flat_latencies = single_row_latencies(flat.predict_proba, X, args.calls)
+
+    batches = {}
+    for rows in args.batch_sizes:
+        batch = X[:rows]
+        timings = {}
+        for label, predict in (("sklearn", model.predict_proba), ("flat", flat.predict_proba)):
+            start = time.perf_counter()
+            predict(batch)
+            timings[f"{label}_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        batches[str(rows)] = timings
+
+    sklearn_summary, flat_summary = summarize(sklearn_latencies), summarize(flat_latencies)
+    return {
+        "benchmark": "forest_inference",
+        "modelo": origen,
+        "arboles": flat.n_trees,
+        "nodos": flat.n_nodes,
+        "profundidad": flat.max_depth,
+        "export_segundos": round(export_seconds, 3),
+        "predicciones_identicas": identical,
+        "llamadas": args.calls,
+        "sklearn_por_paciente": sklearn_summary,
+        "flat_por_paciente": flat_summary,
+        "aceleracion_p50": round(sklearn_summary["p50_ms"] / flat_summary["p50_ms"], 1),
+        "lotes": batches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia compilada de bosques")
+    parser.add_argument("--model", default="risk_classification", help="nombre en el registro de modelos")
+    parser.add_argument("--calls", type=int, default=2000, help="predicciones de un paciente por camino")
+    parser.add_argument("--rows", type=int, default=20000, help="filas para verificar y medir lotes")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 256, 4096, 20000])
+    parser.add_argument("--estimators", type=int, default=200, help="árboles del modelo de prueba")
+    parser.add_argument("--max-depth", type=int, default=None, help="profundidad del modelo de prueba")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE INFERENCIA COMPILADA")
+    print("=" * 50)
+    report = run(args)
+    print(f"🌲 {report['modelo']}: {report['arboles']} árboles, {report['nodos']} nodos, "
+          f"profundidad {report['profundidad']}")
+    print(f"🐢 sklearn: p50 {report['sklearn_por_paciente']['p50_ms']} ms por paciente")
+    print(f"⚡ flat: p50 {report['flat_por_paciente']['p50_ms']} ms por paciente (x{report['aceleracion_p50']})")
+    print(f"✅ Predicciones idénticas: {report['predicciones_identicas']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
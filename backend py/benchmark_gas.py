@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark de gas contra un nodo Hardhat local
+Envía registros médicos de distintos tamaños por el pipeline y compara el gas previsto
+por FeeStrategy con el gas usado, el costo por registro y el límite fijo anterior
+
+Requiere: cd blockchain && npx hardhat node  (y el deploy de deploy-medical.js)
+Uso: python3 "backend py/benchmark_gas.py" --records 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+# MedicalBlockchain lee blockchain/... relativo a la raíz del proyecto
+os.chdir(os.path.dirname(BACKEND_DIR))
+
+# Límite fijo usado antes de la estimación por función
+GAS_FIJO_ANTERIOR = 2000000
+
+
+async def run(args):
+    from web3_medical_integration import MedicalBlockchain
+
+    blockchain = MedicalBlockchain()
+    if not blockchain.get_connection_status().get("connected"):
+        raise SystemExit("❌ Nodo no disponible")
+
+    # Diagnósticos de varios tamaños para ejercitar los buckets de la caché de estimaciones
+    tamaños = [16, 64, 256, 1024]
+
+    async def registrar(i):
+        texto = "x" * tamaños[i % len(tamaños)]
+        return await blockchain.create_medical_record_async(f"GAS_{i:06d}", texto, "Tratamiento")
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(registrar(i) for i in range(args.records)))
+    elapsed = time.perf_counter() - start
+    metrics = blockchain.pipeline.metrics()
+    blockchain.close()
+
+    fees = metrics["fees"]
+    gas_usado = sum(f["gas_used"] for f in fees["functions"].values())
+    transacciones = sum(f["transactions"] for f in fees["functions"].values())
+    return {
+        "benchmark": "gas",
+        "records": args.records,
+        "ok": sum(1 for r in results if r["success"]),
+        "segundos": round(elapsed, 3),
+        "gas_medio_por_registro": gas_usado // transacciones if transacciones else None,
+        "costo_medio_wei": sum(f["cost_wei"] for f in fees["functions"].values()) // transacciones
+        if transacciones else None,
+        "utilizacion_limite_fijo": round(gas_usado / (transacciones * GAS_FIJO_ANTERIOR), 3)
+        if transacciones else None,
+        "fees": fees,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de estimación de gas y tarifas")
+    parser.add_argument("--records", type=int, default=100)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE GAS")
+    print("=" * 50)
+    report = asyncio.run(run(args))
+    print(f"📊 {report['ok']}/{report['records']} registros, "
+          f"gas medio {report['gas_medio_por_registro']}, costo medio {report['costo_medio_wei']} wei")
+    for key, stats in report["fees"]["functions"].items():
+        print(f"   {key:<28} previsto={stats['avg_predicted_gas']} usado={stats['avg_gas_used']} "
+              f"(utilización {stats['limit_utilization']}, fuera de margen {stats['out_of_margin']})")
+    print(f"📉 Utilización del límite fijo anterior ({GAS_FIJO_ANTERIOR}): {report['utilizacion_limite_fijo']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
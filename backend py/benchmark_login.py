@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga de login: verificaciones bcrypt por segundo y por núcleo
+Compara bcrypt en el hilo del request contra el pool de procesos de password_hashing
+
+Uso: python3 benchmark_login.py --logins 400 --concurrency 100 --rounds 12
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+async def tormenta(verify, logins, concurrency):
+    """`logins` verificaciones con `concurrency` clientes simultáneos"""
+    queue = asyncio.Queue()
+    for _ in range(logins):
+        queue.put_nowait(None)
+    rechazados = 0
+
+    async def cliente():
+        nonlocal rechazados
+        from async_executors import ExecutorSaturatedError
+
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                valid, _ = await verify()
+                assert valid
+            except ExecutorSaturatedError:
+                rechazados += 1
+                await asyncio.sleep(0.05)
+                queue.put_nowait(None)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concurrency)))
+    return time.perf_counter() - start, rechazados
+
+
+def resultado(nombre, workers, logins, elapsed, rechazados):
+    return {
+        "modo": nombre,
+        "workers": workers,
+        "logins": logins,
+        "segundos": round(elapsed, 3),
+        "logins_por_segundo": round(logins / elapsed, 1),
+        "logins_por_segundo_por_nucleo": round(logins / elapsed / workers, 1),
+        "rechazos_503": rechazados,
+    }
+
+
+async def run(args):
+    from password_hashing import PasswordHasher, hash_password, verify_password
+
+    password = "password123"
+    hashed = hash_password(password, args.rounds)
+    results = []
+
+    # Antes: bcrypt en el event loop, un login a la vez
+    async def inline():
+        return verify_password(password, hashed, args.rounds)
+
+    elapsed, rechazados = await tormenta(inline, args.logins, args.concurrency)
+    results.append(resultado("inline", 1, args.logins, elapsed, rechazados))
+
+    workers_list = sorted({1, max(1, (os.cpu_count() or 1) // 2), os.cpu_count() or 1})
+    for workers in workers_list:
+        hasher = PasswordHasher(rounds=args.rounds, workers=workers, max_queue=args.queue)
+        # Calentar los procesos del pool
+        await asyncio.gather(*(hasher.verify(password, hashed) for _ in range(workers)))
+        elapsed, rechazados = await tormenta(
+            lambda: hasher.verify(password, hashed), args.logins, args.concurrency
+        )
+        hasher.shutdown()
+        results.append(resultado("process_pool", workers, args.logins, elapsed, rechazados))
+
+    return {
+        "benchmark": "login_bcrypt",
+        "rounds": args.rounds,
+        "concurrency": args.concurrency,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de logins bcrypt por núcleo")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--queue", type=int, default=64, help="cola del pool de bcrypt")
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE LOGIN (BCRYPT)")
+    print("=" * 50)
+    report = asyncio.run(run(args))
+    for result in report["results"]:
+        print(f"📊 {result['modo']:<13} workers={result['workers']:<3} "
+              f"{result['logins_por_segundo']} logins/s "
+              f"({result['logins_por_segundo_por_nucleo']} por núcleo, 503={result['rechazos_503']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
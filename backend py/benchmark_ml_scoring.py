@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark de puntuación de riesgo: por paciente vs por lotes
+Compara el camino anterior (un predict + predict_proba por paciente sobre un vector (1, -1))
+con score_feature_matrix (una matriz y un predict_proba por modelo) sobre características
+sintéticas; usa los modelos activos del registro si existen o entrena unos de prueba
+
+Uso: python3 "backend py/benchmark_ml_scoring.py" --patients 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def synthetic_features(count, seed=42):
+    """Matriz de las siete características con rangos plausibles"""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.integers(18, 95, count),         # age
+        rng.poisson(0.8, count),             # chronic_conditions
+        rng.poisson(0.5, count),             # emergency_visits
+        rng.poisson(3, count),               # medication_count
+        rng.integers(0, 730, count),         # last_visit_days
+        rng.integers(0, 2, count),           # consent_data_sharing
+        rng.integers(0, 2, count),           # blockchain_verification_score
+    ]).astype(np.float64)
+
+
+def load_or_train_models(X, estimators):
+    """Modelos activos del registro o, si faltan, bosques entrenados sobre etiquetas heurísticas"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    from ml_integration import simple_readmission_risk, simple_risk_scores
+    from model_registry import model_registry_from_env
+
+    loaded = model_registry_from_env().snapshot(('risk_classification', 'readmission_risk'))
+    models = {name: entry.model for name, entry in loaded.items()}
+    sample = X[:20000]
+    if 'risk_classification' not in models:
+        _, labels = simple_risk_scores(sample)
+        models['risk_classification'] = RandomForestClassifier(
+            n_estimators=estimators, max_depth=12, n_jobs=-1, random_state=42
+        ).fit(sample, labels)
+    if 'readmission_risk' not in models:
+        labels = (simple_readmission_risk(sample) >= 30).astype(int)
+        models['readmission_risk'] = RandomForestClassifier(
+            n_estimators=estimators, max_depth=12, n_jobs=-1, random_state=42
+        ).fit(sample, labels)
+    return models
+
+
+def per_patient(models, X):
+    """Camino anterior: vector (1, -1) y llamadas separadas por paciente y modelo"""
+    for row in X:
+        vector = row.reshape(1, -1)
+        models['risk_classification'].predict(vector)
+        models['risk_classification'].predict_proba(vector)
+        models['readmission_risk'].predict_proba(vector)
+
+
+def run(args):
+    from ml_integration import score_feature_matrix
+
+    X = synthetic_features(args.patients, args.seed)
+    models = load_or_train_models(X, args.estimators)
+    for model in models.values():
+        # Predicciones de un solo hilo en ambos caminos: la comparación mide el despacho
+        if hasattr(model, "n_jobs"):
+            model.n_jobs = args.n_jobs
+
+    start = time.perf_counter()
+    scores = score_feature_matrix(models, X)
+    batch_seconds = time.perf_counter() - start
+
+    sample = X[:min(args.sample, len(X))]
+    start = time.perf_counter()
+    per_patient(models, sample)
+    sample_seconds = time.perf_counter() - start
+    per_patient_ms = sample_seconds / len(sample) * 1000
+
+    # Las predicciones del lote coinciden con las de la llamada individual
+    check = min(len(sample), 200)
+    expected = models['risk_classification'].predict(X[:check])
+    coinciden = bool(np.array_equal(expected, scores['risk_index'][:check]))
+
+    return {
+        "benchmark": "ml_scoring",
+        "patients": args.patients,
+        "estimators": args.estimators,
+        "lote_segundos": round(batch_seconds, 3),
+        "lote_pacientes_por_segundo": round(args.patients / batch_seconds, 1),
+        "por_paciente_ms": round(per_patient_ms, 3),
+        "por_paciente_segundos_estimados": round(per_patient_ms * args.patients / 1000, 1),
+        "aceleracion": round(per_patient_ms * args.patients / 1000 / batch_seconds, 1),
+        "muestra_por_paciente": len(sample),
+        "predicciones_coinciden": coinciden,
+        "niveles": {str(level): int(count) for level, count in
+                    zip(*np.unique(scores['risk_index'], return_counts=True))},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de puntuación de riesgo por lotes")
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=500, help="pacientes medidos en el camino individual")
+    parser.add_argument("--estimators", type=int, default=100)
+    parser.add_argument("--n-jobs", type=int, default=1, help="n_jobs de los modelos al predecir")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE PUNTUACIÓN DE RIESGO")
+    print("=" * 50)
+    report = run(args)
+    print(f"📊 Lote: {report['patients']} pacientes en {report['lote_segundos']}s "
+          f"({report['lote_pacientes_por_segundo']} pacientes/s)")
+    print(f"🐢 Por paciente: {report['por_paciente_ms']} ms -> "
+          f"~{report['por_paciente_segundos_estimados']}s para {report['patients']} "
+          f"(x{report['aceleracion']})")
+    print(f"✅ Predicciones coinciden: {report['predicciones_coinciden']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
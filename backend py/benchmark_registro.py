@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark de registro de pacientes: ruta individual vs registro por lote
+Usa una base sqlite local con latencia simulada por consulta en lugar de Snowflake
+
+Uso: python3 benchmark_registro.py --pacientes 2000 --latency-ms 40 --batch-size 1000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# main_simple resuelve rutas relativas a este directorio
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.getcwd())
+
+
+def generar_pacientes(modelo, cantidad, offset):
+    """PacienteRegistro sintéticos con DNIs únicos a partir de `offset`"""
+    return [
+        modelo(
+            nombre=f"Nombre{i}", apellidos=f"Apellido{i}", fecha_nacimiento="1980-01-01",
+            genero="F" if i % 2 else "M", dni=f"{90000000 + i}", telefono="5550000000",
+            consentimiento_datos=True
+        )
+        for i in range(offset, offset + cantidad)
+    ]
+
+
+def medir(nombre, cantidad, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {
+        "ruta": nombre,
+        "pacientes": cantidad,
+        "segundos": round(elapsed, 3),
+        "pacientes_por_segundo": round(cantidad / elapsed, 1) if elapsed else None,
+    }
+
+
+def run(args):
+    from sqlite_warehouse import SQLiteWarehouse
+    from pacientes_lote import registrar_lote
+    import main_simple
+
+    warehouse = SQLiteWarehouse(latency=args.latency_ms / 1000.0)
+    warehouse.seed_pacientes(args.existentes)
+    conn = warehouse.connect()
+
+    # La ruta individual es lenta: se mide con una muestra y se reporta por paciente
+    individuales = generar_pacientes(main_simple.PacienteRegistro, args.muestra_individual, 0)
+
+    def registrar_individual():
+        for paciente in individuales:
+            main_simple._registrar_paciente(conn, paciente)
+
+    lote = generar_pacientes(main_simple.PacienteRegistro, args.pacientes, args.muestra_individual)
+    # Incluir duplicados contra la base y dentro del mismo lote
+    lote += generar_pacientes(main_simple.PacienteRegistro, args.duplicados, 0)
+
+    def registrar_por_lote():
+        resultados = registrar_lote(conn, list(enumerate(lote)), args.batch_size)
+        registrados = sum(1 for r in resultados.values() if r["status"] == "registrado")
+        if registrados != args.pacientes:
+            raise RuntimeError(f"Se esperaban {args.pacientes} registrados, hubo {registrados}")
+
+    results = [
+        medir("individual", len(individuales), registrar_individual),
+        medir("lote", len(lote), registrar_por_lote),
+    ]
+    conn.close()
+
+    speedup = None
+    if results[0]["pacientes_por_segundo"] and results[1]["pacientes_por_segundo"]:
+        speedup = round(results[1]["pacientes_por_segundo"] / results[0]["pacientes_por_segundo"], 1)
+
+    return {
+        "benchmark": "registro_pacientes",
+        "warehouse_latency_ms": args.latency_ms,
+        "batch_size": args.batch_size,
+        "pacientes_existentes": args.existentes,
+        "results": results,
+        "speedup": speedup,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de registro individual vs por lote")
+    parser.add_argument("--pacientes", type=int, default=2000, help="pacientes nuevos en el lote")
+    parser.add_argument("--duplicados", type=int, default=50, help="filas duplicadas añadidas al lote")
+    parser.add_argument("--muestra-individual", type=int, default=100)
+    parser.add_argument("--existentes", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="latencia simulada por consulta")
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("⏱️ BENCHMARK DE REGISTRO DE PACIENTES")
+    print("=" * 50)
+    report = run(args)
+    for result in report["results"]:
+        print(f"📊 {result['ruta']:<12} {result['pacientes']} pacientes en {result['segundos']}s "
+              f"({result['pacientes_por_segundo']} pacientes/s)")
+    print(f"🚀 Aceleración del lote: {report['speedup']}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
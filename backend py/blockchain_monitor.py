@@ -4,61 +4,54 @@ Script para monitorear contratos blockchain desplegados
 Sistema Médico BI con Blockchain
 """
 
-import json
-import os
-from web3 import Web3
 from dotenv import load_dotenv
 import requests
 from datetime import datetime
 
+from contract_registry import CONTRACT_NAMES, get_registry
+from event_indexer import event_indexer_from_env
+from gas_fees import fee_strategy_from_env
+
 # Cargar variables de entorno
 load_dotenv()
 
 class BlockchainMonitor:
-    def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(os.getenv('ETHEREUM_RPC_URL', 'http://127.0.0.1:8545')))
+    def __init__(self, registry=None):
+        self.registry = registry or get_registry()
+        self.w3 = self.registry.w3
         self.contract_addresses = self.load_contract_addresses()
         self.contracts = self.load_contracts()
+        self.fees = fee_strategy_from_env(self.w3)
+        # Eventos indexados de forma incremental en un SQLite local
+        self.indexer = event_indexer_from_env(
+            self.w3, {name: data['contract'] for name, data in self.contracts.items()}
+        )
     
     def load_contract_addresses(self):
         """Cargar direcciones de contratos desplegados"""
-        try:
-            with open('blockchain/contract-addresses.json', 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            print("❌ Archivo contract-addresses.json no encontrado")
-            return {}
+        return self.registry.addresses
     
     def load_contracts(self):
         """Cargar instancias de contratos"""
         contracts = {}
         
-        # Cargar ABIs
-        contract_files = {
-            'MedicalRecords': 'blockchain/artifacts/contracts/MedicalRecords.sol/MedicalRecords.json',
-            'PatientConsent': 'blockchain/artifacts/contracts/PatientConsent.sol/PatientConsent.json',
-            'MedicalAudit': 'blockchain/artifacts/contracts/MedicalAudit.sol/MedicalAudit.json'
-        }
-        
-        for contract_name, contract_file in contract_files.items():
+        for contract_name in CONTRACT_NAMES:
             try:
-                with open(contract_file, 'r') as f:
-                    contract_data = json.load(f)
-                    abi = contract_data['abi']
-                    address = self.contract_addresses.get(contract_name)
+                address = self.contract_addresses.get(contract_name)
+                abi = self.registry.abi(contract_name)
+                
+                if not abi:
+                    print(f"❌ ABI no encontrado para {contract_name}")
+                elif address:
+                    contracts[contract_name] = {
+                        'address': address,
+                        'contract': self.registry.contract(contract_name),
+                        'abi': abi
+                    }
+                    print(f"✅ {contract_name} cargado: {address}")
+                else:
+                    print(f"❌ Dirección no encontrada para {contract_name}")
                     
-                    if address:
-                        contracts[contract_name] = {
-                            'address': address,
-                            'contract': self.w3.eth.contract(address=address, abi=abi),
-                            'abi': abi
-                        }
-                        print(f"✅ {contract_name} cargado: {address}")
-                    else:
-                        print(f"❌ Dirección no encontrada para {contract_name}")
-                        
-            except FileNotFoundError:
-                print(f"❌ ABI no encontrado para {contract_name}")
             except Exception as e:
                 print(f"❌ Error cargando {contract_name}: {str(e)}")
         
@@ -139,29 +132,22 @@ class BlockchainMonitor:
             except Exception as e:
                 print(f"   ❌ Error verificando {contract_name}: {str(e)}")
     
-    def get_contract_events(self, contract_name, from_block=0):
-        """Obtener eventos de un contrato"""
+    def sync_events(self):
+        """Traer solo los bloques nuevos desde el último sincronizado"""
+        try:
+            return self.indexer.sync()
+        except Exception as e:
+            print(f"⚠️ Error sincronizando eventos (se muestran los ya indexados): {str(e)}")
+            return {}
+    
+    def get_contract_events(self, contract_name, from_block=0, event=None, limit=None):
+        """Obtener eventos de un contrato desde el índice local"""
         if contract_name not in self.contracts:
             print(f"❌ Contrato {contract_name} no encontrado")
             return []
         
         try:
-            contract = self.contracts[contract_name]['contract']
-            events = []
-            
-            # Obtener todos los eventos
-            all_events = contract.events.get_all_entries(from_block)
-            
-            for event in all_events:
-                events.append({
-                    'block': event['blockNumber'],
-                    'transaction': event['transactionHash'].hex(),
-                    'event': event['event'],
-                    'args': dict(event['args'])
-                })
-            
-            return events
-            
+            return self.indexer.store.events(contract_name, event=event, from_block=from_block, limit=limit)
         except Exception as e:
             print(f"❌ Error obteniendo eventos: {str(e)}")
             return []
@@ -176,18 +162,19 @@ class BlockchainMonitor:
             return
         
         try:
-            contract = self.contracts['MedicalRecords']['contract']
+            self.sync_events()
+            store = self.indexer.store
+            total = store.count('MedicalRecords', 'RecordCreated')
             
-            # Obtener eventos de creación de registros
-            events = self.get_contract_events('MedicalRecords')
-            
-            if not events:
+            if not total:
                 print("📝 No hay registros médicos en blockchain")
                 return
             
-            print(f"📊 Total de registros: {len(events)}")
+            print(f"📊 Total de registros: {total}")
             
-            for i, event in enumerate(events[-5:], 1):  # Mostrar los últimos 5
+            # Mostrar los últimos 5 (sin volver a recorrer la cadena)
+            events = store.events('MedicalRecords', event='RecordCreated', limit=5, newest_first=True)
+            for i, event in enumerate(reversed(events), 1):
                 print(f"\n📋 Registro {i}:")
                 print(f"   🕒 Bloque: {event['block']}")
                 print(f"   🔗 TX Hash: {event['transaction'][:20]}...")
@@ -207,15 +194,19 @@ class BlockchainMonitor:
             return
         
         try:
-            events = self.get_contract_events('MedicalAudit')
+            self.sync_events()
+            store = self.indexer.store
+            total = store.count('MedicalAudit', 'AuditLogCreated')
             
-            if not events:
+            if not total:
                 print("📝 No hay logs de auditoría")
                 return
             
-            print(f"📊 Total de logs: {len(events)}")
+            print(f"📊 Total de logs: {total}")
             
-            for i, event in enumerate(events[-5:], 1):  # Mostrar los últimos 5
+            # Mostrar los últimos 5 (sin volver a recorrer la cadena)
+            events = store.events('MedicalAudit', event='AuditLogCreated', limit=5, newest_first=True)
+            for i, event in enumerate(reversed(events), 1):
                 print(f"\n🔍 Log {i}:")
                 print(f"   🕒 Bloque: {event['block']}")
                 print(f"   👤 Usuario: {event['args'].get('user', 'N/A')}")
@@ -247,21 +238,26 @@ class BlockchainMonitor:
                 # Crear un registro médico de prueba
                 print("\n🏥 Probando creación de registro médico...")
                 
-                # Construir transacción
-                transaction = contract.functions.createMedicalRecord(
+                # Construir transacción con gas estimado y tarifas EIP-1559
+                contract_function = contract.functions.createMedicalRecord(
                     "TEST_PATIENT_001",
                     "Prueba de diagnóstico",
                     "Tratamiento de prueba"
-                ).build_transaction({
+                )
+                params, _ = self.fees.transaction_params(contract_function, test_account)
+                transaction = contract_function.build_transaction({
                     'from': test_account,
-                    'gas': 2000000,
-                    'gasPrice': self.w3.eth.gas_price,
-                    'nonce': self.w3.eth.get_transaction_count(test_account)
+                    'nonce': self.w3.eth.get_transaction_count(test_account),
+                    **params
                 })
                 
                 print("✅ Transacción construida correctamente")
                 print(f"   Gas estimado: {transaction['gas']}")
-                print(f"   Gas price: {transaction['gasPrice']}")
+                if 'maxFeePerGas' in transaction:
+                    print(f"   Max fee: {transaction['maxFeePerGas']} wei "
+                          f"(prioridad {transaction['maxPriorityFeePerGas']} wei)")
+                else:
+                    print(f"   Gas price: {transaction['gasPrice']}")
                 
             except Exception as e:
                 print(f"❌ Error en prueba: {str(e)}")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Outbox transaccional para la verificación blockchain de pacientes
+El registro inserta un trabajo PENDIENTE en el mismo commit que el paciente; un hilo de fondo
+reclama los trabajos por lotes, ancla una raíz Merkle por lote en MedicalRecords y, al confirmar,
+marca VERIFICACION_BLOCKCHAIN = TRUE en bloque. Los fallos se reintentan con backoff; una raíz
+que ya está en la cadena nunca se vuelve a anclar (solo se reintenta la escritura en el warehouse)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from merkle_anchor import build_merkle_tree, from_hex, to_hex
+
+ESTADO_PENDIENTE = "PENDIENTE"
+ESTADO_ENVIANDO = "ENVIANDO"
+ESTADO_CONFIRMADO = "CONFIRMADO"
+ESTADO_ERROR = "ERROR"
+
+INSERT_JOB_SQL = """
+    INSERT INTO OUTBOX_BLOCKCHAIN (
+        ID_JOB, ID_PACIENTE, HASH_DATOS, ESTADO, INTENTOS, PROXIMO_INTENTO, FECHA_CREACION
+    ) VALUES (%s, %s, %s, 'PENDIENTE', 0, 0, CURRENT_TIMESTAMP())
+"""
+
+# Reclamar trabajos: PENDIENTE vencidos o ENVIANDO con la concesión expirada (proceso caído)
+CLAIM_SQL = """
+    UPDATE OUTBOX_BLOCKCHAIN
+    SET ESTADO = 'ENVIANDO', RECLAMADO_POR = %s, RECLAMADO_EN = %s
+    WHERE ID_JOB IN (
+        SELECT ID_JOB FROM OUTBOX_BLOCKCHAIN
+        WHERE (ESTADO = 'PENDIENTE' AND PROXIMO_INTENTO <= %s)
+           OR (ESTADO = 'ENVIANDO' AND RECLAMADO_EN < %s)
+        ORDER BY FECHA_CREACION
+        LIMIT {limit}
+    )
+"""
+
+# Renovar la concesión de los trabajos reclamados mientras se esperan recibos
+RENEW_LEASE_SQL = """
+    UPDATE OUTBOX_BLOCKCHAIN SET RECLAMADO_EN = %s
+    WHERE RECLAMADO_POR = %s AND ESTADO = 'ENVIANDO'
+"""
+
+SELECT_CLAIMED_SQL = """
+    SELECT ID_JOB, ID_PACIENTE, HASH_DATOS, INTENTOS, RAIZ_MERKLE, PRUEBA_MERKLE, TX_HASH, BLOQUE
+    FROM OUTBOX_BLOCKCHAIN
+    WHERE RECLAMADO_POR = %s AND ESTADO = 'ENVIANDO'
+    ORDER BY FECHA_CREACION
+"""
+
+CONFIRM_JOB_SQL = """
+    UPDATE OUTBOX_BLOCKCHAIN
+    SET ESTADO = 'CONFIRMADO', RAIZ_MERKLE = %s, PRUEBA_MERKLE = %s, TX_HASH = %s, BLOQUE = %s,
+        RECLAMADO_POR = NULL, FECHA_CONFIRMACION = CURRENT_TIMESTAMP()
+    WHERE ID_JOB = %s
+"""
+
+RETRY_JOB_SQL = """
+    UPDATE OUTBOX_BLOCKCHAIN
+    SET ESTADO = %s, INTENTOS = %s, PROXIMO_INTENTO = %s, ULTIMO_ERROR = %s, RECLAMADO_POR = NULL
+    WHERE ID_JOB = %s
+"""
+
+# Lote ya anclado cuyo UPDATE falló: se guarda la raíz para confirmarlo sin volver a anclar
+RETRY_ANCHORED_JOB_SQL = """
+    UPDATE OUTBOX_BLOCKCHAIN
+    SET ESTADO = %s, INTENTOS = %s, PROXIMO_INTENTO = %s, ULTIMO_ERROR = %s, RECLAMADO_POR = NULL,
+        RAIZ_MERKLE = %s, PRUEBA_MERKLE = %s, TX_HASH = %s, BLOQUE = %s
+    WHERE ID_JOB = %s
+"""
+
+ESTADO_PACIENTE_SQL = """
+    SELECT ID_JOB, ESTADO, INTENTOS, ULTIMO_ERROR, HASH_DATOS, RAIZ_MERKLE, PRUEBA_MERKLE,
+           TX_HASH, BLOQUE, FECHA_CREACION, FECHA_CONFIRMACION
+    FROM OUTBOX_BLOCKCHAIN WHERE ID_PACIENTE = %s
+    ORDER BY FECHA_CREACION DESC
+    LIMIT 1
+"""
+
+COUNT_BY_STATE_SQL = "SELECT ESTADO, COUNT(*) FROM OUTBOX_BLOCKCHAIN GROUP BY ESTADO"
+
+# Máximo de valores en un IN (...) al marcar pacientes verificados
+UPDATE_CHUNK_SIZE = 1000
+
+# Holgura de la concesión sobre la espera de un recibo (envíos, confirmación en el warehouse)
+LEASE_MARGIN = 60.0
+
+
+def hash_datos_paciente(paciente_id, params):
+    """Hash sha256 (hex) de los datos registrados: la hoja del árbol Merkle"""
+    canonical = json.dumps([paciente_id, list(params)], default=str, ensure_ascii=False, separators=(",", ":"))
+    return "0x" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def encolar_verificaciones(cur, pacientes):
+    """
+    Insertar trabajos de verificación con el cursor de la transacción del registro.
+    `pacientes`: [(paciente_id, params del INSERT)]. No hace commit.
+    """
+    rows = [
+        (str(uuid.uuid4()), paciente_id, hash_datos_paciente(paciente_id, params))
+        for paciente_id, params in pacientes
+    ]
+    if rows:
+        cur.executemany(INSERT_JOB_SQL, rows)
+    return rows
+
+
+def estado_verificacion(conn, paciente_id):
+    """Último trabajo de verificación del paciente (None si no tiene)"""
+    cur = conn.cursor()
+    try:
+        cur.execute(ESTADO_PACIENTE_SQL, (paciente_id,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        data = dict(zip([desc[0] for desc in cur.description], row))
+    finally:
+        cur.close()
+    if data.get("PRUEBA_MERKLE"):
+        data["PRUEBA_MERKLE"] = json.loads(data["PRUEBA_MERKLE"])
+    return data
+
+
+class OutboxWorker:
+    """Hilo que ancla los trabajos pendientes por lotes y marca a los pacientes verificados"""
+
+    def __init__(self, pool, blockchain, batch_size=256, max_in_flight=4, interval=5.0,
+                 max_attempts=10, backoff=5.0, max_backoff=600.0, lease=300.0, on_confirmed=None):
+        self.pool = pool
+        self.blockchain = blockchain
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        # Callback con los IDs verificados (p. ej. invalidar la caché de pacientes)
+        self.on_confirmed = on_confirmed
+        self.worker_id = f"outbox-{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stats = {
+            "jobs_confirmed": 0, "jobs_retried": 0, "jobs_failed": 0,
+            "batches_confirmed": 0, "batches_failed": 0, "runs": 0,
+        }
+        self._last_error = None
+        self._last_run = None
+
+    # --- ciclo -------------------------------------------------------------
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="blockchain-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def notify(self):
+        """Despertar al worker (p. ej. tras un registro) sin esperar al intervalo"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                procesados = self.run_once()
+            except Exception as e:
+                self._last_error = str(e)
+                print(f"⚠️ Error en el outbox blockchain: {str(e)}")
+                procesados = 0
+            # Si el lote salió lleno probablemente quedan más trabajos
+            if procesados < self.batch_size * self.max_in_flight:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def run_once(self):
+        """Reclamar, anclar y confirmar una tanda de trabajos; devuelve cuántos se procesaron"""
+        self._stats["runs"] += 1
+        self._last_run = time.time()
+        jobs = self._claim(self.batch_size * self.max_in_flight)
+        if not jobs:
+            return 0
+
+        # Trabajos con la raíz guardada: su lote ya está en la cadena y solo falta confirmarlo
+        anclados = {}
+        nuevos = []
+        for job in jobs:
+            if job[4]:
+                anclados.setdefault(job[4], []).append(job)
+            else:
+                nuevos.append(job)
+        for root_hex, batch in anclados.items():
+            proofs = [[from_hex(node) for node in json.loads(job[5])] for job in batch]
+            tx_hash = from_hex(batch[0][6]) if batch[0][6] else None
+            self._settle(batch, from_hex(root_hex), proofs, tx_hash, batch[0][7])
+
+        # Todos los lotes se envían antes de esperar recibos: varias transacciones en vuelo
+        enviados = []
+        for start in range(0, len(nuevos), self.batch_size):
+            batch = nuevos[start:start + self.batch_size]
+            leaves = [bytes.fromhex(job[2][2:]) for job in batch]
+            root, proofs = build_merkle_tree(leaves)
+            try:
+                # Un recibo que no llegó a tiempo o un proceso caído antes de confirmar pueden
+                # haber dejado la raíz anclada: reenviarla revertiría con "Root already anchored"
+                if self.blockchain.root_anchored_at(root):
+                    self._settle(batch, root, proofs, None, None)
+                    continue
+                pending = self.blockchain.send_anchor_root(root, len(batch))
+            except Exception as e:
+                self._retry(batch, e)
+                continue
+            enviados.append((batch, root, proofs, pending))
+
+        for batch, root, proofs, pending in enviados:
+            # Cada espera puede durar receipt_timeout: sin renovar, otro worker reclamaría
+            # los lotes que siguen en vuelo y los anclaría otra vez
+            self._renew_lease()
+            try:
+                receipt = pending.receipt.result(self.blockchain.pipeline.receipt_timeout)
+                if receipt.status == 0:
+                    raise RuntimeError(f"anchorRecords revertida en el bloque {receipt.blockNumber}")
+            except Exception as e:
+                self._retry(batch, e)
+                continue
+            self._settle(batch, root, proofs, pending.tx_hash, receipt.blockNumber)
+        return len(jobs)
+
+    def _settle(self, batch, root, proofs, tx_hash, block_number):
+        """Confirmar un lote anclado; si el warehouse falla se guarda la raíz para no reanclarlo"""
+        try:
+            self._confirm(batch, root, proofs, tx_hash, block_number)
+        except Exception as e:
+            try:
+                self._retry(batch, e, anchored=(root, proofs, tx_hash, block_number))
+            except Exception as retry_error:
+                # Los trabajos quedan ENVIANDO; al vencer la concesión se reclaman y
+                # root_anchored_at evita volver a anclar la misma raíz
+                print(f"⚠️ No se pudo registrar el reintento del lote anclado: {str(retry_error)}")
+            return
+        if self.on_confirmed is not None:
+            try:
+                self.on_confirmed([job[1] for job in batch])
+            except Exception as e:
+                print(f"⚠️ Error notificando pacientes verificados: {str(e)}")
+
+    # --- warehouse ---------------------------------------------------------
+
+    def effective_lease(self):
+        """Concesión usada al reclamar: nunca menor que la espera de un recibo más la holgura"""
+        return max(self.lease, self.blockchain.pipeline.receipt_timeout + LEASE_MARGIN)
+
+    def _claim(self, limit):
+        now = time.time()
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(CLAIM_SQL.format(limit=int(limit)),
+                            (self.worker_id, now, now, now - self.effective_lease()))
+                conn.commit()
+                cur.execute(SELECT_CLAIMED_SQL, (self.worker_id,))
+                return cur.fetchall()
+            finally:
+                cur.close()
+
+    def _renew_lease(self):
+        try:
+            with self.pool.connection() as conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute(RENEW_LEASE_SQL, (time.time(), self.worker_id))
+                    conn.commit()
+                finally:
+                    cur.close()
+        except Exception as e:
+            # Sin renovar, la concesión aún cubre una espera completa de recibo
+            print(f"⚠️ No se pudo renovar la concesión del outbox: {str(e)}")
+
+    def _confirm(self, batch, root, proofs, tx_hash, block_number):
+        root_hex = to_hex(root)
+        tx_hex = to_hex(tx_hash) if tx_hash is not None else None
+        paciente_ids = [job[1] for job in batch]
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.executemany(CONFIRM_JOB_SQL, [
+                    (root_hex, json.dumps([to_hex(node) for node in proof]), tx_hex, block_number, job[0])
+                    for job, proof in zip(batch, proofs)
+                ])
+                # Verificación en bloque: un UPDATE por cada UPDATE_CHUNK_SIZE pacientes
+                for start in range(0, len(paciente_ids), UPDATE_CHUNK_SIZE):
+                    chunk = paciente_ids[start:start + UPDATE_CHUNK_SIZE]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cur.execute(
+                        f"UPDATE PACIENTES SET VERIFICACION_BLOCKCHAIN = TRUE WHERE ID_PACIENTE IN ({placeholders})",
+                        chunk
+                    )
+                conn.commit()
+            finally:
+                cur.close()
+        self._stats["jobs_confirmed"] += len(batch)
+        self._stats["batches_confirmed"] += 1
+
+    def _retry(self, batch, error, anchored=None):
+        self._stats["batches_failed"] += 1
+        self._last_error = str(error)
+        print(f"⚠️ Lote de {len(batch)} verificaciones falló: {str(error)}")
+        now = time.time()
+        params = []
+        for index, job in enumerate(batch):
+            job_id, intentos = job[0], (job[3] or 0) + 1
+            if intentos >= self.max_attempts:
+                estado = ESTADO_ERROR
+                self._stats["jobs_failed"] += 1
+            else:
+                estado = ESTADO_PENDIENTE
+                self._stats["jobs_retried"] += 1
+            delay = min(self.max_backoff, self.backoff * (2 ** (intentos - 1)))
+            row = (estado, intentos, now + delay, str(error)[:1000])
+            if anchored is not None:
+                root, proofs, tx_hash, block_number = anchored
+                row += (to_hex(root), json.dumps([to_hex(node) for node in proofs[index]]),
+                        to_hex(tx_hash) if tx_hash is not None else None, block_number)
+            params.append(row + (job_id,))
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.executemany(RETRY_ANCHORED_JOB_SQL if anchored is not None else RETRY_JOB_SQL, params)
+                conn.commit()
+            finally:
+                cur.close()
+
+    def metrics(self):
+        estados = {}
+        try:
+            with self.pool.connection() as conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute(COUNT_BY_STATE_SQL)
+                    estados = {estado: count for estado, count in cur.fetchall()}
+                finally:
+                    cur.close()
+        except Exception as e:
+            estados = {"error": str(e)}
+        return {
+            **self._stats,
+            "worker_id": self.worker_id,
+            "batch_size": self.batch_size,
+            "lease": self.effective_lease(),
+            "estados": estados,
+            "last_run": self._last_run,
+            "last_error": self._last_error,
+        }
+
+
+def outbox_worker_from_env(pool, blockchain, on_confirmed=None):
+    """OutboxWorker configurado con BLOCKCHAIN_OUTBOX_*"""
+    return OutboxWorker(
+        pool, blockchain, on_confirmed=on_confirmed,
+        batch_size=int(os.getenv("BLOCKCHAIN_OUTBOX_BATCH", "256")),
+        max_in_flight=int(os.getenv("BLOCKCHAIN_OUTBOX_IN_FLIGHT", "4")),
+        interval=float(os.getenv("BLOCKCHAIN_OUTBOX_INTERVAL", "5")),
+        max_attempts=int(os.getenv("BLOCKCHAIN_OUTBOX_MAX_ATTEMPTS", "10")),
+        backoff=float(os.getenv("BLOCKCHAIN_OUTBOX_BACKOFF", "5")),
+        lease=float(os.getenv("BLOCKCHAIN_OUTBOX_LEASE", "300")),
+    )
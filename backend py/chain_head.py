@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Cabeza de la cadena en memoria para los endpoints de estado blockchain
+Un proveedor web3 asíncrono (sesión HTTP persistente) sigue el último bloque en una tarea
+de fondo; chain_id se consulta una sola vez y /api/blockchain/status no hace RPC
+"""
+
+import asyncio
+import time
+from datetime import datetime
+
+
+class ChainHead:
+    """Último bloque, chain_id y conectividad del nodo, actualizados en segundo plano"""
+
+    def __init__(self, rpc_url, poll_interval=2.0, timeout=5.0, max_staleness=None):
+        self.rpc_url = rpc_url
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_staleness = max_staleness if max_staleness is not None else max(poll_interval * 5, 15.0)
+        self.w3 = None
+        self._chain_id = None
+        self._block_number = None
+        self._connected = False
+        self._updated_at = None
+        self._updated_at_iso = None
+        self._last_error = None
+        self._task = None
+        self._polls = 0
+
+    def _provider(self):
+        from web3 import AsyncWeb3
+
+        # AsyncHTTPProvider reutiliza su sesión aiohttp entre peticiones (keep-alive)
+        return AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(self.rpc_url, request_kwargs={"timeout": self.timeout}))
+
+    async def refresh(self):
+        """Una consulta al nodo: chain_id (solo la primera vez) y número de bloque en paralelo"""
+        if self.w3 is None:
+            self.w3 = self._provider()
+        self._polls += 1
+        try:
+            if self._chain_id is None:
+                self._chain_id, block_number = await asyncio.gather(
+                    self.w3.eth.chain_id, self.w3.eth.block_number
+                )
+            else:
+                block_number = await self.w3.eth.block_number
+        except Exception as e:
+            self._connected = False
+            self._last_error = str(e)
+            return False
+        self._block_number = block_number
+        self._connected = True
+        self._last_error = None
+        self._updated_at = time.monotonic()
+        self._updated_at_iso = datetime.now().isoformat()
+        return True
+
+    async def _follow(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """Iniciar la tarea de seguimiento (llamar dentro del event loop, p. ej. en startup)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._follow())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        disconnect = getattr(getattr(self.w3, "provider", None), "disconnect", None)
+        if disconnect is not None:
+            try:
+                await disconnect()
+            except Exception:
+                pass
+
+    def snapshot(self):
+        """Estado en memoria; connected=False si la última lectura es más vieja que max_staleness"""
+        age = time.monotonic() - self._updated_at if self._updated_at is not None else None
+        stale = age is None or age > self.max_staleness
+        return {
+            "connected": self._connected and not stale,
+            "chain_id": self._chain_id,
+            "latest_block": self._block_number,
+            "updated_at": self._updated_at_iso,
+            "age_seconds": round(age, 2) if age is not None else None,
+            "stale": stale,
+            "error": self._last_error,
+        }
+
+    def metrics(self):
+        return {**self.snapshot(), "polls": self._polls, "poll_interval": self.poll_interval}
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Registro compartido de contratos médicos
+Direcciones y ABIs se leen una vez (rutas absolutas desde la raíz del proyecto), los objetos
+de contrato y selectores se cachean, y todos los módulos usan un único proveedor HTTP con
+sesión keep-alive. Nada se conecta al nodo hasta el primer uso
+"""
+
+import json
+import os
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOCKCHAIN_DIR = os.path.join(PROJECT_ROOT, "blockchain")
+
+CONTRACT_NAMES = ("MedicalRecords", "PatientConsent", "MedicalAudit")
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+def artifact_path(contract_name):
+    return os.path.join(BLOCKCHAIN_DIR, "artifacts", "contracts", f"{contract_name}.sol", f"{contract_name}.json")
+
+
+class ContractRegistry:
+    """Web3, direcciones, ABIs y contratos cargados de forma perezosa y compartidos"""
+
+    def __init__(self, rpc_url, addresses_file="contract-addresses.json", pool_size=20):
+        self.rpc_url = rpc_url
+        self.addresses_file = (
+            addresses_file if os.path.isabs(addresses_file)
+            else os.path.join(BLOCKCHAIN_DIR, addresses_file)
+        )
+        self.pool_size = pool_size
+        self._lock = threading.RLock()
+        self._session = None
+        self._w3 = None
+        self._addresses = None
+        self._abis = {}
+        self._contracts = {}
+        self._selectors = {}
+        self._accounts = None
+
+    # --- conexión ----------------------------------------------------------
+
+    @property
+    def session(self):
+        """requests.Session keep-alive compartida (proveedor web3 y lecturas en lote)"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    @property
+    def w3(self):
+        with self._lock:
+            if self._w3 is None:
+                from web3 import Web3
+
+                self._w3 = Web3(Web3.HTTPProvider(self.rpc_url, session=self.session))
+            return self._w3
+
+    def default_account(self):
+        """Primera cuenta administrada por el nodo (una sola consulta por proceso)"""
+        with self._lock:
+            if self._accounts is None:
+                self._accounts = list(self.w3.eth.accounts)
+            return self._accounts[0] if self._accounts else None
+
+    # --- archivos ----------------------------------------------------------
+
+    @property
+    def addresses(self):
+        """Direcciones desplegadas ({} si el archivo no existe)"""
+        with self._lock:
+            if self._addresses is None:
+                try:
+                    with open(self.addresses_file, "r") as f:
+                        self._addresses = json.load(f)
+                except FileNotFoundError:
+                    print(f"⚠️ Archivo {os.path.basename(self.addresses_file)} no encontrado")
+                    print("🔧 Ejecuta: cd blockchain && npx hardhat run scripts/deploy-medical.js --network localhost")
+                    self._addresses = {}
+            return self._addresses
+
+    def address(self, contract_name):
+        return self.addresses.get(contract_name) or ZERO_ADDRESS
+
+    def abi(self, contract_name):
+        """ABI compilado por Hardhat ([] si falta el artifact)"""
+        with self._lock:
+            if contract_name not in self._abis:
+                try:
+                    with open(artifact_path(contract_name), "r") as f:
+                        self._abis[contract_name] = json.load(f)["abi"]
+                except FileNotFoundError:
+                    print(f"⚠️ ABI de {contract_name} no encontrado")
+                    print("🔧 Ejecuta: cd blockchain && npx hardhat compile")
+                    self._abis[contract_name] = []
+            return self._abis[contract_name]
+
+    # --- contratos ---------------------------------------------------------
+
+    def contract(self, contract_name):
+        """Instancia web3 del contrato (se construye una vez)"""
+        with self._lock:
+            contract = self._contracts.get(contract_name)
+            if contract is None:
+                contract = self.w3.eth.contract(
+                    address=self.address(contract_name), abi=self.abi(contract_name)
+                )
+                self._contracts[contract_name] = contract
+            return contract
+
+    def selectors(self, contract_name):
+        """{nombre_función: selector de 4 bytes en hex} precalculado desde el ABI"""
+        with self._lock:
+            selectors = self._selectors.get(contract_name)
+            if selectors is None:
+                from web3 import Web3
+
+                selectors = {}
+                for item in self.abi(contract_name):
+                    if item.get("type") == "function":
+                        signature = f"{item['name']}({','.join(i['type'] for i in item['inputs'])})"
+                        selectors[item["name"]] = "0x" + bytes(Web3.keccak(text=signature)[:4]).hex()
+                self._selectors[contract_name] = selectors
+            return selectors
+
+    def deployed(self):
+        """Nombres de los contratos con dirección configurada"""
+        return [name for name in CONTRACT_NAMES if self.addresses.get(name)]
+
+    def reload(self):
+        """Volver a leer direcciones y ABIs (p. ej. tras un nuevo deploy)"""
+        with self._lock:
+            self._addresses = None
+            self._abis.clear()
+            self._contracts.clear()
+            self._selectors.clear()
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(rpc_url=None, addresses_file=None):
+    """Registro compartido por proceso para un nodo y archivo de direcciones dados"""
+    rpc_url = rpc_url or os.getenv("ETHEREUM_RPC_URL", "http://127.0.0.1:8545")
+    addresses_file = addresses_file or os.getenv("CONTRACT_ADDRESSES_FILE", "contract-addresses.json")
+    key = (rpc_url, addresses_file)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = ContractRegistry(
+                rpc_url, addresses_file,
+                pool_size=int(os.getenv("BLOCKCHAIN_HTTP_POOL_SIZE", "20"))
+            )
+            _registries[key] = registry
+        return registry
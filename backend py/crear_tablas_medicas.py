@@ -161,6 +161,43 @@ tablas_medicas = {
             'FECHA_PRESCRIPCION TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
             'ACTIVO BOOLEAN DEFAULT TRUE'
         ]
+    },
+    'REGISTROS_ANCLADOS': {
+        'columns': [
+            'HASH_REGISTRO VARCHAR PRIMARY KEY',
+            'ID_PACIENTE VARCHAR',
+            'DIAGNOSTICO VARCHAR',
+            'TRATAMIENTO VARCHAR',
+            'TIMESTAMP_REGISTRO NUMBER',
+            'DOCTOR VARCHAR',
+            'RAIZ_MERKLE VARCHAR',
+            'PRUEBA_MERKLE VARCHAR',
+            'INDICE_LOTE INTEGER',
+            'TX_HASH VARCHAR',
+            'BLOQUE NUMBER',
+            'ESTADO VARCHAR DEFAULT \'PENDIENTE\'',
+            'FECHA_CREACION TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
+            'FECHA_ANCLAJE TIMESTAMP'
+        ]
+    },
+    'OUTBOX_BLOCKCHAIN': {
+        'columns': [
+            'ID_JOB VARCHAR PRIMARY KEY',
+            'ID_PACIENTE VARCHAR',
+            'HASH_DATOS VARCHAR',
+            'ESTADO VARCHAR DEFAULT \'PENDIENTE\'',
+            'INTENTOS INTEGER DEFAULT 0',
+            'ULTIMO_ERROR VARCHAR',
+            'PROXIMO_INTENTO FLOAT DEFAULT 0',
+            'RECLAMADO_POR VARCHAR',
+            'RECLAMADO_EN FLOAT',
+            'RAIZ_MERKLE VARCHAR',
+            'PRUEBA_MERKLE VARCHAR',
+            'TX_HASH VARCHAR',
+            'BLOQUE NUMBER',
+            'FECHA_CREACION TIMESTAMP DEFAULT CURRENT_TIMESTAMP',
+            'FECHA_CONFIRMACION TIMESTAMP'
+        ]
     }
 }
 
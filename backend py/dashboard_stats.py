@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Estadísticas del dashboard precalculadas
+Un hilo recalcula todos los conteos con una sola consulta y las rutas leen el resumen en memoria
+"""
+
+import threading
+import time
+from datetime import datetime
+
+# Todos los conteos del dashboard en un solo round-trip
+DASHBOARD_STATS_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM PACIENTES WHERE ACTIVO = TRUE),
+        (SELECT COUNT(*) FROM PACIENTES WHERE VERIFICACION_BLOCKCHAIN = TRUE),
+        (SELECT COUNT(*) FROM CONSULTAS),
+        (SELECT COUNT(*) FROM CONSULTAS WHERE DATE(FECHA_CONSULTA) = CURRENT_DATE()),
+        (SELECT COUNT(*) FROM CONSULTAS WHERE ESTADO_CONSULTA = 'PROGRAMADA'),
+        (SELECT COUNT(*) FROM USUARIOS WHERE ACTIVO = TRUE)
+"""
+
+
+class StatsUnavailableError(Exception):
+    """Todavía no hay un resumen calculado (el hilo de refresco no terminó su primera pasada)"""
+
+    def __init__(self, last_error=None, retry_after=5):
+        detalle = f": {last_error}" if last_error else ""
+        super().__init__(f"Estadísticas del dashboard aún no disponibles{detalle}")
+        self.last_error = last_error
+        self.retry_after = retry_after
+
+
+STAT_KEYS = (
+    "total_pacientes",
+    "registros_blockchain",
+    "total_consultas",
+    "consultas_hoy",
+    "consultas_programadas",
+    "usuarios_activos",
+)
+
+
+class DashboardStats:
+    """Resumen materializado en memoria; se refresca cada `interval` segundos"""
+
+    def __init__(self, pool, interval=60.0, max_staleness=None):
+        self.pool = pool
+        self.interval = interval
+        self.max_staleness = max_staleness if max_staleness is not None else interval * 5
+        self._summary = None
+        self._computed_at = None
+        self._computed_at_iso = None
+        self._last_error = None
+        self._refresh_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _compute(self):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(DASHBOARD_STATS_SQL)
+                row = cur.fetchone()
+            finally:
+                cur.close()
+        return {key: int(value or 0) for key, value in zip(STAT_KEYS, row)}
+
+    def refresh(self):
+        """Recalcular el resumen (un solo refresco a la vez)"""
+        with self._refresh_lock:
+            try:
+                summary = self._compute()
+            except Exception as e:
+                self._last_error = str(e)
+                raise
+            self._summary = summary
+            self._computed_at = time.time()
+            self._computed_at_iso = datetime.now().isoformat()
+            self._last_error = None
+
+    def current(self):
+        """
+        Resumen vigente desde memoria; nunca consulta el warehouse en el request.
+        Si el hilo no pudo refrescar se sirve el último resumen (marcado stale);
+        antes del primer cálculo se lanza StatsUnavailableError (503 en las rutas)
+        """
+        summary = self.snapshot()
+        if summary is None:
+            raise StatsUnavailableError(self._last_error, retry_after=max(1, int(min(self.interval, 5))))
+        return summary
+
+    def age(self):
+        """Segundos desde el último cálculo (None si aún no existe)"""
+        if self._computed_at is None:
+            return None
+        return time.time() - self._computed_at
+
+    def is_stale(self):
+        age = self.age()
+        return age is None or age > self.max_staleness
+
+    def snapshot(self):
+        """Último resumen calculado, sin consultar el warehouse"""
+        if self._summary is None:
+            return None
+        age = self.age()
+        return {
+            **self._summary,
+            "computed_at": self._computed_at_iso,
+            "age_seconds": round(age, 3),
+            "stale": age > self.max_staleness,
+            "last_error": self._last_error,
+        }
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Error recalculando estadísticas del dashboard: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Iniciar el hilo de refresco"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="dashboard-stats", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
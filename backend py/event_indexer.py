@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Indexador incremental de eventos de los contratos médicos
+Guarda el último bloque procesado por contrato y trae los logs en ventanas acotadas
+(tamaño adaptativo) hasta `confirmations` bloques detrás de la cabeza; los eventos quedan
+en un SQLite local que el monitor consulta sin volver a recorrer la cadena
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Eventos indexados por contrato
+INDEXED_EVENTS = {
+    "MedicalRecords": ("RecordCreated", "RecordsAnchored"),
+    "MedicalAudit": ("AuditLogCreated", "RecordAccessed"),
+    "PatientConsent": ("ConsentUpdated",),
+}
+
+# Fragmentos de error del nodo cuando el rango de eth_getLogs es demasiado grande
+RANGE_ERRORS = (
+    "limit", "too many", "range", "exceed", "timeout", "timed out", "response size",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS EVENTOS (
+    CONTRATO TEXT NOT NULL, EVENTO TEXT NOT NULL, BLOQUE INTEGER NOT NULL,
+    HASH_BLOQUE TEXT, TX_HASH TEXT NOT NULL, LOG_INDEX INTEGER NOT NULL,
+    ARGS TEXT, FECHA_INDEXADO TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (TX_HASH, LOG_INDEX)
+);
+CREATE INDEX IF NOT EXISTS IDX_EVENTOS_CONTRATO ON EVENTOS (CONTRATO, EVENTO, BLOQUE);
+CREATE TABLE IF NOT EXISTS CURSORES (
+    CONTRATO TEXT PRIMARY KEY, DIRECCION TEXT, ULTIMO_BLOQUE INTEGER NOT NULL,
+    HASH_BLOQUE TEXT, FECHA_ACTUALIZACION TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+def is_range_error(error):
+    message = str(error).lower()
+    return any(fragment in message for fragment in RANGE_ERRORS)
+
+
+def _hex(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if hasattr(value, "hex"):
+        text = value.hex()
+        return text if text.startswith("0x") else "0x" + text
+    return value
+
+
+def _json_value(value):
+    if isinstance(value, (bytes, bytearray)) or type(value).__name__ == "HexBytes":
+        return _hex(value)
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def event_signature(event_abi):
+    """Firma canónica del evento (p. ej. RecordCreated(bytes32,string,address))"""
+    return f"{event_abi['name']}({','.join(i['type'] for i in event_abi['inputs'])})"
+
+
+class EventStore:
+    """Eventos indexados y cursores por contrato en un archivo SQLite"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def cursor(self, contract_name, address):
+        """(último bloque indexado, hash del bloque) o (None, None) si la dirección cambió"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT DIRECCION, ULTIMO_BLOQUE, HASH_BLOQUE FROM CURSORES WHERE CONTRATO = ?",
+                (contract_name,)
+            ).fetchone()
+        if row is None or (row[0] or "").lower() != (address or "").lower():
+            return None, None
+        return row[1], row[2]
+
+    def save(self, contract_name, address, events, last_block, block_hash):
+        """Insertar eventos y mover el cursor en la misma transacción"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO EVENTOS "
+                "(CONTRATO, EVENTO, BLOQUE, HASH_BLOQUE, TX_HASH, LOG_INDEX, ARGS) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (contract_name, e["event"], e["block"], e["block_hash"], e["transaction"],
+                     e["log_index"], json.dumps(e["args"]))
+                    for e in events
+                ]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO CURSORES (CONTRATO, DIRECCION, ULTIMO_BLOQUE, HASH_BLOQUE, "
+                "FECHA_ACTUALIZACION) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (contract_name, address, last_block, block_hash)
+            )
+
+    def rewind(self, contract_name, address, block, block_hash):
+        """Descartar los eventos posteriores a `block` (reorganización de la cadena)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM EVENTOS WHERE CONTRATO = ? AND BLOQUE > ?", (contract_name, block)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO CURSORES (CONTRATO, DIRECCION, ULTIMO_BLOQUE, HASH_BLOQUE, "
+                "FECHA_ACTUALIZACION) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (contract_name, address, block, block_hash)
+            )
+
+    def reset(self, contract_name):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM EVENTOS WHERE CONTRATO = ?", (contract_name,))
+            self._conn.execute("DELETE FROM CURSORES WHERE CONTRATO = ?", (contract_name,))
+
+    def block_hashes(self, contract_name, before):
+        """(bloque, hash) guardados con los eventos anteriores a `before`, del más reciente al más viejo"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT DISTINCT BLOQUE, HASH_BLOQUE FROM EVENTOS WHERE CONTRATO = ? AND BLOQUE < ? "
+                "AND HASH_BLOQUE IS NOT NULL ORDER BY BLOQUE DESC",
+                (contract_name, before)
+            ).fetchall()
+
+    def indexed_block(self, contract_name):
+        """Último bloque indexado del contrato (None si nunca se sincronizó)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ULTIMO_BLOQUE FROM CURSORES WHERE CONTRATO = ?", (contract_name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def events(self, contract_name, event=None, from_block=0, limit=None, newest_first=False, to_block=None):
+        sql = "SELECT EVENTO, BLOQUE, TX_HASH, LOG_INDEX, ARGS FROM EVENTOS WHERE CONTRATO = ? AND BLOQUE >= ?"
+        params = [contract_name, from_block]
+        if to_block is not None:
+            sql += " AND BLOQUE <= ?"
+            params.append(to_block)
+        if event:
+            sql += " AND EVENTO = ?"
+            params.append(event)
+        sql += " ORDER BY BLOQUE DESC, LOG_INDEX DESC" if newest_first else " ORDER BY BLOQUE, LOG_INDEX"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {"event": row[0], "block": row[1], "transaction": row[2], "log_index": row[3],
+             "args": json.loads(row[4]) if row[4] else {}}
+            for row in rows
+        ]
+
+    def count(self, contract_name, event=None):
+        sql = "SELECT COUNT(*) FROM EVENTOS WHERE CONTRATO = ?"
+        params = [contract_name]
+        if event:
+            sql += " AND EVENTO = ?"
+            params.append(event)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class EventIndexer:
+    """Sincroniza los eventos de varios contratos con un EventStore"""
+
+    def __init__(self, w3, contracts, store, events=None, confirmations=6, window=2000,
+                 min_window=1, max_window=50000, target_logs=2000, start_block=0):
+        # contracts: {nombre: instancia web3 del contrato}
+        self.w3 = w3
+        self.contracts = contracts
+        self.store = store
+        self.events = events or INDEXED_EVENTS
+        self.confirmations = confirmations
+        self.min_window = min_window
+        self.max_window = max_window
+        self.target_logs = target_logs
+        self.start_block = start_block
+        self._windows = {name: window for name in contracts}
+        self._topics = {name: self._event_topics(name, contract) for name, contract in contracts.items()}
+        self._sync_lock = threading.Lock()
+        self._stats = {"requests": 0, "range_errors": 0, "reorgs": 0, "events": 0}
+
+    def _event_topics(self, contract_name, contract):
+        """topic0 -> nombre, solo para los eventos presentes en el ABI compilado"""
+        from web3 import Web3
+
+        wanted = set(self.events.get(contract_name, ()))
+        topics = {}
+        for item in contract.abi:
+            if item.get("type") == "event" and item.get("name") in wanted:
+                topic = "0x" + bytes(Web3.keccak(text=event_signature(item))).hex()
+                topics[topic] = item["name"]
+        return topics
+
+    # --- sincronización ----------------------------------------------------
+
+    def sync(self):
+        """Indexar todos los contratos hasta la cabeza segura; devuelve eventos nuevos por contrato"""
+        with self._sync_lock:
+            safe_block = self.w3.eth.block_number - self.confirmations
+            return {name: self._sync_contract(name, safe_block) for name in self.contracts}
+
+    def _sync_contract(self, name, safe_block):
+        contract = self.contracts[name]
+        if not self._topics[name]:
+            return 0
+        last_block = self._check_reorg(name, contract.address)
+        from_block = self.start_block if last_block is None else last_block + 1
+        nuevos = 0
+        while from_block <= safe_block:
+            window = self._windows[name]
+            to_block = min(from_block + window - 1, safe_block)
+            try:
+                logs = self._get_logs(name, contract.address, from_block, to_block)
+            except Exception as e:
+                if not is_range_error(e) or window <= self.min_window:
+                    raise
+                # El nodo rechazó el rango: reducir la ventana y reintentar
+                self._stats["range_errors"] += 1
+                self._windows[name] = max(self.min_window, window // 2)
+                continue
+            events = [self._decode(name, contract, log) for log in logs]
+            block_hash = _hex(self.w3.eth.get_block(to_block)["hash"])
+            self.store.save(name, contract.address, events, to_block, block_hash)
+            nuevos += len(events)
+            self._stats["events"] += len(events)
+            # Ventana adaptativa: crecer en rangos vacíos, encoger si llegan demasiados logs
+            if len(logs) > self.target_logs:
+                self._windows[name] = max(self.min_window, window // 2)
+            elif len(logs) < self.target_logs // 4:
+                self._windows[name] = min(self.max_window, window * 2)
+            from_block = to_block + 1
+        return nuevos
+
+    def _check_reorg(self, name, address):
+        """Último bloque indexado que sigue en la cadena; lo posterior se descarta"""
+        last_block, last_hash = self.store.cursor(name, address)
+        if last_block is None:
+            if self.store.indexed_block(name) is not None:
+                # Contrato redesplegado: los eventos guardados son de la dirección anterior
+                print(f"⚠️ {name} cambió de dirección: reindexando desde el bloque {self.start_block}")
+                self.store.reset(name)
+            return None
+        if not last_hash or self._block_hash(last_block) == last_hash:
+            return last_block
+        self._stats["reorgs"] += 1
+        # Retroceder por los bloques guardados hasta uno cuyo hash siga en la cadena
+        head = self.w3.eth.block_number
+        for block, block_hash in self.store.block_hashes(name, last_block):
+            if block <= head and self._block_hash(block) == block_hash:
+                print(f"⚠️ Reorganización detectada en {name}: retrocediendo al bloque {block}")
+                self.store.rewind(name, address, block, block_hash)
+                return block
+        print(f"⚠️ Reorganización detectada en {name}: ningún bloque guardado sigue en la cadena, reindexando")
+        self.store.reset(name)
+        return None
+
+    def _block_hash(self, block):
+        """Hash del bloque en la cadena actual o None si ya no existe (nodo local reiniciado)"""
+        from web3.exceptions import BlockNotFound
+
+        try:
+            return _hex(self.w3.eth.get_block(block)["hash"])
+        except BlockNotFound:
+            return None
+
+    def _get_logs(self, name, address, from_block, to_block):
+        self._stats["requests"] += 1
+        return self.w3.eth.get_logs({
+            "address": address,
+            "fromBlock": from_block,
+            "toBlock": to_block,
+            "topics": [list(self._topics[name])],
+        })
+
+    def _decode(self, name, contract, log):
+        event_name = self._topics[name][_hex(log["topics"][0])]
+        decoded = getattr(contract.events, event_name)().process_log(log)
+        return {
+            "event": event_name,
+            "block": log["blockNumber"],
+            "block_hash": _hex(log["blockHash"]),
+            "transaction": _hex(log["transactionHash"]),
+            "log_index": log["logIndex"],
+            "args": {key: _json_value(value) for key, value in dict(decoded["args"]).items()},
+        }
+
+    def metrics(self):
+        return {**self._stats, "windows": dict(self._windows)}
+
+    def follow(self, interval=5.0, stop=None):
+        """Sincronizar en bucle (proceso dedicado o hilo en segundo plano)"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                nuevos = self.sync()
+                if any(nuevos.values()):
+                    print(f"📥 Eventos nuevos: {nuevos}")
+            except Exception as e:
+                print(f"⚠️ Error sincronizando eventos: {str(e)}")
+            stop.wait(interval)
+
+
+def event_indexer_from_env(w3, contracts):
+    """EventIndexer configurado con EVENT_INDEX_*"""
+    store = EventStore(os.getenv("EVENT_INDEX_PATH", "blockchain/events-index.sqlite3"))
+    return EventIndexer(
+        w3, contracts, store,
+        confirmations=int(os.getenv("EVENT_INDEX_CONFIRMATIONS", "6")),
+        window=int(os.getenv("EVENT_INDEX_WINDOW", "2000")),
+        max_window=int(os.getenv("EVENT_INDEX_MAX_WINDOW", "50000")),
+        start_block=int(os.getenv("EVENT_INDEX_START_BLOCK", "0")),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexador incremental de eventos médicos")
+    parser.add_argument("--follow", action="store_true", help="seguir la cadena en bucle")
+    parser.add_argument("--interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    from blockchain_monitor import BlockchainMonitor
+
+    monitor = BlockchainMonitor()
+    if args.follow:
+        print("🔄 Siguiendo eventos de los contratos médicos (Ctrl+C para salir)")
+        monitor.indexer.follow(args.interval)
+    else:
+        started = time.perf_counter()
+        nuevos = monitor.indexer.sync()
+        print(f"✅ Eventos indexados: {nuevos} en {time.perf_counter() - started:.2f}s")
+        print(json.dumps(monitor.indexer.metrics(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
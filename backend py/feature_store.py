@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Almacén de características de riesgo por paciente
+Las siete características de los modelos se materializan en tablas NumPy con mmap: la última
+versión por paciente (lecturas puntuales y por lotes) y un historial con la hora de cada
+versión para armar conjuntos de entrenamiento correctos en el tiempo. La edad y los días desde
+la última visita se guardan como epochs y se calculan respecto de la fecha consultada
+
+Uso:
+    python3 "backend py/feature_store.py" refresh [--full] [--follow]
+    python3 "backend py/feature_store.py" lookup P1A2B3C4D
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from contract_registry import PROJECT_ROOT
+
+# Columnas de la matriz que reciben los modelos
+FEATURE_NAMES = (
+    'age', 'chronic_conditions', 'emergency_visits', 'medication_count',
+    'last_visit_days', 'consent_data_sharing', 'blockchain_verification_score'
+)
+
+# Columnas guardadas: las dependientes del tiempo como epochs (NaN = sin dato)
+RAW_COLUMNS = (
+    'birth_ts', 'chronic_conditions', 'emergency_visits', 'medication_count',
+    'last_visit_ts', 'consent_data_sharing', 'blockchain_verification_score'
+)
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_YEAR = 365.25 * SECONDS_PER_DAY
+# last_visit_days de un paciente sin consultas
+NO_VISIT_DAYS = 3650
+
+# Valores base de las siete características para un bloque de pacientes
+RAW_FEATURES_SQL = """
+WITH visitas AS (
+    SELECT c.ID_PACIENTE,
+           COUNT(CASE WHEN LOWER(c.MOTIVO_CONSULTA) LIKE '%%emergenc%%'
+                        OR LOWER(c.MOTIVO_CONSULTA) LIKE '%%urgenc%%' THEN 1 END) AS EMERGENCY_VISITS,
+           MAX(c.FECHA_CONSULTA) AS LAST_VISIT
+    FROM CONSULTAS c
+    WHERE c.ID_PACIENTE IN ({placeholders})
+    GROUP BY c.ID_PACIENTE
+),
+cronicas AS (
+    SELECT c.ID_PACIENTE,
+           COUNT(DISTINCT dc.ID_ENFERMEDAD) AS CHRONIC_CONDITIONS
+    FROM CONSULTAS c
+    JOIN DIAGNOSTICOS_CONSULTA dc ON c.ID_CONSULTA = dc.ID_CONSULTA
+    WHERE c.ID_PACIENTE IN ({placeholders})
+      AND (LOWER(dc.DIAGNOSTICO) LIKE '%%chronic%%' OR LOWER(dc.DIAGNOSTICO) LIKE '%%crónic%%')
+    GROUP BY c.ID_PACIENTE
+),
+historial AS (
+    SELECT h.ID_PACIENTE, COUNT(*) AS CHRONIC_HISTORY
+    FROM HISTORIAL_MEDICO h
+    WHERE h.ID_PACIENTE IN ({placeholders})
+      AND (LOWER(h.TIPO_REGISTRO) LIKE '%%cr%%nic%%' OR LOWER(h.DESCRIPCION) LIKE '%%chronic%%')
+    GROUP BY h.ID_PACIENTE
+),
+medicamentos AS (
+    SELECT c.ID_PACIENTE,
+           COUNT(DISTINCT tc.ID_MEDICAMENTO) AS MEDICATION_COUNT
+    FROM CONSULTAS c
+    JOIN TRATAMIENTOS_CONSULTA tc ON c.ID_CONSULTA = tc.ID_CONSULTA
+    WHERE c.ID_PACIENTE IN ({placeholders})
+    GROUP BY c.ID_PACIENTE
+)
+SELECT p.ID_PACIENTE,
+       DATE_PART(EPOCH_SECOND, p.FECHA_NACIMIENTO),
+       COALESCE(cr.CHRONIC_CONDITIONS, 0) + COALESCE(h.CHRONIC_HISTORY, 0),
+       COALESCE(v.EMERGENCY_VISITS, 0),
+       COALESCE(m.MEDICATION_COUNT, 0),
+       DATE_PART(EPOCH_SECOND, v.LAST_VISIT),
+       IFF(p.CONSENTIMIENTO_DATOS, 1, 0),
+       IFF(p.VERIFICACION_BLOCKCHAIN, 1, 0)
+FROM PACIENTES p
+LEFT JOIN visitas v ON v.ID_PACIENTE = p.ID_PACIENTE
+LEFT JOIN cronicas cr ON cr.ID_PACIENTE = p.ID_PACIENTE
+LEFT JOIN historial h ON h.ID_PACIENTE = p.ID_PACIENTE
+LEFT JOIN medicamentos m ON m.ID_PACIENTE = p.ID_PACIENTE
+WHERE p.ID_PACIENTE IN ({placeholders})
+"""
+RAW_FEATURES_BLOCKS = 5
+
+# Pacientes con algún cambio desde la marca de agua (consultas, diagnósticos, tratamientos,
+# historial, registro y confirmaciones on-chain del outbox)
+CHANGED_PATIENTS_SQL = """
+SELECT ID_PACIENTE FROM PACIENTES WHERE FECHA_REGISTRO > %(desde)s
+UNION SELECT ID_PACIENTE FROM CONSULTAS WHERE FECHA_CREACION > %(desde)s
+UNION SELECT c.ID_PACIENTE FROM DIAGNOSTICOS_CONSULTA dc
+      JOIN CONSULTAS c ON c.ID_CONSULTA = dc.ID_CONSULTA WHERE dc.FECHA_DIAGNOSTICO > %(desde)s
+UNION SELECT c.ID_PACIENTE FROM TRATAMIENTOS_CONSULTA tc
+      JOIN CONSULTAS c ON c.ID_CONSULTA = tc.ID_CONSULTA WHERE tc.FECHA_PRESCRIPCION > %(desde)s
+UNION SELECT ID_PACIENTE FROM HISTORIAL_MEDICO WHERE FECHA_REGISTRO > %(desde)s
+UNION SELECT ID_PACIENTE FROM OUTBOX_BLOCKCHAIN WHERE FECHA_CONFIRMACION > %(desde)s
+"""
+
+MANIFEST = "manifest.json"
+
+
+def fetch_raw_features(conn, patient_ids, batch_size=10000):
+    """(ids encontrados, matriz float64 n x 7 en el orden de RAW_COLUMNS); una consulta por bloque"""
+    patient_ids = list(dict.fromkeys(patient_ids))
+    found, rows = [], []
+    cursor = conn.cursor()
+    try:
+        for start in range(0, len(patient_ids), batch_size):
+            chunk = patient_ids[start:start + batch_size]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            # El bloque de IDs se repite en cada CTE para filtrar antes de agregar
+            cursor.execute(RAW_FEATURES_SQL.format(placeholders=placeholders), chunk * RAW_FEATURES_BLOCKS)
+            for row in cursor.fetchall():
+                found.append(row[0])
+                rows.append(row[1:])
+    finally:
+        cursor.close()
+    raw = np.array(rows, dtype=np.float64).reshape(len(rows), len(RAW_COLUMNS))
+    return found, raw
+
+
+def materialize(raw, as_of):
+    """Matriz de FEATURE_NAMES a la fecha `as_of` (epoch escalar o uno por fila)"""
+    as_of = np.asarray(as_of, dtype=np.float64)
+    X = raw.copy()
+    X[:, 0] = np.nan_to_num(np.floor((as_of - raw[:, 0]) / SECONDS_PER_YEAR), nan=0.0)
+    X[:, 4] = np.nan_to_num(np.floor((as_of - raw[:, 4]) / SECONDS_PER_DAY), nan=NO_VISIT_DAYS)
+    return np.nan_to_num(X, nan=0.0)
+
+
+class FeatureStore:
+    """Última versión por paciente (mmap) + historial versionado por tiempo"""
+
+    def __init__(self, path, batch_size=10000, max_history_chunks=16):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_history_chunks = max_history_chunks
+        os.makedirs(os.path.join(path, "history"), exist_ok=True)
+        self._lock = threading.RLock()
+        self._manifest = None
+        self._manifest_mtime = None
+        self._codes = {}
+        self._patients = []
+        self._latest = None
+        self._latest_ts = None
+        self._history = None
+
+    # --- archivos ----------------------------------------------------------
+
+    def _file(self, *parts):
+        return os.path.join(self.path, *parts)
+
+    def _load(self):
+        """Releer manifiesto y tablas si otro proceso (p. ej. `refresh --follow`) los cambió"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self._file(MANIFEST))
+            except FileNotFoundError:
+                mtime = None
+            if self._manifest is not None and mtime == self._manifest_mtime:
+                return
+            if mtime is None:
+                self._manifest = {"watermark": None, "patients": 0, "history": [], "updated_at": None}
+                self._patients, self._latest, self._latest_ts = [], None, None
+            else:
+                with open(self._file(MANIFEST)) as f:
+                    self._manifest = json.load(f)
+                with open(self._file("patients.json")) as f:
+                    self._patients = json.load(f)
+                self._latest = np.load(self._file("latest.npy"), mmap_mode="r")
+                self._latest_ts = np.load(self._file("latest_ts.npy"), mmap_mode="r")
+            self._codes = {patient_id: code for code, patient_id in enumerate(self._patients)}
+            self._history = None
+            self._manifest_mtime = mtime
+
+    def _save_manifest(self, manifest):
+        tmp = self._file(MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self._file(MANIFEST))
+        self._manifest = None
+
+    def _save_array(self, name, array):
+        # Escritura atómica: los lectores con mmap conservan la versión anterior
+        tmp = self._file(name + ".tmp.npy")
+        np.save(tmp, array)
+        os.replace(tmp, self._file(name))
+
+    # --- escritura ---------------------------------------------------------
+
+    def upsert(self, patient_ids, raw, ts=None):
+        """Guardar una nueva versión de las características de `patient_ids` con hora `ts`"""
+        if not len(patient_ids):
+            return 0
+        ts = int(ts if ts is not None else time.time())
+        with self._lock:
+            self._load()
+            patients = list(self._patients)
+            codes = dict(self._codes)
+            for patient_id in patient_ids:
+                if patient_id not in codes:
+                    codes[patient_id] = len(patients)
+                    patients.append(patient_id)
+            rows = np.array([codes[patient_id] for patient_id in patient_ids], dtype=np.int64)
+
+            latest = np.full((len(patients), len(RAW_COLUMNS)), np.nan)
+            latest_ts = np.zeros(len(patients), dtype=np.int64)
+            if self._latest is not None:
+                latest[:len(self._latest)] = self._latest
+                latest_ts[:len(self._latest_ts)] = self._latest_ts
+            latest[rows] = raw
+            latest_ts[rows] = ts
+
+            seq = len(self._manifest["history"]) and int(self._manifest["history"][-1]) + 1
+            chunk = f"{seq:06d}"
+            np.save(self._file("history", f"{chunk}-code.npy"), rows.astype(np.int32))
+            np.save(self._file("history", f"{chunk}-ts.npy"), np.full(len(rows), ts, dtype=np.int64))
+            np.save(self._file("history", f"{chunk}-values.npy"), np.asarray(raw, dtype=np.float64))
+
+            with open(self._file("patients.json.tmp"), "w") as f:
+                json.dump(patients, f)
+            os.replace(self._file("patients.json.tmp"), self._file("patients.json"))
+            self._save_array("latest.npy", latest)
+            self._save_array("latest_ts.npy", latest_ts)
+            self._save_manifest({
+                **self._manifest,
+                "patients": len(patients),
+                "history": self._manifest["history"] + [chunk],
+                "updated_at": ts,
+            })
+            self._load()
+            if len(self._manifest["history"]) > self.max_history_chunks:
+                self.compact_history()
+            return len(rows)
+
+    def refresh(self, conn, full=False):
+        """Recalcular los pacientes con cambios desde la última marca de agua (o todos con full)"""
+        with self._lock:
+            self._load()
+            cursor = conn.cursor()
+            try:
+                # La marca nueva se toma antes de buscar cambios: lo que llegue durante
+                # el refresh se vuelve a procesar la próxima vez
+                cursor.execute("SELECT CURRENT_TIMESTAMP()")
+                watermark = cursor.fetchone()[0]
+                if full or self._manifest["watermark"] is None:
+                    cursor.execute("SELECT ID_PACIENTE FROM PACIENTES")
+                else:
+                    cursor.execute(CHANGED_PATIENTS_SQL, {"desde": self._manifest["watermark"]})
+                changed = [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+            found, raw = fetch_raw_features(conn, changed, self.batch_size)
+            count = self.upsert(found, raw)
+            self._load()
+            self._save_manifest({**self._manifest, "watermark": str(watermark)})
+            self._load()
+            return count
+
+    def compact_history(self):
+        """Fusionar los fragmentos del historial en uno ordenado por (paciente, hora)"""
+        with self._lock:
+            self._load()
+            chunks = self._manifest["history"]
+            if len(chunks) <= 1:
+                return
+            codes, times, values = self._history_arrays()
+            merged = f"{int(chunks[-1]) + 1:06d}"
+            np.save(self._file("history", f"{merged}-code.npy"), codes.astype(np.int32))
+            np.save(self._file("history", f"{merged}-ts.npy"), times)
+            np.save(self._file("history", f"{merged}-values.npy"), values)
+            self._save_manifest({**self._manifest, "history": [merged]})
+            for chunk in chunks:
+                for column in ("code", "ts", "values"):
+                    try:
+                        os.remove(self._file("history", f"{chunk}-{column}.npy"))
+                    except FileNotFoundError:
+                        pass
+            self._load()
+
+    def _history_arrays(self):
+        """(códigos, horas, valores) del historial ordenados por (paciente, hora)"""
+        if self._history is None:
+            load = lambda chunk, column: np.load(self._file("history", f"{chunk}-{column}.npy"), mmap_mode="r")
+            chunks = self._manifest["history"]
+            if not chunks:
+                return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros((0, len(RAW_COLUMNS)))
+            codes = np.concatenate([load(chunk, "code") for chunk in chunks]).astype(np.int64)
+            times = np.concatenate([load(chunk, "ts") for chunk in chunks])
+            values = np.concatenate([load(chunk, "values") for chunk in chunks])
+            order = np.lexsort((times, codes))
+            self._history = (codes[order], times[order], values[order])
+        return self._history
+
+    # --- lectura -----------------------------------------------------------
+
+    def lookup_many(self, patient_ids, as_of=None):
+        """(ids encontrados, matriz de FEATURE_NAMES) con la última versión de cada paciente"""
+        with self._lock:
+            self._load()
+            found = [patient_id for patient_id in dict.fromkeys(patient_ids) if patient_id in self._codes]
+            if not found:
+                return [], np.zeros((0, len(FEATURE_NAMES)))
+            rows = np.array([self._codes[patient_id] for patient_id in found])
+            raw = np.asarray(self._latest[rows])
+        return found, materialize(raw, as_of if as_of is not None else time.time())
+
+    def lookup(self, patient_id, as_of=None):
+        """Características de un paciente como dict (None si no está materializado)"""
+        found, X = self.lookup_many([patient_id], as_of)
+        return dict(zip(FEATURE_NAMES, X[0].tolist())) if found else None
+
+    def point_in_time(self, patient_ids, times):
+        """
+        Conjunto de entrenamiento sin fuga de datos: para cada (paciente, hora) la última versión
+        guardada en o antes de esa hora. Devuelve (máscara de filas con versión, matriz)
+        """
+        times = np.asarray(times, dtype=np.int64)
+        with self._lock:
+            self._load()
+            codes, history_ts, values = self._history_arrays()
+            query_codes = np.array([self._codes.get(patient_id, -1) for patient_id in patient_ids], dtype=np.int64)
+        # Clave combinada (paciente, hora): una búsqueda binaria para todas las filas
+        history_key = (codes << 34) + history_ts
+        query_key = (query_codes << 34) + times
+        index = np.searchsorted(history_key, query_key, "right") - 1
+        valid = (query_codes >= 0) & (index >= 0)
+        valid[valid] &= codes[index[valid]] == query_codes[valid]
+        raw = np.full((len(patient_ids), len(RAW_COLUMNS)), np.nan)
+        raw[valid] = values[index[valid]]
+        return valid, materialize(raw, times)
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {
+                "path": self.path,
+                "patients": len(self._patients),
+                "history_chunks": len(self._manifest["history"]),
+                "watermark": self._manifest["watermark"],
+                "updated_at": self._manifest["updated_at"],
+            }
+
+    def follow(self, connect, interval=60.0, stop=None):
+        """Refrescar en bucle; `connect()` devuelve un context manager con la conexión"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                with connect() as conn:
+                    count = self.refresh(conn)
+                if count:
+                    print(f"📥 Características actualizadas: {count} pacientes")
+            except Exception as e:
+                print(f"⚠️ Error refrescando características: {str(e)}")
+            stop.wait(interval)
+
+
+def feature_store_from_env():
+    """FeatureStore configurado con FEATURE_STORE_*"""
+    return FeatureStore(
+        os.getenv("FEATURE_STORE_PATH", os.path.join(PROJECT_ROOT, "feature-store")),
+        batch_size=int(os.getenv("ML_FEATURE_BATCH", "10000")),
+        max_history_chunks=int(os.getenv("FEATURE_STORE_MAX_HISTORY_CHUNKS", "16")),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Almacén de características de riesgo")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    refresh = sub.add_parser("refresh", help="materializar pacientes nuevos o con cambios")
+    refresh.add_argument("--full", action="store_true", help="recalcular todos los pacientes")
+    refresh.add_argument("--follow", action="store_true", help="refrescar en bucle")
+    refresh.add_argument("--interval", type=float, default=60.0)
+    lookup = sub.add_parser("lookup", help="características actuales de pacientes")
+    lookup.add_argument("patient_ids", nargs="+")
+    sub.add_parser("compact", help="fusionar el historial")
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    store = feature_store_from_env()
+    if args.comando == "refresh":
+        from snowflake_pool import get_pool, snowflake_config_from_env
+
+        pool = get_pool(snowflake_config_from_env())
+        if args.follow:
+            print("🔄 Refrescando características (Ctrl+C para salir)")
+            store.follow(pool.connection, args.interval)
+        else:
+            started = time.perf_counter()
+            with pool.connection() as conn:
+                count = store.refresh(conn, full=args.full)
+            print(f"✅ {count} pacientes materializados en {time.perf_counter() - started:.2f}s")
+    elif args.comando == "lookup":
+        found, X = store.lookup_many(args.patient_ids)
+        for patient_id, row in zip(found, X):
+            print(f"📋 {patient_id}: {dict(zip(FEATURE_NAMES, row.tolist()))}")
+        missing = set(args.patient_ids) - set(found)
+        if missing:
+            print(f"⚠️ Sin características: {', '.join(sorted(missing))}")
+    elif args.comando == "compact":
+        store.compact_history()
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        print(json.dumps(store.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
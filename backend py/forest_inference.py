@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Inferencia compilada para los bosques de riesgo
+Exporta un RandomForestClassifier entrenado a arrays NumPy contiguos (característica, umbral e
+hijos de cada nodo de todos los árboles, probabilidades de las hojas) y los evalúa recorriendo
+todos los árboles a la vez por niveles (solo los pares fila-árbol que no llegaron a una hoja),
+sin el despacho por árbol de sklearn. Reproduce su
+aritmética: X en float32, comparación `<=` contra el umbral float64, probabilidades de hoja
+normalizadas y acumulación árbol por árbol en un solo array (el orden de la suma importa: con
+hojas impuras, como las de max_depth/min_samples_leaf/class_weight, otra reducción difiere en ~1e-17)
+
+Uso:
+    python3 "backend py/forest_inference.py" export risk_classification
+    python3 "backend py/forest_inference.py" check risk_classification
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+ARRAYS = ("feature", "threshold", "children", "nan_right", "value", "roots")
+META = "meta.json"
+FLAT_DIR = "flat"
+
+# sklearn.tree._tree: TREE_LEAF en children_left/right de las hojas
+TREE_LEAF = -1
+
+
+def _values_are_fractions():
+    """Desde sklearn 1.4 tree_.value de un clasificador ya guarda fracciones y predict_proba
+    no las vuelve a normalizar; antes guardaba conteos ponderados y normalizaba al predecir"""
+    import sklearn
+
+    major, minor = (int(part) for part in sklearn.__version__.split(".")[:2])
+    return (major, minor) >= (1, 4)
+
+
+class FlatForest:
+    """Bosque aplanado: todos los nodos de todos los árboles en los mismos arrays"""
+
+    def __init__(self, feature, threshold, children, nan_right, value, roots, classes, max_depth,
+                 n_features, chunk_rows=4096):
+        self.feature = feature          # int32 (nodos,) — 0 en las hojas
+        self.threshold = threshold      # float64 (nodos,)
+        self.children = children        # int32 (nodos, 2) — izquierda / derecha; las hojas apuntan a sí mismas
+        self.nan_right = nan_right      # bool (nodos,) — a dónde va un NaN (missing_go_to_left de sklearn)
+        self.value = value              # float64 (nodos, clases) — probabilidad normalizada de cada hoja
+        self.roots = roots              # int32 (árboles,)
+        self.classes_ = np.asarray(classes)
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = int(n_features)
+        self.chunk_rows = chunk_rows
+        self.n_jobs = 1
+        self._leaf_mask = None
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Aplanar un RandomForestClassifier (o ExtraTreesClassifier) de una sola salida"""
+        if getattr(forest, "n_outputs_", 1) != 1:
+            raise ValueError("Solo se admiten bosques de una salida")
+        n_classes = len(forest.classes_)
+        features, thresholds, children, nan_right, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        normalize = not _values_are_fractions()
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count, dtype=np.int64)
+            leaf = tree.children_left == TREE_LEAF
+            # Las hojas se vuelven ciclos sobre sí mismas: el recorrido da max_depth pasos fijos
+            left = np.where(leaf, nodes, tree.children_left) + offset
+            right = np.where(leaf, nodes, tree.children_right) + offset
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            children.append(np.column_stack([left, right]))
+            missing_left = getattr(tree, "missing_go_to_left", None)
+            nan_right.append(np.zeros(tree.node_count, bool) if missing_left is None
+                             else ~np.asarray(missing_left, dtype=bool))
+
+            # Igual que DecisionTreeClassifier.predict_proba: columnas de clases y, solo en las
+            # versiones que guardan conteos, normalización (renormalizar fracciones cambia el último bit)
+            proba = np.array(tree.value[:, 0, :n_classes], dtype=np.float64)
+            if normalize:
+                normalizer = proba.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                proba = proba / normalizer
+            values.append(proba)
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+        return cls(
+            np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            np.ascontiguousarray(np.concatenate(children), dtype=np.int32),
+            np.concatenate(nan_right),
+            np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            np.array(roots, dtype=np.int32),
+            forest.classes_, max_depth, forest.n_features_in_,
+        )
+
+    @property
+    def _is_leaf(self):
+        if getattr(self, "_leaf_mask", None) is None:
+            self._leaf_mask = self.children[:, 0] == np.arange(self.n_nodes)
+        return self._leaf_mask
+
+    def _leaves(self, X):
+        """Índice de la hoja de cada (fila, árbol) en un array (filas, árboles)"""
+        n_rows, n_features = X.shape
+        node = np.tile(self.roots.astype(np.intp), n_rows)
+        # Posición de cada (fila, árbol) en X aplanado: solo se avanzan los que no llegaron a hoja
+        base = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        flat_x = X.ravel()
+        has_nan = bool(np.isnan(flat_x).any())
+        active = np.flatnonzero(~self._is_leaf[node])
+        while active.size:
+            current = node[active]
+            values = flat_x[base[active] + self.feature[current]]
+            go_right = values > self.threshold[current]
+            if has_nan:
+                go_right |= np.isnan(values) & self.nan_right[current]
+            following = self.children[current, go_right.astype(np.intp)]
+            node[active] = following
+            active = active[~self._is_leaf[following]]
+        return node.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        # sklearn valida X como float32 antes de recorrer los árboles
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaban {self.n_features_in_} características, llegaron {X.shape[1]}")
+        proba = np.empty((len(X), len(self.classes_)))
+        for start in range(0, len(X), self.chunk_rows):
+            leaves = self._leaves(X[start:start + self.chunk_rows])
+            # Igual que _accumulate_prediction de sklearn (un hilo): out += árbol, en orden.
+            # add.accumulate suma estrictamente en secuencia; .sum() puede usar suma por pares
+            per_tree = self.value[leaves.T]
+            total = np.add.accumulate(per_tree, axis=0)[-1]
+            proba[start:start + len(leaves)] = total / self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    # --- persistencia ------------------------------------------------------
+
+    def save(self, directory):
+        """Guardar los arrays como .npy (mapeables en memoria); devuelve sus sha256"""
+        os.makedirs(directory, exist_ok=True)
+        hashes = {}
+        for name in ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            np.save(path, getattr(self, name))
+            with open(path, "rb") as f:
+                hashes[name] = hashlib.sha256(f.read()).hexdigest()
+        meta = {
+            "format": "flat-forest-v1",
+            "classes": self.classes_.tolist(),
+            "max_depth": self.max_depth,
+            "n_features": self.n_features_in_,
+            "n_trees": self.n_trees,
+            "n_nodes": self.n_nodes,
+            "sha256": hashes,
+        }
+        with open(os.path.join(directory, META), "w") as f:
+            json.dump(meta, f, indent=2)
+        return meta
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r", verify_hash=False):
+        with open(os.path.join(directory, META)) as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            if verify_hash:
+                with open(path, "rb") as f:
+                    if hashlib.sha256(f.read()).hexdigest() != meta["sha256"][name]:
+                        raise ValueError(f"{path} no coincide con su sha256")
+            arrays[name] = np.load(path, mmap_mode=mmap_mode)
+        return cls(classes=meta["classes"], max_depth=meta["max_depth"],
+                   n_features=meta["n_features"], **arrays)
+
+
+class CompiledForest:
+    """
+    Modelo para el registro: FlatForest para llamadas de pocas filas (un paciente, lotes chicos)
+    y el bosque de sklearn, cargado al primer uso, para lotes grandes donde su Cython es más rápido
+    """
+
+    def __init__(self, flat, load_model, max_rows=256):
+        self.flat = flat
+        self.classes_ = flat.classes_
+        self.n_features_in_ = flat.n_features_in_
+        self.max_rows = max_rows
+        self._load_model = load_model
+        self._model = None
+        self._lock = threading.Lock()
+        self.n_jobs = 1
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load_model()
+                self._model.n_jobs = self.n_jobs
+            return self._model
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1 or len(X) <= self.max_rows:
+            return self.flat.predict_proba(X)
+        return self.model.predict_proba(X)
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def compile_forest(model):
+    """FlatForest del modelo si es un bosque de sklearn compatible; si no, None"""
+    if not hasattr(model, "estimators_") or not hasattr(model, "classes_"):
+        return None
+    try:
+        return FlatForest.from_sklearn(model)
+    except (ValueError, AttributeError):
+        return None
+
+
+def matches_sklearn(model, flat, rows=10000, seed=0):
+    """¿Mismas clases y probabilidades bit a bit que sklearn sobre filas aleatorias?"""
+    X = np.random.default_rng(seed).normal(0, 50, (rows, flat.n_features_in_))
+    # Con varios hilos sklearn suma los árboles en el orden en que terminan: se compara
+    # contra la predicción de un hilo, la que se usa al servir
+    n_jobs = model.n_jobs
+    model.n_jobs = 1
+    try:
+        return bool(np.array_equal(model.predict(X), flat.predict(X))
+                    and np.array_equal(model.predict_proba(X), flat.predict_proba(X)))
+    finally:
+        model.n_jobs = n_jobs
+
+
+def export_version(directory, model, rows=10000):
+    """Escribir flat/ en el directorio de una versión del registro y anotarlo en su metadata"""
+    from model_registry import METADATA
+
+    flat = FlatForest.from_sklearn(model)
+    if not matches_sklearn(model, flat, rows):
+        raise ValueError("El bosque aplanado no reproduce las predicciones de sklearn")
+    meta = flat.save(os.path.join(directory, FLAT_DIR))
+    with open(os.path.join(directory, METADATA)) as f:
+        metadata = json.load(f)
+    metadata["compiled"] = {key: meta[key] for key in ("format", "n_trees", "n_nodes", "max_depth")}
+    tmp = os.path.join(directory, METADATA + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(metadata, f, indent=2, default=str)
+    os.replace(tmp, os.path.join(directory, METADATA))
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar bosques del registro a inferencia compilada")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    for comando, ayuda in (("export", "escribir flat/ junto a la versión"),
+                           ("check", "comparar con sklearn sobre filas aleatorias")):
+        command = sub.add_parser(comando, help=ayuda)
+        command.add_argument("name")
+        command.add_argument("--version", help="por defecto la versión activa")
+        command.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    import joblib
+
+    from model_registry import ARTIFACT, model_registry_from_env
+
+    registry = model_registry_from_env()
+    version = args.version or registry.current_version(args.name)
+    directory = registry._dir(args.name, version)
+    model = joblib.load(os.path.join(directory, ARTIFACT))
+    if args.comando == "export":
+        try:
+            flat = export_version(directory, model, args.rows)
+        except ValueError as e:
+            raise SystemExit(f"❌ {str(e)}; no se exporta")
+        print(f"✅ {args.name} {version}: {flat.n_trees} árboles, {flat.n_nodes} nodos, "
+              f"exportado en {os.path.join(directory, FLAT_DIR)}")
+    else:
+        flat = FlatForest.from_sklearn(model)
+        print(f"🌲 {args.name} {version}: {flat.n_trees} árboles, {flat.n_nodes} nodos, "
+              f"profundidad {flat.max_depth}; predicciones idénticas: {matches_sklearn(model, flat, args.rows)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Estimación de gas y tarifas EIP-1559 para las transacciones médicas
+El gas se estima por función y tamaño de entrada (con margen de seguridad y caché),
+las tarifas usan maxFeePerGas/maxPriorityFeePerGas cuando la red tiene baseFee,
+y cada recibo se compara con la predicción para seguir el costo por registro
+"""
+
+import os
+import threading
+import time
+
+
+def _abi_slots(value):
+    """Palabras de 32 bytes que ocupa un argumento en el calldata (cabecera + datos dinámicos)"""
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    if isinstance(value, (bytes, bytearray)):
+        return 2 + -(-len(value) // 32)
+    if isinstance(value, (list, tuple)):
+        return 2 + sum(_abi_slots(item) for item in value)
+    return 1
+
+
+def _function_key(contract_function):
+    """
+    (función, palabras de 32 bytes de la entrada): el gas de guardar strings crece por palabra
+    (un SSTORE por slot), así que cada tamaño tiene su propia estimación; un bucket más ancho
+    reutilizaría la estimación de una entrada más chica y dejaría el límite corto
+    """
+    slots = sum(_abi_slots(arg) for arg in getattr(contract_function, "args", None) or ())
+    return f"{contract_function.fn_name}:{slots}"
+
+
+class FeeStrategy:
+    """Gas límite estimado y cacheado + tarifas EIP-1559 (o gasPrice en redes legacy)"""
+
+    def __init__(self, w3, margin=1.2, fallback_gas=2000000, fee_ttl=12.0,
+                 base_fee_multiplier=2.0, default_priority_fee=None, estimate_ttl=3600.0):
+        self.w3 = w3
+        self.margin = margin
+        self.fallback_gas = fallback_gas
+        self.fee_ttl = fee_ttl
+        self.base_fee_multiplier = base_fee_multiplier
+        self.default_priority_fee = default_priority_fee
+        self.estimate_ttl = estimate_ttl
+        self._estimates = {}
+        self._fees = None
+        self._fees_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._estimate_calls = 0
+        self._estimate_hits = 0
+        self._estimate_errors = 0
+
+    # --- gas ---------------------------------------------------------------
+
+    def estimate_gas(self, contract_function, sender):
+        """(gas límite con margen, clave de la función) usando la caché por bucket"""
+        key = _function_key(contract_function)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._estimates.get(key)
+            if cached and now - cached[1] < self.estimate_ttl:
+                self._estimate_hits += 1
+                return int(cached[0] * self.margin), key
+        try:
+            self._estimate_calls += 1
+            estimate = contract_function.estimate_gas({"from": sender})
+        except Exception as e:
+            # Una estimación fallida suele anticipar un revert: se envía con el límite fijo
+            self._estimate_errors += 1
+            print(f"⚠️ No se pudo estimar gas para {key}: {str(e)}")
+            return self.fallback_gas, key
+        with self._lock:
+            previous = self._estimates.get(key)
+            # Dentro de un bucket se conserva la mayor estimación observada
+            self._estimates[key] = (max(estimate, previous[0] if previous else 0), now)
+        return int(estimate * self.margin), key
+
+    # --- tarifas -----------------------------------------------------------
+
+    def fees(self):
+        """Campos de tarifa para build_transaction (cacheados `fee_ttl` segundos)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._fees is not None and now - self._fees_at < self.fee_ttl:
+                return dict(self._fees)
+        latest = self.w3.eth.get_block("latest")
+        base_fee = latest.get("baseFeePerGas")
+        if base_fee is None:
+            fees = {"gasPrice": self.w3.eth.gas_price}
+        else:
+            priority = self.default_priority_fee
+            if priority is None:
+                try:
+                    priority = self.w3.eth.max_priority_fee
+                except Exception:
+                    priority = 10 ** 9  # 1 gwei
+            # Cubre varios bloques de subida del baseFee sin reenviar la transacción
+            fees = {
+                "maxPriorityFeePerGas": priority,
+                "maxFeePerGas": int(base_fee * self.base_fee_multiplier) + priority,
+            }
+        with self._lock:
+            self._fees, self._fees_at = fees, now
+        return dict(fees)
+
+    def transaction_params(self, contract_function, sender):
+        """{'gas', tarifas} para build_transaction y la clave con que se registrará el recibo"""
+        gas, key = self.estimate_gas(contract_function, sender)
+        return {"gas": gas, **self.fees()}, key
+
+    # --- seguimiento ---------------------------------------------------------
+
+    def observe(self, key, predicted_gas, receipt):
+        """Registrar gas previsto vs usado y el costo real de la transacción"""
+        gas_used = receipt["gasUsed"]
+        price = receipt.get("effectiveGasPrice") or 0
+        with self._lock:
+            stats = self._stats.setdefault(key, {
+                "transactions": 0, "predicted_gas": 0, "gas_used": 0,
+                "max_gas_used": 0, "cost_wei": 0, "out_of_margin": 0,
+            })
+            stats["transactions"] += 1
+            stats["predicted_gas"] += predicted_gas
+            stats["gas_used"] += gas_used
+            stats["max_gas_used"] = max(stats["max_gas_used"], gas_used)
+            stats["cost_wei"] += gas_used * price
+            if gas_used >= predicted_gas:
+                stats["out_of_margin"] += 1
+                # El límite quedó corto: la próxima estimación del bucket parte de lo observado
+                cached = self._estimates.get(key)
+                self._estimates[key] = (max(gas_used, cached[0] if cached else 0), time.monotonic())
+        if gas_used >= predicted_gas:
+            print(f"⚠️ Gas usado ({gas_used}) alcanzó el límite previsto ({predicted_gas}) en {key}")
+
+    def metrics(self):
+        with self._lock:
+            per_function = {}
+            for key, stats in self._stats.items():
+                count = stats["transactions"]
+                per_function[key] = {
+                    **stats,
+                    "avg_predicted_gas": stats["predicted_gas"] // count,
+                    "avg_gas_used": stats["gas_used"] // count,
+                    "avg_cost_wei": stats["cost_wei"] // count,
+                    "limit_utilization": round(stats["gas_used"] / stats["predicted_gas"], 3)
+                    if stats["predicted_gas"] else None,
+                }
+            return {
+                "margin": self.margin,
+                "estimate_calls": self._estimate_calls,
+                "estimate_cache_hits": self._estimate_hits,
+                "estimate_errors": self._estimate_errors,
+                "fees": dict(self._fees) if self._fees else None,
+                "functions": per_function,
+            }
+
+
+def fee_strategy_from_env(w3):
+    """FeeStrategy configurada con BLOCKCHAIN_GAS_*/BLOCKCHAIN_FEE_*"""
+    priority = os.getenv("BLOCKCHAIN_PRIORITY_FEE_WEI")
+    return FeeStrategy(
+        w3,
+        margin=float(os.getenv("BLOCKCHAIN_GAS_MARGIN", "1.2")),
+        fallback_gas=int(os.getenv("BLOCKCHAIN_GAS_LIMIT", "2000000")),
+        fee_ttl=float(os.getenv("BLOCKCHAIN_FEE_TTL", "12")),
+        base_fee_multiplier=float(os.getenv("BLOCKCHAIN_BASE_FEE_MULTIPLIER", "2")),
+        default_priority_fee=int(priority) if priority else None,
+    )
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Monitor de salud en segundo plano para las APIs
+Ejecuta los checks de Snowflake y blockchain en intervalos y cachea el resultado
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class HealthMonitor:
+    """Ejecuta checks de dependencias periódicamente y sirve un snapshot cacheado"""
+
+    def __init__(self, interval=15.0, timeout=5.0, max_staleness=None):
+        self.interval = interval
+        self.timeout = timeout
+        self.max_staleness = max_staleness if max_staleness is not None else interval * 3
+        self._checks = {}
+        self._results = {}
+        self._ok = {}
+        self._checked_at = None
+        self._checked_at_iso = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._pending = {}
+
+    def register(self, name, check):
+        """Registrar un check: devuelve bool o dict (con clave 'connected'), o lanza excepción"""
+        self._checks[name] = check
+        self._results[name] = "unknown"
+        self._ok[name] = False
+
+    def _run_check(self, check):
+        try:
+            value = check()
+        except Exception as e:
+            return False, f"error: {str(e)}"
+        if isinstance(value, dict):
+            return bool(value.get("connected", True)), value
+        return bool(value), "connected" if value else "disconnected"
+
+    def refresh(self):
+        """Ejecutar todos los checks una vez y actualizar el snapshot"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, len(self._checks)), thread_name_prefix="health-check"
+            )
+        futures = {}
+        for name, check in self._checks.items():
+            # Un check colgado del ciclo anterior no se vuelve a encolar
+            previous = self._pending.get(name)
+            if previous is not None and not previous.done():
+                futures[name] = previous
+            else:
+                futures[name] = self._pending[name] = self._executor.submit(self._run_check, check)
+        results, ok = {}, {}
+        for name, future in futures.items():
+            try:
+                ok[name], results[name] = future.result(timeout=self.timeout)
+            except Exception:
+                ok[name], results[name] = False, "timeout"
+        # Se reemplazan los dicts completos para que los lectores nunca vean un estado a medias
+        self._results = results
+        self._ok = ok
+        self._checked_at = time.time()
+        self._checked_at_iso = datetime.now().isoformat()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Error en monitor de salud: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Iniciar el hilo de sondeo"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el hilo de sondeo"""
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def staleness(self):
+        """Segundos desde el último sondeo (None si aún no se ha ejecutado)"""
+        if self._checked_at is None:
+            return None
+        return time.time() - self._checked_at
+
+    def is_alive(self):
+        """El hilo de sondeo sigue corriendo"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_ready(self):
+        """Todas las dependencias estaban disponibles en un snapshot reciente"""
+        stale = self.staleness()
+        if stale is None or stale > self.max_staleness:
+            return False
+        return all(self._ok.values())
+
+    def snapshot(self):
+        """Último resultado cacheado, sin ejecutar ningún check"""
+        stale = self.staleness()
+        results = self._results
+        return {
+            "status": "healthy" if all(self._ok.values()) else "degraded",
+            "timestamp": datetime.now().isoformat(),
+            "checked_at": self._checked_at_iso,
+            "stale_seconds": round(stale, 3) if stale is not None else None,
+            **results,
+        }
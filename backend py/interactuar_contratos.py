@@ -4,54 +4,58 @@ Script para interactuar con contratos desplegados
 Sistema Médico BI con Blockchain
 """
 
-import json
-import os
 from web3 import Web3
 from dotenv import load_dotenv
 
+from batch_reads import batch_reader_from_env
+from contract_registry import CONTRACT_NAMES, get_registry
+from gas_fees import fee_strategy_from_env
+
 # Cargar variables de entorno
 load_dotenv()
 
 class ContractInteractor:
-    def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(os.getenv('ETHEREUM_RPC_URL', 'http://127.0.0.1:8545')))
+    def __init__(self, registry=None):
+        self.registry = registry or get_registry()
+        self.w3 = self.registry.w3
         self.contracts = self.load_contracts()
-        self.account = self.w3.eth.accounts[0]  # Usar primera cuenta
+        self.reader = batch_reader_from_env(self.w3, session=self.registry.session)
+        self.fees = fee_strategy_from_env(self.w3)
+    
+    @property
+    def account(self):
+        """Primera cuenta del nodo (se consulta al primer uso)"""
+        return self.registry.default_account()
     
     def load_contracts(self):
         """Cargar contratos desplegados"""
         contracts = {}
         
-        # Cargar direcciones
-        with open('blockchain/contract-addresses.json', 'r') as f:
-            addresses = json.load(f)
-        
-        # Cargar ABIs
-        contract_files = {
-            'MedicalRecords': 'blockchain/artifacts/contracts/MedicalRecords.sol/MedicalRecords.json',
-            'PatientConsent': 'blockchain/artifacts/contracts/PatientConsent.sol/PatientConsent.json',
-            'MedicalAudit': 'blockchain/artifacts/contracts/MedicalAudit.sol/MedicalAudit.json'
-        }
-        
-        for contract_name, contract_file in contract_files.items():
+        for contract_name in CONTRACT_NAMES:
             try:
-                with open(contract_file, 'r') as f:
-                    contract_data = json.load(f)
-                    abi = contract_data['abi']
-                    address = addresses.get(contract_name)
-                    
-                    if address:
-                        contracts[contract_name] = {
-                            'address': address,
-                            'contract': self.w3.eth.contract(address=address, abi=abi)
-                        }
-                        print(f"✅ {contract_name} cargado")
+                address = self.registry.addresses.get(contract_name)
+                
+                if address and self.registry.abi(contract_name):
+                    contracts[contract_name] = {
+                        'address': address,
+                        'contract': self.registry.contract(contract_name)
+                    }
+                    print(f"✅ {contract_name} cargado")
                         
             except Exception as e:
                 print(f"❌ Error cargando {contract_name}: {str(e)}")
         
         return contracts
     
+    def _build_transaction(self, contract_function):
+        """Transacción con gas estimado por función y tarifas EIP-1559"""
+        params, _ = self.fees.transaction_params(contract_function, self.account)
+        return contract_function.build_transaction({
+            'from': self.account,
+            'nonce': self.w3.eth.get_transaction_count(self.account),
+            **params
+        })
+    
     def crear_registro_medico(self, patient_id, diagnosis, treatment):
         """Crear un registro médico en blockchain"""
         if 'MedicalRecords' not in self.contracts:
@@ -62,14 +66,9 @@ class ContractInteractor:
             contract = self.contracts['MedicalRecords']['contract']
             
             # Construir transacción
-            transaction = contract.functions.createMedicalRecord(
+            transaction = self._build_transaction(contract.functions.createMedicalRecord(
                 patient_id, diagnosis, treatment
-            ).build_transaction({
-                'from': self.account,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': self.w3.eth.get_transaction_count(self.account)
-            })
+            ))
             
             # Firmar y enviar transacción
             signed_txn = self.w3.eth.account.sign_transaction(transaction, self.account.key)
@@ -98,14 +97,9 @@ class ContractInteractor:
             contract = self.contracts['PatientConsent']['contract']
             
             # Construir transacción
-            transaction = contract.functions.updateConsent(
+            transaction = self._build_transaction(contract.functions.updateConsent(
                 data_sharing, research_participation, emergency_access
-            ).build_transaction({
-                'from': self.account,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': self.w3.eth.get_transaction_count(self.account)
-            })
+            ))
             
             # Firmar y enviar transacción
             signed_txn = self.w3.eth.account.sign_transaction(transaction, self.account.key)
@@ -134,14 +128,9 @@ class ContractInteractor:
             contract = self.contracts['MedicalAudit']['contract']
             
             # Construir transacción
-            transaction = contract.functions.createAuditLog(
+            transaction = self._build_transaction(contract.functions.createAuditLog(
                 action, details, record_hash
-            ).build_transaction({
-                'from': self.account,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': self.w3.eth.get_transaction_count(self.account)
-            })
+            ))
             
             # Firmar y enviar transacción
             signed_txn = self.w3.eth.account.sign_transaction(transaction, self.account.key)
@@ -160,6 +149,20 @@ class ContractInteractor:
             print(f"❌ Error creando log: {str(e)}")
             return None
     
+    def obtener_registros_medicos(self, record_hashes):
+        """Obtener varios registros médicos en lotes JSON-RPC (None si falla alguno)"""
+        if 'MedicalRecords' not in self.contracts:
+            print("❌ Contrato MedicalRecords no disponible")
+            return [None] * len(record_hashes)
+        
+        contract = self.contracts['MedicalRecords']['contract']
+        records = self.reader.call_many(
+            contract, 'getMedicalRecord',
+            [(Web3.to_bytes(hexstr=record_hash),) for record_hash in record_hashes],
+            cache_if=lambda record: record[5]
+        )
+        return [None if isinstance(record, Exception) else record for record in records]
+    
     def obtener_registro_medico(self, record_hash):
         """Obtener registro médico de blockchain"""
         if 'MedicalRecords' not in self.contracts:
@@ -169,11 +172,13 @@ class ContractInteractor:
         try:
             contract = self.contracts['MedicalRecords']['contract']
             
-            # Convertir hash a bytes32
+            # Convertir hash a bytes32 y obtener registro (caché por hash)
             record_hash_bytes = Web3.to_bytes(hexstr=record_hash)
-            
-            # Obtener registro
-            record = contract.functions.getMedicalRecord(record_hash_bytes).call()
+            record = self.reader.call_many(
+                contract, 'getMedicalRecord', [(record_hash_bytes,)], cache_if=lambda r: r[5]
+            )[0]
+            if isinstance(record, Exception):
+                raise record
             
             print(f"✅ Registro médico obtenido")
             print(f"   🆔 Paciente: {record[0]}")
@@ -188,6 +193,19 @@ class ContractInteractor:
             print(f"❌ Error obteniendo registro: {str(e)}")
             return None
     
+    def verificar_consentimientos(self, patient_addresses):
+        """Consentimientos de varios pacientes en lotes JSON-RPC (None si falla alguno)"""
+        if 'PatientConsent' not in self.contracts:
+            print("❌ Contrato PatientConsent no disponible")
+            return [None] * len(patient_addresses)
+        
+        contract = self.contracts['PatientConsent']['contract']
+        consents = self.reader.call_many(
+            contract, 'getConsent',
+            [(Web3.to_checksum_address(address),) for address in patient_addresses]
+        )
+        return [None if isinstance(consent, Exception) else consent for consent in consents]
+    
     def verificar_consentimiento(self, patient_address):
         """Verificar consentimiento de un paciente"""
         if 'PatientConsent' not in self.contracts:
@@ -195,10 +213,10 @@ class ContractInteractor:
             return None
         
         try:
-            contract = self.contracts['PatientConsent']['contract']
-            
             # Obtener consentimiento
-            consent = contract.functions.patientConsents(patient_address).call()
+            consent = self.verificar_consentimientos([patient_address])[0]
+            if consent is None:
+                raise ValueError("No se pudo leer el consentimiento")
             
             print(f"✅ Consentimiento verificado para {patient_address}")
             print(f"   📊 Compartir datos: {consent[0]}")
@@ -1,15 +1,20 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import snowflake.connector
+from fastapi.responses import JSONResponse
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 import json
 import os
 from dotenv import load_dotenv
-from passlib.context import CryptContext
 import jwt
 from pydantic import BaseModel
+from snowflake_pool import PoolTimeoutError, get_pool, make_connection_dependency
+from dashboard_stats import DashboardStats, StatsUnavailableError
+from async_executors import ExecutorSaturatedError
+from health_monitor import HealthMonitor
+from password_hashing import login_rate_limiter_from_env, password_hasher_from_env
+from token_verifier import InvalidTokenError, TokenVerifier
 
 # Cargar variables de entorno
 load_dotenv()
@@ -19,8 +24,14 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'tu_clave_secreta_aqui')
 ALGORITHM = os.getenv('ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '30'))
 
-# Configuración de hash de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Claims verificados en cache hasta su expiración; los logouts revocan el token
+token_verifier = TokenVerifier(
+    SECRET_KEY, ALGORITHM, max_entries=int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', '10000'))
+)
+
+# Hash de contraseñas: bcrypt en un pool de procesos con límite de intentos por usuario
+password_hasher = password_hasher_from_env()
+login_rate_limiter = login_rate_limiter_from_env()
 
 # Configuración de seguridad HTTP
 security = HTTPBearer()
@@ -76,17 +87,55 @@ class ConsultaCreate(BaseModel):
     motivo_consulta: str
     sintomas: str = None
 
-def get_snowflake_connection():
-    """Obtener conexión a Snowflake"""
-    return snowflake.connector.connect(**conn_params)
+# Pool de conexiones a Snowflake (compartido por todos los endpoints)
+snowflake_pool = get_pool(conn_params)
+get_db_connection = make_connection_dependency(snowflake_pool)
+
+@app.on_event("shutdown")
+def close_snowflake_pool():
+    snowflake_pool.close()
+    password_hasher.shutdown()
+
+# Monitor de salud: sondea Snowflake en segundo plano
+health_monitor = HealthMonitor(interval=float(os.getenv('HEALTH_CHECK_INTERVAL', '15')))
+health_monitor.register("database", lambda: snowflake_pool.ping(timeout=5))
+
+@app.on_event("startup")
+def start_health_monitor():
+    health_monitor.start()
+
+@app.on_event("shutdown")
+def stop_health_monitor():
+    health_monitor.stop()
+
+# Estadísticas del dashboard: se recalculan en segundo plano y se sirven desde memoria
+dashboard_stats = DashboardStats(
+    snowflake_pool,
+    interval=float(os.getenv('DASHBOARD_REFRESH_INTERVAL', '60')),
+    max_staleness=float(os.getenv('DASHBOARD_MAX_STALENESS', '300'))
+)
+
+@app.on_event("startup")
+def start_dashboard_stats():
+    dashboard_stats.start()
+
+@app.on_event("shutdown")
+def stop_dashboard_stats():
+    dashboard_stats.stop()
 
 def verify_password(plain_password, hashed_password):
-    """Verificar contraseña"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verificar contraseña en el pool de bcrypt; devuelve (válida, nuevo_hash)"""
+    try:
+        return password_hasher.verify_sync(plain_password, hashed_password)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 def get_password_hash(password):
-    """Generar hash de contraseña"""
-    return pwd_context.hash(password)
+    """Generar hash de contraseña en el pool de bcrypt"""
+    try:
+        return password_hasher.hash_sync(password)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Crear token de acceso"""
@@ -102,15 +151,9 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verificar token de autenticación"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        return username
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expirado")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
+        return token_verifier.verify(credentials.credentials)["sub"]
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=e.detail)
 
 @app.get("/")
 def root():
@@ -118,78 +161,128 @@ def root():
 
 @app.get("/api/health")
 def health_check():
-    """Verificar estado de la API y conexión a Snowflake"""
-    try:
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        cur.fetchone()
-        cur.close()
-        conn.close()
-        return {"status": "healthy", "database": "connected"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    """Verificar estado de la API y conexión a Snowflake (cacheado por el monitor)"""
+    snapshot = health_monitor.snapshot()
+    if snapshot["database"] != "connected":
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {snapshot['database']}")
+    return snapshot
+
+@app.get("/api/health/live")
+def liveness_check():
+    """Liveness: el proceso responde, sin tocar dependencias"""
+    return {"status": "alive", "monitor": "running" if health_monitor.is_alive() else "stopped"}
+
+@app.get("/api/health/ready")
+def readiness_check():
+    """Readiness: dependencias disponibles según un sondeo reciente"""
+    snapshot = health_monitor.snapshot()
+    if not health_monitor.is_ready():
+        return JSONResponse(status_code=503, content=snapshot)
+    return snapshot
+
+@app.get("/api/metrics/snowflake-pool")
+def snowflake_pool_metrics():
+    """Métricas del pool de conexiones Snowflake"""
+    return snowflake_pool.metrics()
 
 @app.post("/api/auth/register")
 def register_user(user: UserRegister):
     """Registrar nuevo usuario"""
+    # La conexión se toma del pool solo alrededor del SQL: no queda retenida mientras corre bcrypt
     try:
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        
-        # Verificar si el usuario ya existe
-        cur.execute("SELECT COUNT(*) FROM USUARIOS WHERE NOMBRE_USUARIO = %(username)s OR EMAIL = %(email)s", 
-                   {'username': user.username, 'email': user.email})
-        if cur.fetchone()[0] > 0:
+        # Verificar si el usuario ya existe (antes de calcular el hash)
+        with snowflake_pool.connection() as conn:
+            cur = conn.cursor()
+            exists = _user_exists(cur, user)
+            cur.close()
+        if exists:
             raise HTTPException(status_code=400, detail="Usuario o email ya existe")
         
         # Crear nuevo usuario
         user_id = f"USER_{datetime.now().strftime('%Y%m%d%H%M%S')}"
         password_hash = get_password_hash(user.password)
         
-        cur.execute("""
-            INSERT INTO USUARIOS (ID_USUARIO, NOMBRE_USUARIO, EMAIL, PASSWORD_HASH, ROL)
-            VALUES (%(user_id)s, %(username)s, %(email)s, %(password_hash)s, %(rol)s)
-        """, {
-            'user_id': user_id, 
-            'username': user.username, 
-            'email': user.email, 
-            'password_hash': password_hash, 
-            'rol': user.rol
-        })
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        with snowflake_pool.connection() as conn:
+            cur = conn.cursor()
+            # Se vuelve a verificar: otro registro pudo entrar mientras se calculaba el hash
+            if _user_exists(cur, user):
+                raise HTTPException(status_code=400, detail="Usuario o email ya existe")
+            cur.execute("""
+                INSERT INTO USUARIOS (ID_USUARIO, NOMBRE_USUARIO, EMAIL, PASSWORD_HASH, ROL)
+                VALUES (%(user_id)s, %(username)s, %(email)s, %(password_hash)s, %(rol)s)
+            """, {
+                'user_id': user_id, 
+                'username': user.username, 
+                'email': user.email, 
+                'password_hash': password_hash, 
+                'rol': user.rol
+            })
+            
+            conn.commit()
+            cur.close()
         
         return {"status": "success", "message": "Usuario registrado exitosamente", "user_id": user_id}
         
+    except HTTPException:
+        raise
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al registrar usuario: {str(e)}")
 
+def _user_exists(cur, user):
+    cur.execute("SELECT COUNT(*) FROM USUARIOS WHERE NOMBRE_USUARIO = %(username)s OR EMAIL = %(email)s", 
+               {'username': user.username, 'email': user.email})
+    return cur.fetchone()[0] > 0
+
+@app.post("/api/auth/logout")
+def logout_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Cerrar sesión: el token queda revocado hasta su expiración"""
+    token_verifier.revoke(credentials.credentials)
+    return {"status": "success", "message": "Sesión cerrada exitosamente"}
+
 @app.post("/api/auth/login")
-def login_user(user: UserLogin):
+def login_user(user: UserLogin, request: Request):
     """Iniciar sesión de usuario"""
+    client_ip = request.client.host if request.client else None
+    espera = login_rate_limiter.check(user.username, client_ip)
+    if espera:
+        raise HTTPException(status_code=429, detail="Demasiados intentos de inicio de sesión",
+                            headers={"Retry-After": str(espera)})
+    
     try:
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        
-        # Buscar usuario
-        cur.execute("""
-            SELECT ID_USUARIO, NOMBRE_USUARIO, PASSWORD_HASH, ROL 
-            FROM USUARIOS 
-            WHERE NOMBRE_USUARIO = %(username)s AND ACTIVO = TRUE
-        """, {'username': user.username})
+        # Buscar usuario; la conexión vuelve al pool antes de verificar la contraseña
+        with snowflake_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT ID_USUARIO, NOMBRE_USUARIO, PASSWORD_HASH, ROL 
+                FROM USUARIOS 
+                WHERE NOMBRE_USUARIO = %(username)s AND ACTIVO = TRUE
+            """, {'username': user.username})
+            result = cur.fetchone()
+            cur.close()
         
-        result = cur.fetchone()
         if not result:
             raise HTTPException(status_code=401, detail="Usuario no encontrado")
         
         user_id, username, password_hash, rol = result
         
         # Verificar contraseña
-        if not verify_password(user.password, password_hash):
+        valid, new_hash = verify_password(user.password, password_hash)
+        if not valid:
             raise HTTPException(status_code=401, detail="Contraseña incorrecta")
+        login_rate_limiter.reset(user.username, client_ip)
+        
+        # Hash con un costo distinto al configurado: se reemplaza
+        if new_hash:
+            with snowflake_pool.connection() as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    "UPDATE USUARIOS SET PASSWORD_HASH = %(password_hash)s WHERE ID_USUARIO = %(user_id)s",
+                    {'password_hash': new_hash, 'user_id': user_id}
+                )
+                conn.commit()
+                cur.close()
         
         # Crear token de acceso
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -198,9 +291,6 @@ def login_user(user: UserLogin):
             expires_delta=access_token_expires
         )
         
-        cur.close()
-        conn.close()
-        
         return {
             "status": "success",
             "access_token": access_token,
@@ -210,14 +300,17 @@ def login_user(user: UserLogin):
             "rol": rol
         }
         
+    except HTTPException:
+        raise
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en login: {str(e)}")
 
 @app.get("/api/pacientes")
-def get_pacientes(current_user: str = Depends(verify_token)):
+def get_pacientes(current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Obtener lista de pacientes"""
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         cur.execute("""
@@ -242,7 +335,6 @@ def get_pacientes(current_user: str = Depends(verify_token)):
             })
         
         cur.close()
-        conn.close()
         
         return {"status": "success", "data": pacientes, "total": len(pacientes)}
         
@@ -250,10 +342,9 @@ def get_pacientes(current_user: str = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"Error al obtener pacientes: {str(e)}")
 
 @app.post("/api/pacientes")
-def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify_token)):
+def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Crear nuevo paciente"""
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         paciente_id = f"PAC_{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -267,7 +358,6 @@ def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify
         
         conn.commit()
         cur.close()
-        conn.close()
         
         return {"status": "success", "message": "Paciente creado exitosamente", "id_paciente": paciente_id}
         
@@ -275,10 +365,9 @@ def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify
         raise HTTPException(status_code=500, detail=f"Error al crear paciente: {str(e)}")
 
 @app.get("/api/consultas")
-def get_consultas(current_user: str = Depends(verify_token)):
+def get_consultas(current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Obtener lista de consultas"""
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         cur.execute("""
@@ -303,7 +392,6 @@ def get_consultas(current_user: str = Depends(verify_token)):
             })
         
         cur.close()
-        conn.close()
         
         return {"status": "success", "data": consultas, "total": len(consultas)}
         
@@ -311,10 +399,9 @@ def get_consultas(current_user: str = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"Error al obtener consultas: {str(e)}")
 
 @app.post("/api/consultas")
-def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify_token)):
+def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Crear nueva consulta"""
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         consulta_id = f"CON_{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -328,7 +415,6 @@ def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify
         
         conn.commit()
         cur.close()
-        conn.close()
         
         return {"status": "success", "message": "Consulta creada exitosamente", "id_consulta": consulta_id}
         
@@ -339,35 +425,22 @@ def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify
 def get_medical_dashboard(current_user: str = Depends(verify_token)):
     """Obtener dashboard médico"""
     try:
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        
-        # Estadísticas generales
-        cur.execute("SELECT COUNT(*) FROM PACIENTES WHERE ACTIVO = TRUE")
-        total_pacientes = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM CONSULTAS")
-        total_consultas = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM USUARIOS WHERE ACTIVO = TRUE")
-        total_usuarios = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM CONSULTAS WHERE ESTADO_CONSULTA = 'PROGRAMADA'")
-        consultas_programadas = cur.fetchone()[0]
-        
-        cur.close()
-        conn.close()
+        # Resumen precalculado en segundo plano (sin COUNT(*) por request)
+        resumen = dashboard_stats.current()
         
         return {
             "status": "success",
             "dashboard": {
-                "total_pacientes": total_pacientes,
-                "total_consultas": total_consultas,
-                "total_usuarios": total_usuarios,
-                "consultas_programadas": consultas_programadas
+                "total_pacientes": resumen["total_pacientes"],
+                "total_consultas": resumen["total_consultas"],
+                "total_usuarios": resumen["usuarios_activos"],
+                "consultas_programadas": resumen["consultas_programadas"],
+                "actualizado": resumen["computed_at"]
             }
         }
         
+    except StatsUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener dashboard: {str(e)}")
 
@@ -3,18 +3,29 @@
 API FastAPI con integración blockchain para Sistema Médico BI
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import snowflake.connector
-from typing import List, Dict, Any
+from fastapi.responses import JSONResponse
+from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
 import json
 import os
 from dotenv import load_dotenv
-from passlib.context import CryptContext
 import jwt
 from pydantic import BaseModel
+from snowflake_pool import PoolTimeoutError, get_pool
+from async_executors import (
+    ExecutorSaturatedError, warehouse_executor_from_env, rpc_executor_from_env,
+    make_async_connection_dependency, install_backpressure_handlers
+)
+from audit_store import EVENT_KINDS as AUDIT_EVENT_KINDS, audit_store_from_env
+from chain_head import ChainHead
+from dashboard_stats import DashboardStats, StatsUnavailableError
+from health_monitor import HealthMonitor
+from merkle_anchor import merkle_anchor_batcher_from_env
+from password_hashing import login_rate_limiter_from_env, password_hasher_from_env
+from token_verifier import InvalidTokenError, TokenVerifier
 from web3_medical_integration import MedicalBlockchain
 
 # Cargar variables de entorno
@@ -25,8 +36,14 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'tu_clave_secreta_aqui')
 ALGORITHM = os.getenv('ALGORITHM', 'HS256')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '30'))
 
-# Configuración de hash de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Claims verificados en cache hasta su expiración; los logouts revocan el token
+token_verifier = TokenVerifier(
+    SECRET_KEY, ALGORITHM, max_entries=int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', '10000'))
+)
+
+# Hash de contraseñas: bcrypt en un pool de procesos con límite de intentos por usuario
+password_hasher = password_hasher_from_env()
+login_rate_limiter = login_rate_limiter_from_env()
 
 # Configuración de seguridad HTTP
 security = HTTPBearer()
@@ -100,17 +117,97 @@ class AuditLogCreate(BaseModel):
     details: str
     record_hash: str = None
 
-def get_snowflake_connection():
-    """Obtener conexión a Snowflake"""
-    return snowflake.connector.connect(**conn_params)
+class MedicalRecordBatch(BaseModel):
+    record_hashes: List[str]
+
+class PatientConsentBatch(BaseModel):
+    patient_addresses: List[str]
+
+class AnchoredRecordVerify(BaseModel):
+    patient_id: str
+    diagnosis: str
+    treatment: str
+    timestamp: int
+    doctor: str = ""
+
+# Pool de conexiones a Snowflake (compartido por todos los endpoints)
+snowflake_pool = get_pool(conn_params)
+
+# Executors dedicados: las consultas lentas y la RPC no bloquean al resto de rutas
+warehouse_executor = warehouse_executor_from_env()
+rpc_executor = rpc_executor_from_env()
+install_backpressure_handlers(app)
+get_db_connection = make_async_connection_dependency(snowflake_pool, warehouse_executor)
+
+@app.on_event("shutdown")
+def close_snowflake_pool():
+    snowflake_pool.close()
+    warehouse_executor.shutdown()
+    get_db_connection.acquirer.shutdown()
+    rpc_executor.shutdown()
+    password_hasher.shutdown()
+    blockchain.close()
+
+# Último bloque y chain_id en memoria (proveedor web3 asíncrono con sesión persistente)
+chain_head = ChainHead(
+    blockchain.registry.rpc_url,
+    poll_interval=float(os.getenv('BLOCKCHAIN_HEAD_POLL_INTERVAL', '2')),
+    timeout=float(os.getenv('BLOCKCHAIN_RPC_TIMEOUT', '5'))
+)
+
+@app.on_event("startup")
+async def start_chain_head():
+    chain_head.start()
+
+@app.on_event("shutdown")
+async def stop_chain_head():
+    await chain_head.stop()
+
+# Monitor de salud: sondea Snowflake y blockchain en segundo plano
+health_monitor = HealthMonitor(interval=float(os.getenv('HEALTH_CHECK_INTERVAL', '15')))
+health_monitor.register("database", lambda: snowflake_pool.ping(timeout=5))
+health_monitor.register("blockchain", lambda: chain_head.snapshot())
+
+@app.on_event("startup")
+def start_health_monitor():
+    health_monitor.start()
+
+@app.on_event("shutdown")
+def stop_health_monitor():
+    health_monitor.stop()
+
+# Estadísticas del dashboard: se recalculan en segundo plano y se sirven desde memoria
+dashboard_stats = DashboardStats(
+    snowflake_pool,
+    interval=float(os.getenv('DASHBOARD_REFRESH_INTERVAL', '60')),
+    max_staleness=float(os.getenv('DASHBOARD_MAX_STALENESS', '300'))
+)
+
+@app.on_event("startup")
+def start_dashboard_stats():
+    dashboard_stats.start()
+
+@app.on_event("shutdown")
+def stop_dashboard_stats():
+    dashboard_stats.stop()
+
+# Anclaje por lotes: una raíz Merkle on-chain por cada BLOCKCHAIN_ANCHOR_BATCH registros
+anchor_batcher = merkle_anchor_batcher_from_env(blockchain, snowflake_pool)
+RECORD_MODE = os.getenv('BLOCKCHAIN_RECORD_MODE', 'directo').lower()
 
-def verify_password(plain_password, hashed_password):
-    """Verificar contraseña"""
-    return pwd_context.verify(plain_password, hashed_password)
+# Máximo de registros/consentimientos por petición de lectura en lote
+READ_BATCH_MAX_ITEMS = int(os.getenv('BLOCKCHAIN_READ_MAX_ITEMS', '1000'))
 
-def get_password_hash(password):
-    """Generar hash de contraseña"""
-    return pwd_context.hash(password)
+# Auditoría columnar (la alimenta `audit_store.py sync`); aquí solo se consulta
+audit_store = audit_store_from_env()
+
+@app.on_event("startup")
+def start_anchor_batcher():
+    anchor_batcher.start()
+
+@app.on_event("shutdown")
+def stop_anchor_batcher():
+    anchor_batcher.stop()
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Crear token de acceso"""
@@ -123,133 +220,195 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Verificar token de autenticación"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        return username
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expirado")
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
+        return token_verifier.verify(credentials.credentials)["sub"]
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=e.detail)
 
 @app.get("/")
-def root():
+async def root():
     return {
         "message": "Bienvenido al Sistema Médico BI API con Blockchain!", 
         "version": "1.0.0",
-        "blockchain_status": blockchain.get_connection_status()
+        "blockchain_status": health_monitor.snapshot()["blockchain"]
     }
 
 @app.get("/api/health")
-def health_check():
-    """Verificar estado de la API, Snowflake y Blockchain"""
-    try:
-        # Verificar Snowflake
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        cur.fetchone()
-        cur.close()
-        conn.close()
-        snowflake_status = "connected"
-    except Exception as e:
-        snowflake_status = f"error: {str(e)}"
-    
-    # Verificar Blockchain
-    blockchain_status = blockchain.get_connection_status()
-    
+async def health_check():
+    """Verificar estado de la API, Snowflake y Blockchain (cacheado por el monitor)"""
+    return health_monitor.snapshot()
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """Liveness: el proceso responde, sin tocar dependencias"""
+    return {"status": "alive", "monitor": "running" if health_monitor.is_alive() else "stopped"}
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Readiness: dependencias disponibles según un sondeo reciente"""
+    snapshot = health_monitor.snapshot()
+    if not health_monitor.is_ready():
+        return JSONResponse(status_code=503, content=snapshot)
+    return snapshot
+
+@app.get("/api/metrics/snowflake-pool")
+async def snowflake_pool_metrics():
+    """Métricas del pool de conexiones Snowflake"""
+    return snowflake_pool.metrics()
+
+@app.get("/api/metrics/executors")
+async def executor_metrics():
+    """Ocupación de los executors de warehouse (SQL y espera de conexiones) y RPC"""
     return {
-        "status": "healthy", 
-        "database": snowflake_status,
-        "blockchain": blockchain_status
+        "warehouse": warehouse_executor.metrics(),
+        "warehouse_acquire": get_db_connection.acquirer.metrics(),
+        "rpc": rpc_executor.metrics()
     }
 
 @app.post("/api/auth/register")
-def register_user(user: UserRegister):
+async def register_user(user: UserRegister):
     """Registrar nuevo usuario"""
+    # Cada paso toma una conexión del pool solo alrededor de su SQL: ninguna queda
+    # retenida mientras bcrypt corre en el pool de procesos
+    await warehouse_executor.run(_check_user_available, user)
+    password_hash = await password_hasher.hash(user.password)
+    return await warehouse_executor.run(_register_user, user, password_hash)
+
+def _user_exists(cur, user):
+    cur.execute("SELECT COUNT(*) FROM USUARIOS WHERE NOMBRE_USUARIO = %s OR EMAIL = %s", 
+               (user.username, user.email))
+    return cur.fetchone()[0] > 0
+
+def _check_user_available(user):
+    """Rechazar antes de calcular el hash si el usuario o el email ya existen"""
     try:
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        
-        # Verificar si el usuario ya existe
-        cur.execute("SELECT COUNT(*) FROM USUARIOS WHERE NOMBRE_USUARIO = %s OR EMAIL = %s", 
-                   (user.username, user.email))
-        if cur.fetchone()[0] > 0:
-            raise HTTPException(status_code=400, detail="Usuario o email ya existe")
-        
-        # Crear nuevo usuario
-        user_id = f"USER_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        password_hash = get_password_hash(user.password)
-        
-        cur.execute("""
-            INSERT INTO USUARIOS (ID_USUARIO, NOMBRE_USUARIO, EMAIL, PASSWORD_HASH, ROL)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (user_id, user.username, user.email, password_hash, user.rol))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+        with snowflake_pool.connection() as conn:
+            cur = conn.cursor()
+            exists = _user_exists(cur, user)
+            cur.close()
+    except PoolTimeoutError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al registrar usuario: {str(e)}")
+    if exists:
+        raise HTTPException(status_code=400, detail="Usuario o email ya existe")
+
+def _register_user(user, password_hash):
+    try:
+        with snowflake_pool.connection() as conn:
+            cur = conn.cursor()
+            
+            # Se vuelve a verificar: otro registro pudo entrar mientras se calculaba el hash
+            if _user_exists(cur, user):
+                raise HTTPException(status_code=400, detail="Usuario o email ya existe")
+            
+            # Crear nuevo usuario
+            user_id = f"USER_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            
+            cur.execute("""
+                INSERT INTO USUARIOS (ID_USUARIO, NOMBRE_USUARIO, EMAIL, PASSWORD_HASH, ROL)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (user_id, user.username, user.email, password_hash, user.rol))
+            
+            conn.commit()
+            cur.close()
         
         return {"status": "success", "message": "Usuario registrado exitosamente", "user_id": user_id}
         
+    except (HTTPException, PoolTimeoutError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al registrar usuario: {str(e)}")
 
+@app.post("/api/auth/logout")
+async def logout_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Cerrar sesión: el token queda revocado hasta su expiración"""
+    token_verifier.revoke(credentials.credentials)
+    return {"status": "success", "message": "Sesión cerrada exitosamente"}
+
 @app.post("/api/auth/login")
-def login_user(user: UserLogin):
+async def login_user(user: UserLogin, request: Request):
     """Iniciar sesión de usuario"""
+    client_ip = request.client.host if request.client else None
+    espera = login_rate_limiter.check(user.username, client_ip)
+    if espera:
+        raise HTTPException(status_code=429, detail="Demasiados intentos de inicio de sesión",
+                            headers={"Retry-After": str(espera)})
+    
+    # La conexión se devuelve al pool antes de verificar la contraseña
+    result = await warehouse_executor.run(_find_login_user, user.username)
+    if not result:
+        raise HTTPException(status_code=401, detail="Usuario no encontrado")
+    
+    user_id, username, password_hash, rol = result
+    
+    # Verificar contraseña (bcrypt en el pool de procesos)
+    valid, new_hash = await password_hasher.verify(user.password, password_hash)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Contraseña incorrecta")
+    login_rate_limiter.reset(user.username, client_ip)
+    
+    # Hash con un costo distinto al configurado: se reemplaza
+    if new_hash:
+        await warehouse_executor.run(_update_password_hash, user_id, new_hash)
+    
+    # Crear token de acceso
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": username, "user_id": user_id, "rol": rol}, 
+        expires_delta=access_token_expires
+    )
+    
+    return {
+        "status": "success",
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user_id": user_id,
+        "username": username,
+        "rol": rol
+    }
+
+def _find_login_user(username):
     try:
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        
-        # Buscar usuario
-        cur.execute("""
-            SELECT ID_USUARIO, NOMBRE_USUARIO, PASSWORD_HASH, ROL 
-            FROM USUARIOS 
-            WHERE NOMBRE_USUARIO = %s AND ACTIVO = TRUE
-        """, (user.username,))
-        
-        result = cur.fetchone()
-        if not result:
-            raise HTTPException(status_code=401, detail="Usuario no encontrado")
-        
-        user_id, username, password_hash, rol = result
-        
-        # Verificar contraseña
-        if not verify_password(user.password, password_hash):
-            raise HTTPException(status_code=401, detail="Contraseña incorrecta")
-        
-        # Crear token de acceso
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": username, "user_id": user_id, "rol": rol}, 
-            expires_delta=access_token_expires
-        )
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            "status": "success",
-            "access_token": access_token,
-            "token_type": "bearer",
-            "user_id": user_id,
-            "username": username,
-            "rol": rol
-        }
+        with snowflake_pool.connection() as conn:
+            cur = conn.cursor()
+            
+            # Buscar usuario
+            cur.execute("""
+                SELECT ID_USUARIO, NOMBRE_USUARIO, PASSWORD_HASH, ROL 
+                FROM USUARIOS 
+                WHERE NOMBRE_USUARIO = %s AND ACTIVO = TRUE
+            """, (username,))
+            
+            result = cur.fetchone()
+            cur.close()
+        return result
         
+    except PoolTimeoutError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en login: {str(e)}")
 
+def _update_password_hash(user_id, password_hash):
+    try:
+        with snowflake_pool.connection() as conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE USUARIOS SET PASSWORD_HASH = %s WHERE ID_USUARIO = %s", (password_hash, user_id))
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        # El login ya es válido; el rehash se reintenta en el próximo inicio de sesión
+        print(f"⚠️ No se pudo actualizar el hash de {user_id}: {str(e)}")
+
 @app.get("/api/pacientes")
-def get_pacientes(current_user: str = Depends(verify_token)):
+async def get_pacientes(current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Obtener lista de pacientes"""
+    return await warehouse_executor.run(_get_pacientes, conn)
+
+def _get_pacientes(conn):
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         cur.execute("""
@@ -274,7 +433,6 @@ def get_pacientes(current_user: str = Depends(verify_token)):
             })
         
         cur.close()
-        conn.close()
         
         return {"status": "success", "data": pacientes, "total": len(pacientes)}
         
@@ -282,10 +440,12 @@ def get_pacientes(current_user: str = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"Error al obtener pacientes: {str(e)}")
 
 @app.post("/api/pacientes")
-def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify_token)):
+async def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Crear nuevo paciente"""
+    return await warehouse_executor.run(_create_paciente, conn, paciente)
+
+def _create_paciente(conn, paciente):
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         paciente_id = f"PAC_{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -299,7 +459,6 @@ def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify
         
         conn.commit()
         cur.close()
-        conn.close()
         
         return {"status": "success", "message": "Paciente creado exitosamente", "id_paciente": paciente_id}
         
@@ -307,10 +466,12 @@ def create_paciente(paciente: PacienteCreate, current_user: str = Depends(verify
         raise HTTPException(status_code=500, detail=f"Error al crear paciente: {str(e)}")
 
 @app.get("/api/consultas")
-def get_consultas(current_user: str = Depends(verify_token)):
+async def get_consultas(current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Obtener lista de consultas"""
+    return await warehouse_executor.run(_get_consultas, conn)
+
+def _get_consultas(conn):
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         cur.execute("""
@@ -335,7 +496,6 @@ def get_consultas(current_user: str = Depends(verify_token)):
             })
         
         cur.close()
-        conn.close()
         
         return {"status": "success", "data": consultas, "total": len(consultas)}
         
@@ -343,10 +503,12 @@ def get_consultas(current_user: str = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"Error al obtener consultas: {str(e)}")
 
 @app.post("/api/consultas")
-def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify_token)):
+async def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify_token), conn=Depends(get_db_connection)):
     """Crear nueva consulta"""
+    return await warehouse_executor.run(_create_consulta, conn, consulta, current_user)
+
+def _create_consulta(conn, consulta, current_user):
     try:
-        conn = get_snowflake_connection()
         cur = conn.cursor()
         
         consulta_id = f"CON_{datetime.now().strftime('%Y%m%d%H%M%S')}"
@@ -360,7 +522,6 @@ def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify
         
         conn.commit()
         cur.close()
-        conn.close()
         
         return {"status": "success", "message": "Consulta creada exitosamente", "id_consulta": consulta_id}
         
@@ -370,35 +531,81 @@ def create_consulta(consulta: ConsultaCreate, current_user: str = Depends(verify
 # ===== ENDPOINTS BLOCKCHAIN =====
 
 @app.get("/api/blockchain/status")
-def get_blockchain_status():
-    """Obtener estado de la conexión blockchain"""
-    return blockchain.get_connection_status()
+async def get_blockchain_status():
+    """Obtener estado de la conexión blockchain (desde memoria, sin RPC por request)"""
+    head = chain_head.snapshot()
+    if head["connected"]:
+        return {
+            'connected': True,
+            'latest_block': head["latest_block"],
+            'network_id': head["chain_id"],
+            'updated_at': head["updated_at"]
+        }
+    return {
+        'connected': False,
+        'error': head["error"] or "Sin datos recientes del nodo"
+    }
 
 @app.post("/api/blockchain/medical-record")
-def create_blockchain_medical_record(record: MedicalRecordCreate, current_user: str = Depends(verify_token)):
+async def create_blockchain_medical_record(record: MedicalRecordCreate, current_user: str = Depends(verify_token)):
     """Crear registro médico en blockchain"""
+    if RECORD_MODE == 'anclaje':
+        return await anchor_blockchain_medical_record(record, current_user)
+    # La transacción entra a la cola del pipeline; el recibo se espera sin ocupar un hilo
+    result = await blockchain.create_medical_record_async(
+        record.patient_id,
+        record.diagnosis,
+        record.treatment
+    )
+    
+    if result['success']:
+        return {
+            "status": "success",
+            "message": "Registro médico creado en blockchain",
+            "data": result
+        }
+    raise HTTPException(status_code=500, detail=f"Error al crear registro médico: {result['error']}")
+
+@app.post("/api/blockchain/medical-record/anchor")
+async def anchor_blockchain_medical_record(record: MedicalRecordCreate, current_user: str = Depends(verify_token)):
+    """Registrar un registro médico para el próximo lote anclado con raíz Merkle"""
+    result = await warehouse_executor.run(
+        anchor_batcher.submit, record.patient_id, record.diagnosis, record.treatment, current_user
+    )
+    return {
+        "status": "success",
+        "message": "Registro médico pendiente de anclaje en blockchain",
+        "data": result
+    }
+
+@app.get("/api/blockchain/anchors/{record_hash}")
+async def get_anchored_record(record_hash: str, current_user: str = Depends(verify_token)):
+    """Estado del anclaje y prueba de inclusión de un registro"""
+    anclaje = await warehouse_executor.run(anchor_batcher.anchor, record_hash)
+    if anclaje is None:
+        raise HTTPException(status_code=404, detail="Registro no encontrado en los anclajes")
+    return {"status": "success", "data": anclaje}
+
+@app.post("/api/blockchain/anchors/verify")
+async def verify_anchored_record(record: AnchoredRecordVerify, current_user: str = Depends(verify_token)):
+    """Verificar que los datos de un registro coinciden con una raíz anclada on-chain"""
     try:
-        result = blockchain.create_medical_record(
-            record.patient_id,
-            record.diagnosis,
-            record.treatment
+        result = await rpc_executor.run(
+            anchor_batcher.verify, record.patient_id, record.diagnosis, record.treatment,
+            record.timestamp, record.doctor
         )
-        
-        if result['success']:
-            return {
-                "status": "success",
-                "message": "Registro médico creado en blockchain",
-                "data": result
-            }
-        else:
-            raise HTTPException(status_code=500, detail=f"Error en blockchain: {result['error']}")
-            
+    except (ExecutorSaturatedError, PoolTimeoutError):
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al crear registro médico: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error al verificar registro anclado: {str(e)}")
+    return {"status": "success", "data": result}
 
 @app.get("/api/blockchain/medical-record/{record_hash}")
-def get_blockchain_medical_record(record_hash: str, current_user: str = Depends(verify_token)):
+async def get_blockchain_medical_record(record_hash: str, current_user: str = Depends(verify_token)):
     """Obtener registro médico desde blockchain"""
+    return await rpc_executor.run(_get_blockchain_medical_record, record_hash)
+
+def _get_blockchain_medical_record(record_hash):
     try:
         result = blockchain.get_medical_record(record_hash)
         
@@ -413,31 +620,37 @@ def get_blockchain_medical_record(record_hash: str, current_user: str = Depends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener registro médico: {str(e)}")
 
+@app.post("/api/blockchain/medical-records/batch")
+async def get_blockchain_medical_records(batch: MedicalRecordBatch, current_user: str = Depends(verify_token)):
+    """Obtener varios registros médicos con lecturas agrupadas (resultados en el mismo orden)"""
+    if len(batch.record_hashes) > READ_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {READ_BATCH_MAX_ITEMS} registros por petición")
+    results = await rpc_executor.run(blockchain.get_medical_records, batch.record_hashes)
+    return {"status": "success", "data": results}
+
 @app.post("/api/blockchain/consent")
-def update_patient_consent(consent: PatientConsentUpdate, current_user: str = Depends(verify_token)):
+async def update_patient_consent(consent: PatientConsentUpdate, current_user: str = Depends(verify_token)):
     """Actualizar consentimiento del paciente en blockchain"""
-    try:
-        result = blockchain.update_patient_consent(
-            consent.data_sharing,
-            consent.research_participation,
-            consent.emergency_access
-        )
-        
-        if result['success']:
-            return {
-                "status": "success",
-                "message": "Consentimiento actualizado en blockchain",
-                "data": result
-            }
-        else:
-            raise HTTPException(status_code=500, detail=f"Error en blockchain: {result['error']}")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al actualizar consentimiento: {str(e)}")
+    result = await blockchain.update_patient_consent_async(
+        consent.data_sharing,
+        consent.research_participation,
+        consent.emergency_access
+    )
+    
+    if result['success']:
+        return {
+            "status": "success",
+            "message": "Consentimiento actualizado en blockchain",
+            "data": result
+        }
+    raise HTTPException(status_code=500, detail=f"Error al actualizar consentimiento: {result['error']}")
 
 @app.get("/api/blockchain/consent/{patient_address}")
-def get_patient_consent(patient_address: str, current_user: str = Depends(verify_token)):
+async def get_patient_consent(patient_address: str, current_user: str = Depends(verify_token)):
     """Obtener consentimiento del paciente desde blockchain"""
+    return await rpc_executor.run(_get_patient_consent, patient_address)
+
+def _get_patient_consent(patient_address):
     try:
         result = blockchain.get_patient_consent(patient_address)
         
@@ -452,67 +665,93 @@ def get_patient_consent(patient_address: str, current_user: str = Depends(verify
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener consentimiento: {str(e)}")
 
+@app.post("/api/blockchain/consents/batch")
+async def get_patient_consents(batch: PatientConsentBatch, current_user: str = Depends(verify_token)):
+    """Obtener consentimientos de varios pacientes con lecturas agrupadas"""
+    if len(batch.patient_addresses) > READ_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {READ_BATCH_MAX_ITEMS} pacientes por petición")
+    results = await rpc_executor.run(blockchain.get_patient_consents, batch.patient_addresses)
+    return {"status": "success", "data": results}
+
 @app.post("/api/blockchain/audit-log")
-def create_audit_log(audit: AuditLogCreate, current_user: str = Depends(verify_token)):
+async def create_audit_log(audit: AuditLogCreate, current_user: str = Depends(verify_token)):
     """Crear log de auditoría en blockchain"""
+    result = await blockchain.create_audit_log_async(
+        audit.action,
+        audit.details,
+        audit.record_hash
+    )
+    
+    if result['success']:
+        return {
+            "status": "success",
+            "message": "Log de auditoría creado en blockchain",
+            "data": result
+        }
+    raise HTTPException(status_code=500, detail=f"Error al crear log de auditoría: {result['error']}")
+
+@app.get("/api/blockchain/audit")
+async def query_audit_trail(
+    user: Optional[str] = None,
+    record_hash: Optional[str] = None,
+    desde: Optional[str] = None,
+    hasta: Optional[str] = None,
+    evento: Optional[str] = None,
+    limit: int = Query(100, ge=0, le=1000),
+    newest_first: bool = False,
+    current_user: str = Depends(verify_token)
+):
+    """Accesos y logs de auditoría por usuario, registro y rango de fechas [desde, hasta)"""
+    if evento is not None and evento not in AUDIT_EVENT_KINDS:
+        raise HTTPException(status_code=400, detail=f"Evento inválido, opciones: {', '.join(AUDIT_EVENT_KINDS)}")
     try:
-        result = blockchain.create_audit_log(
-            audit.action,
-            audit.details,
-            audit.record_hash
+        result = await warehouse_executor.run(
+            audit_store.query, user=user, record_hash=record_hash, start=desde, end=hasta,
+            event=evento, limit=limit, newest_first=newest_first
         )
-        
-        if result['success']:
-            return {
-                "status": "success",
-                "message": "Log de auditoría creado en blockchain",
-                "data": result
-            }
-        else:
-            raise HTTPException(status_code=500, detail=f"Error en blockchain: {result['error']}")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al crear log de auditoría: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Filtro inválido: {str(e)}")
+    return {"status": "success", "last_block": audit_store.last_block, **result}
+
+@app.get("/api/metrics/blockchain-tx")
+async def blockchain_tx_metrics():
+    """Cola de transacciones, recibos pendientes y resincronizaciones de nonce"""
+    return blockchain.pipeline.metrics()
+
+@app.get("/api/metrics/blockchain-reads")
+async def blockchain_read_metrics():
+    """Lecturas agrupadas: llamadas, peticiones HTTP y aciertos de caché"""
+    return blockchain.reader.metrics()
+
+@app.get("/api/metrics/blockchain-anchor")
+async def blockchain_anchor_metrics():
+    """Registros por transacción, lotes enviados y registros en el buffer de anclaje"""
+    return anchor_batcher.metrics()
 
 @app.get("/api/dashboard/medical")
-def get_medical_dashboard(current_user: str = Depends(verify_token)):
+async def get_medical_dashboard(current_user: str = Depends(verify_token)):
     """Obtener dashboard médico con información de blockchain"""
+    # Resumen precalculado por el hilo de refresco; el request nunca consulta Snowflake
     try:
-        conn = get_snowflake_connection()
-        cur = conn.cursor()
-        
-        # Estadísticas generales
-        cur.execute("SELECT COUNT(*) FROM PACIENTES WHERE ACTIVO = TRUE")
-        total_pacientes = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM CONSULTAS")
-        total_consultas = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM USUARIOS WHERE ACTIVO = TRUE")
-        total_usuarios = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM CONSULTAS WHERE ESTADO_CONSULTA = 'PROGRAMADA'")
-        consultas_programadas = cur.fetchone()[0]
-        
-        cur.close()
-        conn.close()
-        
-        # Estado de blockchain
-        blockchain_status = blockchain.get_connection_status()
-        
-        return {
-            "status": "success",
-            "dashboard": {
-                "total_pacientes": total_pacientes,
-                "total_consultas": total_consultas,
-                "total_usuarios": total_usuarios,
-                "consultas_programadas": consultas_programadas,
-                "blockchain_status": blockchain_status
-            }
+        resumen = dashboard_stats.current()
+    except StatsUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    
+    # Estado de blockchain (último sondeo del monitor, sin RPC en el request)
+    blockchain_status = health_monitor.snapshot()["blockchain"]
+    
+    return {
+        "status": "success",
+        "dashboard": {
+            "total_pacientes": resumen["total_pacientes"],
+            "total_consultas": resumen["total_consultas"],
+            "total_usuarios": resumen["usuarios_activos"],
+            "consultas_programadas": resumen["consultas_programadas"],
+            "registros_blockchain": resumen["registros_blockchain"],
+            "actualizado": resumen["computed_at"],
+            "blockchain_status": blockchain_status
         }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al obtener dashboard: {str(e)}")
+    }
 
 if __name__ == "__main__":
     import uvicorn
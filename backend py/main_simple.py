@@ -4,19 +4,41 @@ Sistema Médico BI - API Principal
 Integración con Blockchain y Snowflake
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 import os
 from dotenv import load_dotenv
-import snowflake.connector
-from web3 import Web3
+from blockchain_outbox import (
+    ESTADO_PENDIENTE, encolar_verificaciones, estado_verificacion, outbox_worker_from_env
+)
+from chain_head import ChainHead
+from contract_registry import CONTRACT_NAMES, ZERO_ADDRESS, get_registry
 import json
+from snowflake_pool import get_pool, is_connection_broken
+from async_executors import (
+    warehouse_executor_from_env, rpc_executor_from_env,
+    make_async_connection_dependency, install_backpressure_handlers
+)
+from dashboard_stats import DashboardStats, StatsUnavailableError
+from health_monitor import HealthMonitor
+from static_pages import PAGE_ALIASES, StaticPageTable
+from token_verifier import InvalidTokenError, TokenVerifier, token_from_header
+from pacientes_lote import (
+    INSERT_PACIENTE_SQL, nuevo_paciente_id, paciente_insert_params,
+    leer_csv_pacientes, registrar_lote
+)
+from paciente_cache import paciente_cache_from_env
+from web3_medical_integration import MedicalBlockchain
+from pacientes_query import (
+    InvalidCursorError, CountCache, decode_cursor, build_filters, build_page_query,
+    fetch_page, count_pacientes, row_to_paciente
+)
 
 
 # Cargar variables de entorno
@@ -50,6 +72,11 @@ SECRET_KEY = os.getenv("SECRET_KEY", "tu_clave_secreta_aqui")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Claims verificados en cache hasta su expiración; los logouts revocan el token
+token_verifier = TokenVerifier(
+    SECRET_KEY, ALGORITHM, max_entries=int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', '10000'))
+)
+
 # Configuración Snowflake
 SNOWFLAKE_CONFIG = {
     'user': os.getenv('SNOWFLAKE_USER'),
@@ -67,21 +94,12 @@ PRIVATE_KEY = os.getenv('PRIVATE_KEY')
 
 print(f"🔗 Configurando Web3 con URL: {SEPOLIA_URL}")
 
-# Inicializar Web3
-w3 = Web3(Web3.HTTPProvider(SEPOLIA_URL))
-
-# Cargar direcciones de contratos
-try:
-    with open('../blockchain/contract-addresses-sepolia.json', 'r') as f:
-        contract_addresses = json.load(f)
-        print(f"✅ Contratos cargados: {list(contract_addresses.keys())}")
-except FileNotFoundError:
-    print("⚠️ Archivo de contratos no encontrado, usando direcciones por defecto")
-    contract_addresses = {
-        "MedicalRecords": "0x0000000000000000000000000000000000000000",
-        "PatientConsent": "0x0000000000000000000000000000000000000000", 
-        "MedicalAudit": "0x0000000000000000000000000000000000000000"
-    }
+# Direcciones desde el registro compartido (sin I/O al importar)
+contract_registry = get_registry(SEPOLIA_URL, 'contract-addresses-sepolia.json')
+
+def contract_addresses():
+    """Direcciones de contratos (el archivo se lee una sola vez)"""
+    return contract_registry.addresses or {name: ZERO_ADDRESS for name in CONTRACT_NAMES}
 
 # Modelos Pydantic
 class UserRegister(BaseModel):
@@ -163,29 +181,99 @@ class PacienteRegistroOriginal(BaseModel):
     clasificacion_riesgo: str
     notas_evolucion: Optional[str] = None
 
-# Función para conectar a Snowflake
-def get_snowflake_connection():
-    try:
-        conn = snowflake.connector.connect(**SNOWFLAKE_CONFIG)
-        return conn
-    except Exception as e:
-        print(f"Error conectando a Snowflake: {str(e)}")
-        return None
+# Pool de conexiones a Snowflake (compartido por todos los endpoints)
+snowflake_pool = get_pool(SNOWFLAKE_CONFIG)
+
+# Executors dedicados: las consultas lentas no bloquean al resto de rutas
+warehouse_executor = warehouse_executor_from_env()
+rpc_executor = rpc_executor_from_env()
+install_backpressure_handlers(app)
+get_db_connection = make_async_connection_dependency(snowflake_pool, warehouse_executor)
+
+@app.on_event("shutdown")
+def close_snowflake_pool():
+    snowflake_pool.close()
+    warehouse_executor.shutdown()
+    get_db_connection.acquirer.shutdown()
+    rpc_executor.shutdown()
+
+# Conteo aproximado de pacientes por filtro (evita un COUNT(*) por página)
+pacientes_count_cache = CountCache(ttl=float(os.getenv('PACIENTES_COUNT_TTL', '60')))
+EXPORT_BATCH_SIZE = int(os.getenv('PACIENTES_EXPORT_BATCH', '1000'))
+
+# Caché de lectura del detalle de pacientes (se invalida al registrar)
+paciente_cache = paciente_cache_from_env()
+
+# Registro masivo de pacientes
+LOTE_MAX_FILAS = int(os.getenv('PACIENTES_LOTE_MAX', '50000'))
+LOTE_BATCH_SIZE = int(os.getenv('PACIENTES_LOTE_BATCH', '1000'))
+
+# Último bloque y chain_id en memoria (proveedor web3 asíncrono con sesión persistente)
+chain_head = ChainHead(
+    SEPOLIA_URL,
+    poll_interval=float(os.getenv('BLOCKCHAIN_HEAD_POLL_INTERVAL', '2')),
+    timeout=float(os.getenv('BLOCKCHAIN_RPC_TIMEOUT', '5'))
+)
+
+@app.on_event("startup")
+async def start_chain_head():
+    chain_head.start()
+
+@app.on_event("shutdown")
+async def stop_chain_head():
+    await chain_head.stop()
+
+# Outbox de verificación blockchain: ancla los pacientes registrados por lotes Merkle
+blockchain = MedicalBlockchain(registry=contract_registry)
+blockchain_outbox = outbox_worker_from_env(
+    snowflake_pool, blockchain,
+    on_confirmed=lambda paciente_ids: paciente_cache.invalidate(*paciente_ids)
+)
+
+@app.on_event("startup")
+def start_blockchain_outbox():
+    blockchain_outbox.start()
+
+@app.on_event("shutdown")
+def stop_blockchain_outbox():
+    blockchain_outbox.stop()
+    blockchain.close()
+
+# Monitor de salud: sondea Snowflake y la RPC en segundo plano
+health_monitor = HealthMonitor(interval=float(os.getenv('HEALTH_CHECK_INTERVAL', '15')))
+# El check lee la cabeza en memoria: el seguimiento del nodo lo hace ChainHead
+health_monitor.register("blockchain", lambda: chain_head.snapshot())
+health_monitor.register("snowflake", lambda: snowflake_pool.ping(timeout=5))
+
+@app.on_event("startup")
+def start_health_monitor():
+    health_monitor.start()
+
+@app.on_event("shutdown")
+def stop_health_monitor():
+    health_monitor.stop()
+
+# Estadísticas del dashboard: se recalculan en segundo plano y se sirven desde memoria
+dashboard_stats = DashboardStats(
+    snowflake_pool,
+    interval=float(os.getenv('DASHBOARD_REFRESH_INTERVAL', '60')),
+    max_staleness=float(os.getenv('DASHBOARD_MAX_STALENESS', '300'))
+)
+
+@app.on_event("startup")
+def start_dashboard_stats():
+    dashboard_stats.start()
+
+@app.on_event("shutdown")
+def stop_dashboard_stats():
+    dashboard_stats.stop()
 
 # Función para verificar token JWT
-def verify_token(authorization: str = Header(None)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token requerido")
-    
-    token = authorization.split(" ")[1]
+async def verify_token(authorization: str = Header(None)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        return payload
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
+        return token_verifier.verify_header(authorization)
+    except InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=e.detail)
 
 # Función para crear token JWT
 def create_access_token(data: dict):
@@ -211,222 +299,92 @@ def verify_user(username: str, password: str):
         return users[username]
     return None
 
-# Endpoints
-@app.get("/")
-def root():
-    """Página de inicio del sistema"""
-    return FileResponse("../PrediSalud/templates/index.html")
-
 @app.get("/api/status")
-def api_status():
+async def api_status():
     """Status de la API (el JSON que antes estaba en /)"""
     return {
         "message": "Sistema Médico BI API",
         "version": "1.0.0",
         "status": "running",
-        "blockchain": "connected" if w3.is_connected() else "disconnected"
+        "blockchain": health_monitor.snapshot()["blockchain"]
     }
 
-@app.get("/login")
-def serve_login():
-    return FileResponse("../PrediSalud/templates/login.html")
-
-@app.get("/login.html")
-def serve_login_html():
-    return FileResponse("../PrediSalud/templates/login.html")
-
-@app.get("/login-new")
-def serve_login_new():
-    return FileResponse("../PrediSalud/templates/login.html")
-
-@app.get("/dashboard")
-def serve_dashboard():
-    return FileResponse("../PrediSalud/templates/dashboard_mejorado.html")
-
-@app.get("/dashboard.html")
-def serve_dashboard_html():
-    return FileResponse("../PrediSalud/templates/dashboard_mejorado.html")
-
-@app.get("/dashboard2.html")
-def serve_dashboard2():
-    """Servir dashboard principal del sistema médico"""
-    return FileResponse("../PrediSalud/templates/dashboard2.html")
-
-@app.get("/registro")
-def serve_registro():
-    return FileResponse("../PrediSalud/templates/registro.html")
-
 @app.post("/api/auth/logout")
-def logout_user():
-    """Endpoint de logout - solo confirma el logout del lado del servidor"""
+async def logout_user(authorization: str = Header(None)):
+    """Endpoint de logout - revoca el token hasta su expiración"""
+    if authorization and authorization.startswith("Bearer "):
+        token_verifier.revoke(token_from_header(authorization))
     return {
         "status": "success",
         "message": "Sesión cerrada exitosamente"
     }
 
-# Endpoints adicionales para las páginas del dashboard
-@app.get("/index.html")
-def serve_index():
-    return FileResponse("../PrediSalud/templates/index.html")
-
-@app.get("/dashboard-analytics.html")
-def serve_dashboard_analytics():
-    return FileResponse("../PrediSalud/templates/dashboard-analytics.html")
-
-@app.get("/table-databases.html")
-def serve_table_databases():
-    return FileResponse("../PrediSalud/templates/table-databases.html")
-
-@app.get("/registro.html")
-def serve_registro_html():
-    return FileResponse("../PrediSalud/templates/registro.html")
-
-@app.get("/about.html")
-def serve_about():
-    return FileResponse("../PrediSalud/templates/about.html")
-
-@app.get("/contact.html")
-def serve_contact():
-    return FileResponse("../PrediSalud/templates/contact.html")
-
-@app.get("/service.html")
-def serve_service():
-    return FileResponse("../PrediSalud/templates/service.html")
-
-@app.get("/appoinment.html")
-def serve_appointment():
-    return FileResponse("../PrediSalud/templates/appoinment.html")
-
-@app.get("/department.html")
-def serve_department():
-    return FileResponse("../PrediSalud/templates/department.html")
-
-@app.get("/doctor.html")
-def serve_doctor():
-    return FileResponse("../PrediSalud/templates/doctor.html")
-
-@app.get("/calendar.html")
-def serve_calendar():
-    # Si no existe calendar.html, redirigir a agenda médica disponible
-    return FileResponse("../PrediSalud/templates/appoinment.html")
-
-@app.get("/registro_pacientes.html")
-def serve_registro_pacientes():
-    return FileResponse("../PrediSalud/templates/registro_pacientes.html")
-
-@app.get("/dashboard_mejorado.html")
-def serve_dashboard_mejorado():
-    return FileResponse("../PrediSalud/templates/dashboard_mejorado.html")
-
-# Páginas de análisis y grupos de riesgo
-@app.get("/grupos_riesgo_professional.html")
-def serve_grupos_riesgo_professional():
-    return FileResponse("../PrediSalud/templates/grupos_riesgo_professional.html")
-
-@app.get("/grupos_riesgo_glassmorphism.html")
-def serve_grupos_riesgo_glassmorphism():
-    return FileResponse("../PrediSalud/templates/grupos_riesgo_glassmorphism.html")
-
-@app.get("/analisis_tratamientos.html")
-def serve_analisis_tratamientos():
-    return FileResponse("../PrediSalud/templates/analisis_tratamientos.html")
-
-@app.get("/blockchain_records.html")
-def serve_blockchain_records():
-    return FileResponse("../PrediSalud/templates/blockchain_records.html")
-
-@app.get("/dashboard_principal.html")
-def serve_dashboard_principal():
-    return FileResponse("../PrediSalud/templates/dashboard_principal.html")
-
-@app.get("/dashboard_sigma.html")
-def serve_dashboard_sigma():
-    return FileResponse("../PrediSalud/templates/dashboard_sigma.html")
-
-# Redirecciones para páginas que no existen a páginas relevantes
-@app.get("/form_elements.html")
-def serve_form_elements():
-    # Redirigir a registro de pacientes
-    return FileResponse("../PrediSalud/templates/registro_pacientes.html")
-
-@app.get("/table_basic.html")
-def serve_table_basic():
-    # Redirigir a tabla de bases de datos
-    return FileResponse("../PrediSalud/templates/table-databases.html")
-
-@app.get("/chart-inline.html")
-def serve_chart_inline():
-    # Redirigir a dashboard de análisis
-    return FileResponse("../PrediSalud/templates/dashboard-analytics.html")
-
-@app.get("/datamaps.html")
-def serve_datamaps():
-    # Redirigir a análisis de grupos de riesgo
-    return FileResponse("../PrediSalud/templates/grupos_riesgo_professional.html")
-
-# Endpoints genéricos para páginas en desarrollo
-@app.get("/form_advanced.html")
-def serve_form_advanced():
-    return FileResponse("../PrediSalud/templates/dashboard-analytics.html")
-
-@app.get("/form_validation.html")
-def serve_form_validation():
-    return FileResponse("../PrediSalud/templates/grupos_riesgo_professional.html")
-
-@app.get("/form_wizard.html")
-def serve_form_wizard():
-    return FileResponse("../PrediSalud/templates/dashboard-analytics.html")
-
-@app.get("/table_advanced.html")
-def serve_table_advanced():
-    return FileResponse("../PrediSalud/templates/table-databases.html")
-
-@app.get("/table_datatables.html")
-def serve_table_datatables():
-    return FileResponse("../PrediSalud/templates/table-databases.html")
-
-@app.get("/chart-chartjs.html")
-def serve_chart_chartjs():
-    return FileResponse("../PrediSalud/templates/dashboard-analytics.html")
-
-@app.get("/chart-apexcharts.html")
-def serve_chart_apexcharts():
-    return FileResponse("../PrediSalud/templates/dashboard-analytics.html")
-
-# Endpoint genérico para páginas HTML no definidas (al final)
-from fastapi import Request
-from fastapi.responses import HTMLResponse
-import os
-
-@app.get("/{page_name}.html")
-def serve_generic_html_page(page_name: str):
-    """Endpoint genérico para páginas HTML no definidas"""
-    file_path = f"PrediSalud/templates/{page_name}.html"
-    
-    # Verificar si el archivo existe
-    if os.path.exists(file_path):
-        return FileResponse(file_path)
-    else:
-        # Si no existe, redirigir al index
-        return FileResponse("../PrediSalud/templates/index.html")
+# Páginas HTML: indexadas y precomprimidas al arrancar (alias declarados en PAGE_ALIASES)
+static_pages = StaticPageTable(
+    "../PrediSalud/templates", PAGE_ALIASES,
+    max_age=int(os.getenv('STATIC_PAGES_MAX_AGE', '300'))
+)
+static_pages.install(app)
 
 @app.get("/api/health")
-def health_check():
+async def health_check():
+    """Último estado de Snowflake y blockchain (cacheado por el monitor)"""
+    return health_monitor.snapshot()
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """Liveness: el proceso responde, sin tocar dependencias"""
+    return {"status": "alive", "monitor": "running" if health_monitor.is_alive() else "stopped"}
+
+@app.get("/api/health/ready")
+async def readiness_check():
+    """Readiness: dependencias disponibles según un sondeo reciente"""
+    snapshot = health_monitor.snapshot()
+    if not health_monitor.is_ready():
+        return JSONResponse(status_code=503, content=snapshot)
+    return snapshot
+
+@app.get("/api/metrics/snowflake-pool")
+async def snowflake_pool_metrics():
+    """Métricas del pool de conexiones Snowflake"""
+    return snowflake_pool.metrics()
+
+@app.get("/api/metrics/executors")
+async def executor_metrics():
+    """Ocupación de los executors de warehouse (SQL y espera de conexiones) y RPC"""
     return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "blockchain": "connected" if w3.is_connected() else "disconnected",
-        "snowflake": "connected" if get_snowflake_connection() else "disconnected"
+        "warehouse": warehouse_executor.metrics(),
+        "warehouse_acquire": get_db_connection.acquirer.metrics(),
+        "rpc": rpc_executor.metrics()
     }
 
+@app.get("/api/metrics/auth")
+async def auth_metrics():
+    """Aciertos del cache de tokens y tokens revocados"""
+    return token_verifier.metrics()
+
+@app.get("/api/metrics/static-pages")
+async def static_pages_metrics():
+    """Páginas HTML indexadas y bytes por variante de compresión"""
+    return static_pages.metrics()
+
+@app.get("/api/metrics/pacientes-cache")
+async def paciente_cache_metrics():
+    """Aciertos, fallos y memoria de la caché de pacientes"""
+    return paciente_cache.metrics()
+
+@app.get("/api/metrics/blockchain-outbox")
+async def blockchain_outbox_metrics():
+    """Trabajos de verificación blockchain por estado, lotes y reintentos"""
+    return await warehouse_executor.run(blockchain_outbox.metrics)
+
 @app.post("/api/auth/register")
-def register_user(user: UserRegister):
+async def register_user(user: UserRegister, conn=Depends(get_db_connection)):
+    """Registrar nuevo usuario"""
+    return await warehouse_executor.run(_register_user, conn, user)
+
+def _register_user(conn, user):
     try:
-        # Verificar si el usuario ya existe
-        conn = get_snowflake_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
-        
         cursor = conn.cursor()
         
         # Verificar si el usuario existe
@@ -447,7 +405,6 @@ def register_user(user: UserRegister):
         
         conn.commit()
         cursor.close()
-        conn.close()
         
         return {
             "message": "Usuario registrado exitosamente",
@@ -459,7 +416,7 @@ def register_user(user: UserRegister):
         raise HTTPException(status_code=500, detail=f"Error registrando usuario: {str(e)}")
 
 @app.post("/api/auth/login")
-def login_user(user: UserLogin):
+async def login_user(user: UserLogin):
     try:
         # Verificar usuario
         user_data = verify_user(user.username, user.password)
@@ -484,99 +441,76 @@ def login_user(user: UserLogin):
         raise HTTPException(status_code=500, detail=f"Error en login: {str(e)}")
 
 @app.post("/api/auth/verify")
-def verify_token_endpoint(authorization: str = Header(None)):
+async def verify_token_endpoint(payload: dict = Depends(verify_token)):
     """Verificar token JWT"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token requerido")
-    
-    token = authorization.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        return {"username": username, "valid": True}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    return {"username": payload["sub"], "valid": True}
 
 @app.get("/api/auth/verify")
-def verify_token_get(authorization: str = Header(None)):
+async def verify_token_get(payload: dict = Depends(verify_token)):
     """Verificar token JWT (GET method)"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token requerido")
-    
-    token = authorization.split(" ")[1]
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Token inválido")
-        return {"username": username, "valid": True}
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Token inválido")
+    return {"username": payload["sub"], "valid": True}
 
 @app.get("/api/dashboard/stats")
-def get_dashboard_stats(authorization: str = Header(None)):
+async def get_dashboard_stats(payload: dict = Depends(verify_token)):
     """Obtener estadísticas del dashboard"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Token requerido")
-    
     try:
-        # Simular estadísticas (en producción, consultarías Snowflake)
-        stats = {
-            "patient_count": 1250,
-            "consultations_today": 45,
-            "blockchain_records": 892,
-            "active_users": 23
+        # Resumen precalculado por el hilo de refresco; el request nunca consulta Snowflake
+        resumen = dashboard_stats.current()
+        return {
+            "patient_count": resumen["total_pacientes"],
+            "consultations_today": resumen["consultas_hoy"],
+            "blockchain_records": resumen["registros_blockchain"],
+            "active_users": resumen["usuarios_activos"],
+            "computed_at": resumen["computed_at"],
+            "age_seconds": resumen["age_seconds"]
         }
-        return stats
+    except StatsUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
 
 @app.get("/api/blockchain/status")
-def get_blockchain_status():
-    """Obtener estado de la conexión blockchain"""
-    try:
-        is_connected = w3.is_connected()
-        
-        if is_connected:
-            chain_id = w3.eth.chain_id
-            network_name = "sepolia" if chain_id == 11155111 else f"chain_{chain_id}"
-            
-            return {
-                "status": "connected",
-                "network_id": chain_id,
-                "network_name": network_name,
-                "latest_block": w3.eth.block_number,
-                "contracts": contract_addresses,
-                "rpc_url": SEPOLIA_URL,
-                "message": f"✅ Conectado a {network_name}"
-            }
-        else:
-            return {
-                "status": "disconnected",
-                "network_id": None,
-                "network_name": "unknown",
-                "latest_block": None,
-                "contracts": {},
-                "rpc_url": SEPOLIA_URL,
-                "message": "❌ No conectado a blockchain"
-            }
-    except Exception as e:
+async def get_blockchain_status():
+    """Obtener estado de la conexión blockchain (desde memoria, sin RPC por request)"""
+    head = chain_head.snapshot()
+    
+    if head["connected"]:
+        chain_id = head["chain_id"]
+        network_name = "sepolia" if chain_id == 11155111 else f"chain_{chain_id}"
+        
+        return {
+            "status": "connected",
+            "network_id": chain_id,
+            "network_name": network_name,
+            "latest_block": head["latest_block"],
+            "updated_at": head["updated_at"],
+            "contracts": contract_addresses(),
+            "rpc_url": SEPOLIA_URL,
+            "message": f"✅ Conectado a {network_name}"
+        }
+    if head["error"]:
         return {
             "status": "error",
-            "error": str(e),
-            "message": f"❌ Error: {str(e)}"
+            "error": head["error"],
+            "message": f"❌ Error: {head['error']}"
         }
+    return {
+        "status": "disconnected",
+        "network_id": None,
+        "network_name": "unknown",
+        "latest_block": None,
+        "contracts": {},
+        "rpc_url": SEPOLIA_URL,
+        "message": "❌ No conectado a blockchain"
+    }
 
 @app.post("/api/pacientes/registrar")
-def registrar_paciente(paciente: PacienteRegistro, payload: dict = Depends(verify_token)):
+async def registrar_paciente(paciente: PacienteRegistro, payload: dict = Depends(verify_token), conn=Depends(get_db_connection)):
     """Registrar un nuevo paciente"""
+    return await warehouse_executor.run(_registrar_paciente, conn, paciente)
+
+def _registrar_paciente(conn, paciente):
     try:
-        conn = get_snowflake_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
-        
         cursor = conn.cursor()
         
         # Verificar si el paciente ya existe por DNI
@@ -590,71 +524,104 @@ def registrar_paciente(paciente: PacienteRegistro, payload: dict = Depends(verif
             raise HTTPException(status_code=400, detail="Ya existe un paciente con este DNI")
         
         # Generar ID único para el paciente
-        import uuid
-        paciente_id = f"P{str(uuid.uuid4())[:8].upper()}"
+        paciente_id = nuevo_paciente_id()
         
         # Insertar paciente
-        cursor.execute("""
-            INSERT INTO PACIENTES (
-                ID_PACIENTE, NOMBRE, APELLIDO, FECHA_NACIMIENTO, GENERO, DNI, TELEFONO,
-                EMAIL, DIRECCION, CIUDAD, CODIGO_POSTAL, GRUPO_SANGUINEO,
-                ALERGIAS, MEDICAMENTOS, ANTECEDENTES,
-                CONTACTO_EMERGENCIA_NOMBRE, CONTACTO_EMERGENCIA_RELACION, CONTACTO_EMERGENCIA_TELEFONO,
-                CONSENTIMIENTO_DATOS, CONSENTIMIENTO_EMERGENCIA, CONSENTIMIENTO_INVESTIGACION,
-                FECHA_REGISTRO, VERIFICACION_BLOCKCHAIN
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP(), FALSE
-            )
-        """, (
-            paciente_id, paciente.nombre, paciente.apellidos, paciente.fecha_nacimiento,
-            paciente.genero, paciente.dni, paciente.telefono, paciente.email,
-            paciente.direccion, paciente.ciudad, paciente.codigo_postal,
-            paciente.grupo_sanguineo, paciente.alergias, paciente.medicamentos,
-            paciente.antecedentes, paciente.contacto_emergencia_nombre,
-            paciente.contacto_emergencia_relacion, paciente.contacto_emergencia_telefono,
-            paciente.consentimiento_datos, paciente.consentimiento_emergencia,
-            paciente.consentimiento_investigacion
-        ))
-        
-        # El ID del paciente ya fue generado arriba
-        
-        # Crear registro en blockchain (simulado)
-        try:
-            # Aquí iría la lógica real de blockchain
-            blockchain_hash = f"0x{paciente_id:064x}"
-            
-            # Actualizar verificación blockchain
-            cursor.execute(
-                "UPDATE PACIENTES SET VERIFICACION_BLOCKCHAIN = TRUE WHERE ID_PACIENTE = %s",
-                (paciente_id,)
-            )
-            
-        except Exception as e:
-            print(f"Error en blockchain: {str(e)}")
-            # Continuar sin blockchain si hay error
+        params = paciente_insert_params(paciente_id, paciente)
+        cursor.execute(INSERT_PACIENTE_SQL, params)
+        
+        # Verificación blockchain: el trabajo se confirma junto con el paciente y
+        # el outbox lo ancla en segundo plano
+        encolar_verificaciones(cursor, [(paciente_id, params)])
         
         conn.commit()
         cursor.close()
-        conn.close()
+        paciente_cache.invalidate(paciente_id)
+        pacientes_count_cache.clear()
+        blockchain_outbox.notify()
         
         return {
             "message": "Paciente registrado exitosamente",
             "paciente_id": paciente_id,
-            "blockchain_verified": True
+            "blockchain_verified": False,
+            "blockchain_status": ESTADO_PENDIENTE
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error registrando paciente: {str(e)}")
 
+@app.post("/api/pacientes/registrar-lote")
+async def registrar_pacientes_lote(request: Request, payload: dict = Depends(verify_token), conn=Depends(get_db_connection)):
+    """Registrar pacientes en lote desde un arreglo JSON o un archivo CSV"""
+    filas = await _leer_filas_lote(request)
+    if len(filas) > LOTE_MAX_FILAS:
+        raise HTTPException(status_code=413, detail=f"Máximo {LOTE_MAX_FILAS} pacientes por lote")
+    
+    # Validar cada fila con el mismo modelo del registro individual
+    pacientes = []
+    resultados = {}
+    for indice, fila in enumerate(filas):
+        try:
+            pacientes.append((indice, PacienteRegistro(**fila)))
+        except (ValidationError, TypeError) as e:
+            dni = fila.get("dni") if isinstance(fila, dict) else None
+            resultados[indice] = {"fila": indice, "dni": dni, "status": "invalido", "error": str(e)}
+    
+    if pacientes:
+        resultados.update(await warehouse_executor.run(_registrar_lote, conn, pacientes))
+    
+    ordenados = [resultados[indice] for indice in range(len(filas))]
+    resumen = {}
+    for resultado in ordenados:
+        resumen[resultado["status"]] = resumen.get(resultado["status"], 0) + 1
+    
+    return {
+        "message": "Lote procesado",
+        "total": len(filas),
+        "registrados": resumen.get("registrado", 0),
+        "duplicados": resumen.get("duplicado", 0),
+        "invalidos": resumen.get("invalido", 0),
+        "errores": resumen.get("error", 0),
+        "resultados": ordenados
+    }
+
+def _registrar_lote(conn, pacientes):
+    resultados = registrar_lote(conn, pacientes, LOTE_BATCH_SIZE)
+    registrados = [r["paciente_id"] for r in resultados.values() if r["status"] == "registrado"]
+    if registrados:
+        paciente_cache.invalidate(*registrados)
+        pacientes_count_cache.clear()
+        blockchain_outbox.notify()
+    return resultados
+
+async def _leer_filas_lote(request):
+    """Filas del lote según el Content-Type: JSON, text/csv o multipart con campo 'file'"""
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            archivo = form.get("file")
+            if archivo is None:
+                raise HTTPException(status_code=400, detail="Falta el archivo CSV en el campo 'file'")
+            return leer_csv_pacientes((await archivo.read()).decode("utf-8-sig"))
+        if content_type.startswith("text/csv"):
+            return leer_csv_pacientes((await request.body()).decode("utf-8-sig"))
+        filas = await request.json()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Cuerpo del lote inválido: {str(e)}")
+    if not isinstance(filas, list):
+        raise HTTPException(status_code=400, detail="Se esperaba un arreglo JSON de pacientes")
+    return filas
+
 @app.post("/api/pacientes/registrar-original")
-def registrar_paciente_original(paciente: PacienteRegistroOriginal, payload: dict = Depends(verify_token)):
+async def registrar_paciente_original(paciente: PacienteRegistroOriginal, payload: dict = Depends(verify_token), conn=Depends(get_db_connection)):
     """Registrar un nuevo paciente usando el formulario original"""
+    return await warehouse_executor.run(_registrar_paciente_original, conn, paciente)
+
+def _registrar_paciente_original(conn, paciente):
     try:
-        conn = get_snowflake_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
-        
         cursor = conn.cursor()
         
         # Verificar si el paciente ya existe por ID
@@ -668,18 +635,7 @@ def registrar_paciente_original(paciente: PacienteRegistroOriginal, payload: dic
             raise HTTPException(status_code=400, detail="Ya existe un paciente con este ID")
         
         # Insertar paciente con datos del formulario original
-        cursor.execute("""
-            INSERT INTO PACIENTES (
-                ID_PACIENTE, NOMBRE, APELLIDO, FECHA_NACIMIENTO, GENERO, 
-                DOMICILIO_COMPLETO, MUNICIPIO, CODIGO_POSTAL, ALERGIAS, 
-                ANTECEDENTES_PERSONALES, CONSENTIMIENTO_DATOS, 
-                FECHA_CONSULTA, HORA_CONSULTA, SINTOMAS, CLASIFICACION_RIESGO,
-                FECHA_REGISTRO, VERIFICACION_BLOCKCHAIN
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                CURRENT_TIMESTAMP(), FALSE
-            )
-        """, (
+        params = (
             paciente.id_paciente, 
             paciente.nombre_completo.split()[0] if paciente.nombre_completo else None,  # Primer nombre
             " ".join(paciente.nombre_completo.split()[1:]) if paciente.nombre_completo and len(paciente.nombre_completo.split()) > 1 else None,  # Apellidos
@@ -695,86 +651,132 @@ def registrar_paciente_original(paciente: PacienteRegistroOriginal, payload: dic
             paciente.hora_consulta,
             paciente.sintomas,
             paciente.clasificacion_riesgo
-        ))
-        
-        # Crear registro en blockchain (simulado)
-        try:
-            blockchain_hash = f"0x{hash(paciente.id_paciente):064x}"
-            
-            # Actualizar verificación blockchain
-            cursor.execute(
-                "UPDATE PACIENTES SET VERIFICACION_BLOCKCHAIN = TRUE WHERE ID_PACIENTE = %s",
-                (paciente.id_paciente,)
+        )
+        cursor.execute("""
+            INSERT INTO PACIENTES (
+                ID_PACIENTE, NOMBRE, APELLIDO, FECHA_NACIMIENTO, GENERO, 
+                DOMICILIO_COMPLETO, MUNICIPIO, CODIGO_POSTAL, ALERGIAS, 
+                ANTECEDENTES_PERSONALES, CONSENTIMIENTO_DATOS, 
+                FECHA_CONSULTA, HORA_CONSULTA, SINTOMAS, CLASIFICACION_RIESGO,
+                FECHA_REGISTRO, VERIFICACION_BLOCKCHAIN
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+                CURRENT_TIMESTAMP(), FALSE
             )
-            
-        except Exception as e:
-            print(f"Error en blockchain: {str(e)}")
+        """, params)
+        
+        # Verificación blockchain encolada en la misma transacción
+        encolar_verificaciones(cursor, [(paciente.id_paciente, params)])
         
         conn.commit()
         cursor.close()
-        conn.close()
+        paciente_cache.invalidate(paciente.id_paciente)
+        pacientes_count_cache.clear()
+        blockchain_outbox.notify()
         
         return {
             "success": True,
             "message": "Paciente registrado exitosamente",
             "paciente_id": paciente.id_paciente,
-            "blockchain_verified": True
+            "blockchain_verified": False,
+            "blockchain_status": ESTADO_PENDIENTE
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error registrando paciente: {str(e)}")
 
 @app.get("/api/pacientes")
-def obtener_pacientes(payload: dict = Depends(verify_token)):
-    """Obtener lista de pacientes"""
+async def obtener_pacientes(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    genero: Optional[str] = None,
+    verificado: Optional[bool] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    payload: dict = Depends(verify_token),
+    conn=Depends(get_db_connection)
+):
+    """Obtener lista de pacientes paginada por cursor (FECHA_REGISTRO, ID_PACIENTE)"""
     try:
-        conn = get_snowflake_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
-        
-        cursor = conn.cursor()
-        
-        # Obtener pacientes con paginación
-        cursor.execute("""
-            SELECT ID_PACIENTE, NOMBRE, APELLIDO, DNI, TELEFONO, 
-                   FECHA_NACIMIENTO, GENERO, VERIFICACION_BLOCKCHAIN
-            FROM PACIENTES 
-            ORDER BY FECHA_REGISTRO DESC 
-            LIMIT 50
-        """)
-        
-        pacientes = []
-        for row in cursor.fetchall():
-            pacientes.append({
-                "id": row[0],
-                "nombre": row[1],
-                "apellidos": row[2],
-                "dni": row[3],
-                "telefono": row[4],
-                "fecha_nacimiento": str(row[5]),
-                "genero": row[6],
-                "blockchain_verified": row[7]
-            })
+        position = decode_cursor(cursor) if cursor else None
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = build_filters(genero, verificado, desde, hasta)
+    return await warehouse_executor.run(_obtener_pacientes, conn, filters, position, limit)
+
+def _obtener_pacientes(conn, filters, position, limit):
+    try:
+        rows, next_cursor = fetch_page(conn, filters, position, limit)
         
-        cursor.close()
-        conn.close()
+        # Total aproximado: se cachea por combinación de filtros
+        total = pacientes_count_cache.get_or_compute(
+            repr(filters), lambda: count_pacientes(conn, filters)
+        )
         
         return {
-            "pacientes": pacientes,
-            "total": len(pacientes)
+            "pacientes": [row_to_paciente(row) for row in rows],
+            "total": total,
+            "count": len(rows),
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo pacientes: {str(e)}")
 
+@app.get("/api/pacientes/export")
+async def exportar_pacientes(
+    genero: Optional[str] = None,
+    verificado: Optional[bool] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    payload: dict = Depends(verify_token)
+):
+    """Exportar pacientes en NDJSON por streaming, sin cargar todo el resultado en memoria"""
+    filters = build_filters(genero, verificado, desde, hasta)
+    conn = await warehouse_executor.run(snowflake_pool.acquire)
+    try:
+        cursor = await warehouse_executor.run(_abrir_export_pacientes, conn, filters)
+    except Exception as e:
+        await warehouse_executor.run_unbounded(snowflake_pool.release, conn, discard=is_connection_broken(conn))
+        raise HTTPException(status_code=500, detail=f"Error exportando pacientes: {str(e)}")
+
+    async def generar_ndjson():
+        try:
+            while True:
+                rows = await warehouse_executor.run_unbounded(cursor.fetchmany, EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield "".join(json.dumps(row_to_paciente(row), default=str) + "\n" for row in rows)
+        finally:
+            cursor.close()
+            await warehouse_executor.run_unbounded(snowflake_pool.release, conn)
+
+    return StreamingResponse(generar_ndjson(), media_type="application/x-ndjson")
+
+def _abrir_export_pacientes(conn, filters):
+    sql, params = build_page_query(filters)
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    return cursor
+
 @app.get("/api/pacientes/{paciente_id}")
-def obtener_paciente(paciente_id: int, payload: dict = Depends(verify_token)):
+async def obtener_paciente(paciente_id: str, payload: dict = Depends(verify_token)):
     """Obtener información detallada de un paciente"""
+    # Acierto en memoria: se responde sin pasar por el executor ni el pool
+    paciente = paciente_cache.peek_local(paciente_id)
+    if paciente is not None:
+        return paciente
+    return await warehouse_executor.run(_obtener_paciente_cacheado, paciente_id)
+
+def _obtener_paciente_cacheado(paciente_id):
+    def cargar():
+        with snowflake_pool.connection() as conn:
+            return _obtener_paciente(conn, paciente_id)
+    return paciente_cache.get_or_load(paciente_id, cargar)
+
+def _obtener_paciente(conn, paciente_id):
     try:
-        conn = get_snowflake_connection()
-        if not conn:
-            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
-        
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -792,15 +794,27 @@ def obtener_paciente(paciente_id: int, payload: dict = Depends(verify_token)):
         paciente_data = dict(zip(columns, row))
         
         cursor.close()
-        conn.close()
         
         return paciente_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error obteniendo paciente: {str(e)}")
 
+@app.get("/api/pacientes/{paciente_id}/blockchain")
+async def verificacion_blockchain_paciente(paciente_id: str, payload: dict = Depends(verify_token), conn=Depends(get_db_connection)):
+    """Estado de la verificación blockchain del paciente (raíz, prueba Merkle y transacción)"""
+    return await warehouse_executor.run(_verificacion_blockchain_paciente, conn, paciente_id)
+
+def _verificacion_blockchain_paciente(conn, paciente_id):
+    estado = estado_verificacion(conn, paciente_id)
+    if estado is None:
+        raise HTTPException(status_code=404, detail="El paciente no tiene verificación blockchain")
+    return estado
+
 @app.post("/api/blockchain/medical-record")
-def create_medical_record(record: MedicalRecordCreate, payload: dict = Depends(verify_token)):
+async def create_medical_record(record: MedicalRecordCreate, payload: dict = Depends(verify_token)):
     """Crear registro médico en blockchain"""
     try:
         # Simular creación en blockchain
@@ -817,7 +831,7 @@ def create_medical_record(record: MedicalRecordCreate, payload: dict = Depends(v
         raise HTTPException(status_code=500, detail=f"Error en blockchain: {str(e)}")
 
 @app.post("/api/blockchain/consent")
-def update_patient_consent(consent: PatientConsentUpdate, payload: dict = Depends(verify_token)):
+async def update_patient_consent(consent: PatientConsentUpdate, payload: dict = Depends(verify_token)):
     """Actualizar consentimiento del paciente en blockchain"""
     try:
         # Simular actualización en blockchain
@@ -834,7 +848,7 @@ def update_patient_consent(consent: PatientConsentUpdate, payload: dict = Depend
         raise HTTPException(status_code=500, detail=f"Error en blockchain: {str(e)}")
 
 @app.post("/api/blockchain/audit-log")
-def create_audit_log(audit: AuditLogCreate, payload: dict = Depends(verify_token)):
+async def create_audit_log(audit: AuditLogCreate, payload: dict = Depends(verify_token)):
     """Crear log de auditoría en blockchain"""
     try:
         # Simular creación en blockchain
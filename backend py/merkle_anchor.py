@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Anclaje de registros médicos por lotes con raíces Merkle
+Los hashes de los registros se acumulan N registros o T segundos y se escribe una sola
+raíz en MedicalRecords.sol; las pruebas de inclusión de cada registro quedan en el warehouse
+"""
+
+import collections
+import json
+import os
+import threading
+import time
+
+from async_executors import ExecutorSaturatedError
+
+ESTADO_PENDIENTE = "PENDIENTE"
+ESTADO_ANCLADO = "ANCLADO"
+
+INSERT_PENDIENTE_SQL = """
+    INSERT INTO REGISTROS_ANCLADOS (
+        HASH_REGISTRO, ID_PACIENTE, DIAGNOSTICO, TRATAMIENTO, TIMESTAMP_REGISTRO,
+        DOCTOR, ESTADO, FECHA_CREACION
+    ) VALUES (%s, %s, %s, %s, %s, %s, 'PENDIENTE', CURRENT_TIMESTAMP())
+"""
+
+UPDATE_ANCLADO_SQL = """
+    UPDATE REGISTROS_ANCLADOS
+    SET RAIZ_MERKLE = %s, PRUEBA_MERKLE = %s, INDICE_LOTE = %s, TX_HASH = %s,
+        BLOQUE = %s, ESTADO = 'ANCLADO', FECHA_ANCLAJE = CURRENT_TIMESTAMP()
+    WHERE HASH_REGISTRO = %s
+"""
+
+SELECT_COLUMNS = (
+    "HASH_REGISTRO", "ID_PACIENTE", "DIAGNOSTICO", "TRATAMIENTO", "TIMESTAMP_REGISTRO",
+    "DOCTOR", "RAIZ_MERKLE", "PRUEBA_MERKLE", "INDICE_LOTE", "TX_HASH", "BLOQUE", "ESTADO",
+)
+
+
+# --- árbol Merkle (pares ordenados, igual que verifyAnchoredRecord) ---------
+
+def _keccak(data):
+    from web3 import Web3
+
+    return bytes(Web3.keccak(data))
+
+
+def record_leaf(patient_id, diagnosis, treatment, timestamp, doctor):
+    """Hoja del árbol: keccak256(abi.encode(...)) de los campos del registro"""
+    from eth_abi import encode
+
+    return _keccak(encode(
+        ["string", "string", "string", "uint256", "string"],
+        [patient_id, diagnosis, treatment, int(timestamp), doctor or ""]
+    ))
+
+
+def hash_pair(a, b):
+    return _keccak(a + b) if a <= b else _keccak(b + a)
+
+
+def build_merkle_tree(leaves):
+    """(raíz, pruebas) para una lista de hojas; un nodo sin pareja sube tal cual"""
+    if not leaves:
+        raise ValueError("No hay hojas para construir el árbol")
+    proofs = [[] for _ in leaves]
+    # positions[i]: índice en el nivel actual del nodo que contiene a la hoja i
+    positions = list(range(len(leaves)))
+    level = list(leaves)
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level), 2):
+            if i + 1 < len(level):
+                parents.append(hash_pair(level[i], level[i + 1]))
+            else:
+                parents.append(level[i])
+        for leaf_index, pos in enumerate(positions):
+            sibling = pos ^ 1
+            if sibling < len(level):
+                proofs[leaf_index].append(level[sibling])
+            positions[leaf_index] = pos // 2
+        level = parents
+    return level[0], proofs
+
+
+def verify_proof(leaf, proof, root):
+    computed = leaf
+    for sibling in proof:
+        computed = hash_pair(computed, sibling)
+    return computed == root
+
+
+def to_hex(value):
+    return "0x" + bytes(value).hex()
+
+
+def from_hex(value):
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+# --- warehouse -------------------------------------------------------------
+
+def _row_dict(row):
+    data = dict(zip(SELECT_COLUMNS, row))
+    if data["PRUEBA_MERKLE"]:
+        data["PRUEBA_MERKLE"] = json.loads(data["PRUEBA_MERKLE"])
+    return data
+
+
+def obtener_anclaje(conn, record_hash):
+    """Fila de REGISTROS_ANCLADOS para un hash de registro (o None)"""
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"SELECT {', '.join(SELECT_COLUMNS)} FROM REGISTROS_ANCLADOS WHERE HASH_REGISTRO = %s",
+            (record_hash,)
+        )
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    return _row_dict(row) if row else None
+
+
+def registros_pendientes(conn, limit=10000):
+    """Registros todavía sin raíz (p. ej. tras un reinicio con el buffer lleno)"""
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"SELECT {', '.join(SELECT_COLUMNS)} FROM REGISTROS_ANCLADOS "
+            f"WHERE ESTADO = 'PENDIENTE' ORDER BY FECHA_CREACION LIMIT {int(limit)}"
+        )
+        return [_row_dict(row) for row in cur.fetchall()]
+    finally:
+        cur.close()
+
+
+# --- batcher ---------------------------------------------------------------
+
+class PendingRecord:
+    """Registro a la espera de entrar en un lote"""
+
+    __slots__ = ("leaf", "record_hash", "patient_id", "diagnosis", "treatment", "timestamp", "doctor")
+
+    def __init__(self, patient_id, diagnosis, treatment, timestamp, doctor):
+        self.patient_id = patient_id
+        self.diagnosis = diagnosis
+        self.treatment = treatment
+        self.timestamp = int(timestamp)
+        self.doctor = doctor or ""
+        self.leaf = record_leaf(patient_id, diagnosis, treatment, self.timestamp, self.doctor)
+        self.record_hash = to_hex(self.leaf)
+
+    def as_dict(self):
+        return {
+            "record_hash": self.record_hash,
+            "patient_id": self.patient_id,
+            "timestamp": self.timestamp,
+            "doctor": self.doctor,
+            "estado": ESTADO_PENDIENTE,
+        }
+
+
+class MerkleAnchorBatcher:
+    """Acumula registros y ancla una raíz cada `max_records` registros o `max_wait` segundos"""
+
+    def __init__(self, blockchain, pool, max_records=64, max_wait=30.0, max_buffer=10000, retry_after=1,
+                 backoff=1.0, max_backoff=60.0):
+        self.blockchain = blockchain
+        self.pool = pool
+        self.max_records = max_records
+        self.max_wait = max_wait
+        self.max_buffer = max_buffer
+        self.retry_after = retry_after
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._buffer = collections.deque()
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._completed = collections.deque()
+        # Lotes fallidos (batch, raíz, pruebas, tx_hash): se reintentan tal cual, sin rearmar el árbol
+        self._retry = collections.deque()
+        # Lotes anclados en la cadena cuyo UPDATE en el warehouse falló: solo se reintenta el UPDATE
+        self._unstored = collections.deque()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {
+            "records_submitted": 0,
+            "records_anchored": 0,
+            "batches_sent": 0,
+            "batches_anchored": 0,
+            "batches_failed": 0,
+        }
+        self._last_error = None
+
+    # --- API pública -------------------------------------------------------
+
+    def submit(self, patient_id, diagnosis, treatment, doctor=None, timestamp=None):
+        """Guardar el registro como PENDIENTE y ponerlo en el próximo lote"""
+        record = PendingRecord(patient_id, diagnosis, treatment, timestamp or time.time(), doctor)
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                raise ExecutorSaturatedError("merkle-anchor", self.retry_after)
+            self._stats["records_submitted"] += 1
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(INSERT_PENDIENTE_SQL, (
+                    record.record_hash, record.patient_id, record.diagnosis, record.treatment,
+                    record.timestamp, record.doctor
+                ))
+                conn.commit()
+            finally:
+                cur.close()
+        self._enqueue([record])
+        return record.as_dict()
+
+    def anchor(self, record_hash):
+        """Estado del anclaje y prueba de inclusión de un registro"""
+        with self.pool.connection() as conn:
+            return obtener_anclaje(conn, record_hash)
+
+    def verify(self, patient_id, diagnosis, treatment, timestamp, doctor=None):
+        """Recalcular la hoja con los datos recibidos y comprobarla contra la raíz anclada"""
+        leaf = record_leaf(patient_id, diagnosis, treatment, timestamp, doctor)
+        record_hash = to_hex(leaf)
+        anclaje = self.anchor(record_hash)
+        result = {"record_hash": record_hash, "anclado": False, "valido": False}
+        if anclaje is None:
+            # Los datos no coinciden con ningún registro: alterados o nunca enviados
+            result["estado"] = "DESCONOCIDO"
+            return result
+        result["estado"] = anclaje["ESTADO"]
+        if anclaje["ESTADO"] != ESTADO_ANCLADO:
+            return result
+        root = from_hex(anclaje["RAIZ_MERKLE"])
+        proof = [from_hex(node) for node in anclaje["PRUEBA_MERKLE"]]
+        result.update({
+            "anclado": True,
+            "raiz_merkle": anclaje["RAIZ_MERKLE"],
+            "prueba": anclaje["PRUEBA_MERKLE"],
+            "transaction_hash": anclaje["TX_HASH"],
+            "block_number": anclaje["BLOQUE"],
+            "valido_local": verify_proof(leaf, proof, root),
+        })
+        # La cadena es la fuente de verdad: la raíz debe estar anclada en el contrato
+        result["valido_on_chain"] = self.blockchain.verify_anchored_record(leaf, proof, root)
+        result["valido"] = result["valido_local"] and result["valido_on_chain"]
+        return result
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._recover()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="merkle-anchor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener el hilo; lo que quede en el buffer sigue PENDIENTE y se recupera al iniciar"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def metrics(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        anchored = self._stats["records_anchored"]
+        batches = self._stats["batches_anchored"]
+        return {
+            **self._stats,
+            "buffered": buffered,
+            "retrying_batches": len(self._retry),
+            "anchored_unstored_batches": len(self._unstored),
+            "max_records": self.max_records,
+            "max_wait": self.max_wait,
+            "records_per_tx": round(anchored / batches, 2) if batches else None,
+            "last_error": self._last_error,
+        }
+
+    # --- lotes -------------------------------------------------------------
+
+    def _enqueue(self, records, front=False):
+        with self._lock:
+            if front:
+                self._buffer.extendleft(reversed(records))
+            else:
+                self._buffer.extend(records)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._buffer) >= self.max_records
+        if full:
+            self._wake.set()
+
+    def _recover(self):
+        try:
+            with self.pool.connection() as conn:
+                filas = registros_pendientes(conn, self.max_buffer)
+        except Exception as e:
+            print(f"⚠️ No se pudieron recuperar registros pendientes de anclaje: {str(e)}")
+            return
+        # Tras stop()/start() parte de los pendientes sigue en memoria
+        with self._lock:
+            held = {record.record_hash for record in self._buffer}
+        for entry in list(self._retry) + list(self._unstored):
+            held.update(record.record_hash for record in entry[0])
+        filas = [f for f in filas if f["HASH_REGISTRO"] not in held]
+        if filas:
+            records = [
+                PendingRecord(f["ID_PACIENTE"], f["DIAGNOSTICO"], f["TRATAMIENTO"],
+                              f["TIMESTAMP_REGISTRO"], f["DOCTOR"])
+                for f in filas
+            ]
+            self._enqueue(records, front=True)
+            print(f"🔁 {len(records)} registros pendientes de anclaje recuperados")
+
+    def _due(self):
+        if time.monotonic() < self._retry_at:
+            return False
+        if self._retry:
+            return True
+        with self._lock:
+            if not self._buffer:
+                return False
+            return (len(self._buffer) >= self.max_records
+                    or time.monotonic() - self._oldest >= self.max_wait)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(timeout=min(1.0, self.max_wait))
+            self._wake.clear()
+            self._store_completed()
+            while self._due() and not self._stop.is_set():
+                if not self._flush():
+                    break
+        self._store_completed()
+
+    def _take_batch(self):
+        with self._lock:
+            batch = [self._buffer.popleft() for _ in range(min(self.max_records, len(self._buffer)))]
+            self._oldest = time.monotonic() if self._buffer else None
+        return batch
+
+    def _flush(self):
+        """Enviar un lote: una transacción anchorRecords(raíz, n)"""
+        if self._retry:
+            batch, root, proofs, tx_hash = self._retry.popleft()
+            # Antes de reenviar: el lote anterior pudo minarse aunque su recibo no llegara,
+            # y reenviar la misma raíz revierte con "Root already anchored"
+            try:
+                anchored = self._find_anchor(root, tx_hash)
+            except Exception as e:
+                self._fail(batch, root, proofs, tx_hash, e)
+                return False
+            if anchored is not None:
+                self._unstored.append((batch, root, proofs) + anchored)
+                return self._store_unstored()
+        else:
+            batch = self._take_batch()
+            if not batch:
+                return True
+            root, proofs = build_merkle_tree([record.leaf for record in batch])
+        try:
+            pending = self.blockchain.send_anchor_root(root, len(batch))
+        except Exception as e:
+            self._fail(batch, root, proofs, None, e)
+            return False
+        self._stats["batches_sent"] += 1
+        # El recibo llega en el hilo del pipeline; aquí solo se encola el resultado
+        pending.receipt.add_done_callback(
+            lambda future: self._completed.append((batch, root, proofs, pending, future))
+        )
+        pending.receipt.add_done_callback(lambda future: self._wake.set())
+        return True
+
+    def _find_anchor(self, root, tx_hash):
+        """(tx_hash, bloque) si la raíz ya está anclada en el contrato; None si no"""
+        if not self.blockchain.root_anchored_at(root):
+            return None
+        if tx_hash is None:
+            # Anclada por un envío del que no queda el hash (p. ej. antes de un reinicio)
+            return None, None
+        try:
+            receipt = self.blockchain.w3.eth.get_transaction_receipt(tx_hash)
+        except Exception:
+            return None, None
+        if receipt.status == 0:
+            # Esta transacción revirtió: la raíz la ancló otro envío
+            return None, None
+        return tx_hash, receipt.blockNumber
+
+    def _fail(self, batch, root, proofs, tx_hash, error):
+        self._stats["batches_failed"] += 1
+        # Los registros siguen PENDIENTE en el warehouse; el lote se reintenta con la misma raíz
+        self._retry.append((batch, root, proofs, tx_hash))
+        self._back_off(f"Error anclando lote de {len(batch)} registros", error)
+
+    def _back_off(self, message, error):
+        """Espera exponencial antes del próximo envío o UPDATE tras un fallo"""
+        self._failures += 1
+        self._last_error = str(error)
+        delay = min(self.max_backoff, self.backoff * 2 ** (self._failures - 1))
+        self._retry_at = time.monotonic() + delay
+        print(f"⚠️ {message}: {str(error)}; reintento en {delay:g}s")
+
+    def _store_completed(self):
+        while self._completed:
+            batch, root, proofs, pending, future = self._completed.popleft()
+            try:
+                receipt = future.result()
+                if receipt.status == 0:
+                    raise RuntimeError(f"anchorRecords revertida en el bloque {receipt.blockNumber}")
+            except Exception as e:
+                # Sin recibo (timeout) o revertida: el reintento comprueba antes la cadena
+                self._fail(batch, root, proofs, pending.tx_hash, e)
+                continue
+            self._unstored.append((batch, root, proofs, pending.tx_hash, receipt.blockNumber))
+        self._store_unstored()
+
+    def _store_unstored(self):
+        """Guardar raíz y pruebas de los lotes ya anclados; un fallo aquí nunca reenvía la raíz"""
+        while self._unstored:
+            if time.monotonic() < self._retry_at:
+                return False
+            batch, root, proofs, tx_hash, block_number = self._unstored[0]
+            try:
+                self._store_batch(batch, root, proofs, tx_hash, block_number)
+            except Exception as e:
+                self._back_off(f"Error guardando lote anclado de {len(batch)} registros", e)
+                return False
+            self._unstored.popleft()
+            self._failures = 0
+            self._stats["batches_anchored"] += 1
+            self._stats["records_anchored"] += len(batch)
+        return True
+
+    def _store_batch(self, batch, root, proofs, tx_hash, block_number):
+        root_hex = to_hex(root)
+        tx_hex = to_hex(tx_hash) if tx_hash is not None else None
+        params = [
+            (root_hex, json.dumps([to_hex(node) for node in proof]), index, tx_hex,
+             block_number, record.record_hash)
+            for index, (record, proof) in enumerate(zip(batch, proofs))
+        ]
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.executemany(UPDATE_ANCLADO_SQL, params)
+                conn.commit()
+            finally:
+                cur.close()
+
+
+def merkle_anchor_batcher_from_env(blockchain, pool):
+    """MerkleAnchorBatcher configurado con BLOCKCHAIN_ANCHOR_*"""
+    return MerkleAnchorBatcher(
+        blockchain, pool,
+        max_records=int(os.getenv("BLOCKCHAIN_ANCHOR_BATCH", "64")),
+        max_wait=float(os.getenv("BLOCKCHAIN_ANCHOR_MAX_WAIT", "30")),
+        max_buffer=int(os.getenv("BLOCKCHAIN_ANCHOR_MAX_BUFFER", "10000")),
+        max_backoff=float(os.getenv("BLOCKCHAIN_ANCHOR_MAX_BACKOFF", "60")),
+    )
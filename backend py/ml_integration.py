@@ -9,22 +9,92 @@ import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
-import joblib
 import json
 from web3 import Web3
 from dotenv import load_dotenv
 import snowflake.connector
 from datetime import datetime
 import os
+import time
+
+from feature_store import FEATURE_NAMES, feature_store_from_env, fetch_raw_features, materialize
+from model_registry import model_registry_from_env
 
 load_dotenv()
 
+RISK_LEVELS = ('BAJO', 'MEDIO', 'ALTO')
+
+# Modelos del registro (model_registry.py) que usa la integración
+MODEL_NAMES = ('risk_classification', 'disease_prediction', 'readmission_risk')
+
+# Pacientes por consulta de características (IN (...) por bloque)
+FEATURE_BATCH_SIZE = int(os.getenv('ML_FEATURE_BATCH', '10000'))
+
+# Origen de las características: 'warehouse' (calculadas al vuelo) o 'store' (feature_store.py)
+FEATURE_SOURCE = os.getenv('ML_FEATURE_SOURCE', 'warehouse')
+
+
+def simple_risk_scores(X):
+    """Versión vectorizada de simple_risk_classification: (scores, índices de RISK_LEVELS)"""
+    age = X[:, 0]
+    scores = (
+        np.where(age > 65, 2, np.where(age > 45, 1, 0))
+        + X[:, 1] * 2
+        + X[:, 2] * 1.5
+        + np.where(X[:, 3] > 5, 2, 0)
+    )
+    levels = np.where(scores >= 8, 2, np.where(scores >= 4, 1, 0))
+    return scores, levels
+
+
+def simple_readmission_risk(X):
+    """Riesgo de readmisión (%) heurístico cuando no hay modelo entrenado"""
+    risk = (
+        X[:, 2] * 10
+        + X[:, 1] * 8
+        + np.where(X[:, 4] <= 30, 15, 0)
+        + np.where(X[:, 0] > 65, 10, 0)
+    )
+    return np.minimum(risk, 100.0)
+
+
+def score_feature_matrix(models, X):
+    """
+    Puntuar todas las filas de X con una llamada predict_proba por modelo.
+    Devuelve arrays alineados con las filas: nivel de riesgo, confianza y riesgo de readmisión
+    """
+    result = {}
+    model = models.get('risk_classification')
+    if model is not None:
+        probabilities = model.predict_proba(X)
+        # predict() de sklearn es classes_[argmax(predict_proba)]: se evita una segunda pasada
+        result['risk_index'] = model.classes_[probabilities.argmax(axis=1)].astype(int)
+        result['risk_confidence'] = probabilities.max(axis=1)
+        result['risk_method'] = 'model'
+    else:
+        scores, levels = simple_risk_scores(X)
+        result['risk_index'] = levels
+        result['risk_score'] = scores
+        result['risk_method'] = 'simple_classification'
+
+    model = models.get('readmission_risk')
+    if model is not None:
+        probabilities = model.predict_proba(X)
+        positive = list(model.classes_).index(1) if 1 in model.classes_ else probabilities.shape[1] - 1
+        result['readmission_risk'] = probabilities[:, positive] * 100
+        result['readmission_method'] = 'model'
+    else:
+        result['readmission_risk'] = simple_readmission_risk(X)
+        result['readmission_method'] = 'simple_readmission'
+    return result
+
+
 class MedicalMLIntegration:
     def __init__(self):
         self.w3 = Web3(Web3.HTTPProvider(os.getenv('ETHEREUM_RPC_URL', 'http://127.0.0.1:8545')))
         self.snowflake_conn = self.connect_snowflake()
-        self.models = {}
-        self.load_models()
+        self.feature_store = feature_store_from_env() if FEATURE_SOURCE == 'store' else None
+        self.model_registry = model_registry_from_env()
     
     def connect_snowflake(self):
         """Conectar a Snowflake"""
@@ -43,82 +113,80 @@ class MedicalMLIntegration:
             return None
     
     def load_models(self):
-        """Cargar modelos pre-entrenados"""
-        model_files = {
-            'risk_classification': 'models/risk_classifier.pkl',
-            'disease_prediction': 'models/disease_predictor.pkl',
-            'readmission_risk': 'models/readmission_predictor.pkl'
-        }
-        
-        for model_name, model_file in model_files.items():
-            try:
-                self.models[model_name] = joblib.load(model_file)
-                print(f"✅ Modelo {model_name} cargado")
-            except FileNotFoundError:
-                print(f"⚠️ Modelo {model_name} no encontrado, se entrenará")
+        """
+        Modelos activos del registro ({nombre: LoadedModel}); se cargan al primer uso con mmap
+        y una versión promovida se toma sin reiniciar. Cada lote usa una sola instantánea
+        """
+        return self.model_registry.snapshot(MODEL_NAMES)
     
     def extract_features_from_blockchain(self, patient_id):
-        """Extraer características del paciente desde blockchain"""
+        """Características actuales de un paciente (dict de FEATURE_NAMES) o None"""
         try:
-            # Obtener registros médicos de blockchain
-            medical_records = self.get_medical_records_from_blockchain(patient_id)
-            
-            # Convertir a características numéricas
-            features = {
-                'age': self.calculate_age(medical_records),
-                'chronic_conditions': len([r for r in medical_records if 'chronic' in r['diagnosis'].lower()]),
-                'emergency_visits': len([r for r in medical_records if 'emergency' in r['details'].lower()]),
-                'medication_count': len(set([r['treatment'] for r in medical_records])),
-                'last_visit_days': self.days_since_last_visit(medical_records),
-                'consent_data_sharing': self.get_consent_status(patient_id),
-                'blockchain_verification_score': self.calculate_verification_score(medical_records)
-            }
-            
-            return features
+            found, X = self.fetch_feature_matrix([patient_id])
+            return dict(zip(FEATURE_NAMES, X[0].tolist())) if found else None
             
         except Exception as e:
             print(f"❌ Error extrayendo características: {str(e)}")
             return None
     
+    def fetch_feature_matrix(self, patient_ids):
+        """
+        (ids encontrados, matriz float64 n x 7 en el orden de FEATURE_NAMES).
+        Con ML_FEATURE_SOURCE=store se leen del almacén materializado; si no, una consulta
+        por bloque de FEATURE_BATCH_SIZE pacientes, sin consultas por paciente
+        """
+        if self.feature_store is not None:
+            return self.feature_store.lookup_many(patient_ids)
+        if self.snowflake_conn is None:
+            raise RuntimeError("Sin conexión a Snowflake")
+        found, raw = fetch_raw_features(self.snowflake_conn, patient_ids, FEATURE_BATCH_SIZE)
+        return found, materialize(raw, time.time())
+    
+    def score_patients(self, patient_ids):
+        """Riesgo y readmisión de muchos pacientes: una matriz y un predict_proba por modelo"""
+        found, X = self.fetch_feature_matrix(patient_ids)
+        loaded = self.load_models()
+        scores = score_feature_matrix({name: entry.model for name, entry in loaded.items()}, X)
+        versions = {name: entry.version for name, entry in loaded.items()}
+        timestamp = datetime.now().isoformat()
+        
+        risk_classifications, readmission_risks = [], []
+        for i, patient_id in enumerate(found):
+            features = dict(zip(FEATURE_NAMES, X[i].tolist()))
+            risk = {
+                'patient_id': patient_id,
+                'risk_level': RISK_LEVELS[scores['risk_index'][i]],
+                'features': features,
+                'method': scores['risk_method'],
+                'model_version': versions.get('risk_classification'),
+                'prediction_timestamp': timestamp,
+                'blockchain_verified': bool(features['blockchain_verification_score'])
+            }
+            if 'risk_confidence' in scores:
+                risk['confidence'] = float(scores['risk_confidence'][i])
+            else:
+                risk['score'] = float(scores['risk_score'][i])
+            risk_classifications.append(risk)
+            readmission_risks.append({
+                'patient_id': patient_id,
+                'readmission_risk': float(scores['readmission_risk'][i]),
+                'method': scores['readmission_method'],
+                'model_version': versions.get('readmission_risk'),
+                'prediction_date': timestamp
+            })
+        
+        found_set = set(found)
+        return {
+            'risk_classifications': risk_classifications,
+            'readmission_risks': readmission_risks,
+            'missing_patients': [patient_id for patient_id in patient_ids if patient_id not in found_set]
+        }
+    
     def predict_risk_classification(self, patient_id):
         """Clasificar riesgo del paciente (bajo, medio, alto)"""
         try:
-            # Extraer características
-            features = self.extract_features_from_blockchain(patient_id)
-            if not features:
-                return None
-            
-            # Preparar datos para el modelo
-            feature_vector = np.array([
-                features['age'],
-                features['chronic_conditions'],
-                features['emergency_visits'],
-                features['medication_count'],
-                features['last_visit_days'],
-                features['consent_data_sharing'],
-                features['blockchain_verification_score']
-            ]).reshape(1, -1)
-            
-            # Predecir riesgo
-            if 'risk_classification' in self.models:
-                prediction = self.models['risk_classification'].predict(feature_vector)[0]
-                probability = self.models['risk_classification'].predict_proba(feature_vector)[0]
-                
-                risk_levels = ['BAJO', 'MEDIO', 'ALTO']
-                risk_level = risk_levels[prediction]
-                
-                return {
-                    'patient_id': patient_id,
-                    'risk_level': risk_level,
-                    'confidence': max(probability),
-                    'features': features,
-                    'prediction_timestamp': datetime.now().isoformat(),
-                    'blockchain_verified': True
-                }
-            else:
-                # Modelo simple si no hay modelo entrenado
-                return self.simple_risk_classification(features)
-                
+            result = self.score_patients([patient_id])['risk_classifications']
+            return result[0] if result else None
         except Exception as e:
             print(f"❌ Error en predicción de riesgo: {str(e)}")
             return None
@@ -167,35 +235,8 @@ class MedicalMLIntegration:
     def predict_readmission_risk(self, patient_id):
         """Predecir riesgo de readmisión hospitalaria"""
         try:
-            # Obtener historial de admisiones
-            query = """
-            SELECT 
-                COUNT(*) as admission_count,
-                AVG(DATEDIFF('day', FECHA_ALTA, FECHA_READMISION)) as avg_days_to_readmission,
-                COUNT(CASE WHEN FECHA_READMISION IS NOT NULL THEN 1 END) as readmission_count,
-                MAX(FECHA_ALTA) as last_discharge
-            FROM HISTORIAL_MEDICO
-            WHERE ID_PACIENTE = %s
-            """
-            
-            cursor = self.snowflake_conn.cursor()
-            cursor.execute(query, (patient_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                # Calcular probabilidad de readmisión
-                readmission_probability = self.calculate_readmission_probability(result)
-                
-                return {
-                    'patient_id': patient_id,
-                    'readmission_risk': readmission_probability,
-                    'admission_count': result[0],
-                    'avg_days_to_readmission': result[1],
-                    'readmission_count': result[2],
-                    'last_discharge': result[3],
-                    'prediction_date': datetime.now().isoformat()
-                }
-            
+            result = self.score_patients([patient_id])['readmission_risks']
+            return result[0] if result else None
         except Exception as e:
             print(f"❌ Error prediciendo readmisión: {str(e)}")
             return None
@@ -206,11 +247,12 @@ class MedicalMLIntegration:
             # Crear hash de la predicción
             prediction_hash = Web3.keccak(
                 Web3.encode_abi_packed(
-                    ['string', 'string', 'string', 'uint256'],
+                    ['string', 'string', 'string', 'string', 'uint256'],
                     [
                         prediction_data['patient_id'],
                         prediction_data['prediction_type'],
                         str(prediction_data['prediction_value']),
+                        str(prediction_data.get('model_version') or 'heuristic'),
                         int(datetime.now().timestamp())
                     ]
                 )
@@ -230,26 +272,34 @@ class MedicalMLIntegration:
         print("🧠 GENERANDO REPORTE DE MACHINE LEARNING")
         print("=" * 50)
         
+        start = time.perf_counter()
+        try:
+            scored = self.score_patients(patient_ids)
+        except Exception as e:
+            print(f"❌ Error puntuando pacientes: {str(e)}")
+            scored = {'risk_classifications': [], 'readmission_risks': [], 'missing_patients': list(patient_ids)}
+        elapsed = time.perf_counter() - start
+        
         results = {
-            'risk_classifications': [],
+            'risk_classifications': scored['risk_classifications'],
             'disease_predictions': [],
-            'readmission_risks': []
+            'readmission_risks': scored['readmission_risks'],
+            'missing_patients': scored['missing_patients']
         }
         
-        for patient_id in patient_ids:
-            print(f"\n📋 Analizando paciente: {patient_id}")
-            
-            # Clasificación de riesgo
-            risk_result = self.predict_risk_classification(patient_id)
-            if risk_result:
-                results['risk_classifications'].append(risk_result)
-                print(f"   🎯 Riesgo: {risk_result['risk_level']} (Confianza: {risk_result['confidence']:.2f})")
-            
-            # Riesgo de readmisión
-            readmission_result = self.predict_readmission_risk(patient_id)
-            if readmission_result:
-                results['readmission_risks'].append(readmission_result)
-                print(f"   🏥 Readmisión: {readmission_result['readmission_risk']:.2f}%")
+        # Detalle por paciente solo en reportes pequeños
+        if len(results['risk_classifications']) <= 20:
+            for risk, readmission in zip(results['risk_classifications'], results['readmission_risks']):
+                print(f"\n📋 Paciente: {risk['patient_id']}")
+                print(f"   🎯 Riesgo: {risk['risk_level']} ({risk['method']})")
+                print(f"   🏥 Readmisión: {readmission['readmission_risk']:.2f}%")
+        
+        niveles = {}
+        for risk in results['risk_classifications']:
+            niveles[risk['risk_level']] = niveles.get(risk['risk_level'], 0) + 1
+        print(f"\n⏱️ {len(results['risk_classifications'])} pacientes puntuados en {elapsed:.2f}s: {niveles}")
+        if results['missing_patients']:
+            print(f"⚠️ {len(results['missing_patients'])} pacientes no encontrados")
         
         return results
     
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Registro versionado de modelos de ML
+Cada versión vive en models/<nombre>/<versión>/ con el artefacto joblib sin comprimir y un
+metadata.json (esquema de características, sha256, métricas, parámetros). models/<nombre>/current.json
+apunta a la versión activa: promoverla cambia el modelo que usan los procesos en marcha sin
+reiniciarlos. Los modelos se cargan al primer uso con mmap_mode='r': los arrays NumPy del
+artefacto se comparten entre workers como páginas del mismo archivo (los árboles de sklearn
+copian sus nodos al deserializar, así que en ellos el ahorro es menor). Con compiled=True los
+bosques se sirven desde arrays planos (forest_inference.py; flat/ si la versión se exportó)
+
+Uso:
+    python3 "backend py/model_registry.py" list
+    python3 "backend py/model_registry.py" promote risk_classification v0002
+    python3 "backend py/model_registry.py" import risk_classification models/risk_classifier.pkl
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import joblib
+
+from contract_registry import PROJECT_ROOT
+from feature_store import FEATURE_NAMES
+
+ARTIFACT = "model.joblib"
+METADATA = "metadata.json"
+CURRENT = "current.json"
+
+# Pickles sueltos que esperaba la versión anterior (se usan si el modelo no está registrado)
+LEGACY_FILES = {
+    'risk_classification': 'risk_classifier.pkl',
+    'disease_prediction': 'disease_predictor.pkl',
+    'readmission_risk': 'readmission_predictor.pkl',
+}
+
+LoadedModel = namedtuple("LoadedModel", "name version model metadata")
+
+
+class ModelSchemaError(ValueError):
+    """El modelo se entrenó con otras características que las que se le van a pasar"""
+
+
+def schema_hash(feature_names):
+    """Huella del esquema de características (nombres y orden)"""
+    return hashlib.sha256(json.dumps(list(feature_names)).encode()).hexdigest()[:16]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+class ModelRegistry:
+    """Versiones de modelos en disco + caché perezosa de la versión activa de cada uno"""
+
+    def __init__(self, root, feature_names=FEATURE_NAMES, check_interval=5.0,
+                 mmap_mode="r", verify_hash=True, compiled=False, compiled_max_rows=256):
+        self.root = root
+        # Bosques servidos por forest_inference (arrays planos) en llamadas de pocas filas
+        self.compiled = compiled
+        self.compiled_max_rows = compiled_max_rows
+        self.feature_names = tuple(feature_names)
+        self.check_interval = check_interval
+        self.mmap_mode = mmap_mode
+        self.verify_hash = verify_hash
+        self._lock = threading.Lock()
+        self._loaded = {}       # nombre -> LoadedModel
+        self._pointers = {}     # nombre -> (mtime de current.json, última comprobación)
+        self._warned = set()
+        self.metrics = {"loads": 0, "swaps": 0, "load_seconds": 0.0, "fallbacks": 0}
+
+    # --- escritura ---------------------------------------------------------
+
+    def _dir(self, name, *parts):
+        return os.path.join(self.root, name, *parts)
+
+    def versions(self, name):
+        """Metadatos de todas las versiones de `name`, de la más antigua a la más nueva"""
+        try:
+            entries = sorted(os.listdir(self._dir(name)))
+        except FileNotFoundError:
+            return []
+        result = []
+        for version in entries:
+            path = self._dir(name, version, METADATA)
+            if os.path.exists(path):
+                with open(path) as f:
+                    result.append(json.load(f))
+        return result
+
+    def register(self, name, model, feature_names=None, metrics=None, params=None,
+                 training=None, promote=True):
+        """Guardar una nueva versión de `name`; devuelve su metadata"""
+        feature_names = tuple(feature_names or self.feature_names)
+        existing = self.versions(name)
+        version = f"v{int(existing[-1]['version'][1:]) + 1 if existing else 1:04d}"
+        directory = self._dir(name, version)
+        os.makedirs(directory, exist_ok=True)
+
+        # Sin compresión: joblib solo puede mapear en memoria arrays de archivos sin comprimir
+        path = os.path.join(directory, ARTIFACT)
+        joblib.dump(model, path, compress=0)
+        classes = getattr(model, "classes_", None)
+        metadata = {
+            "name": name,
+            "version": version,
+            "created_at": datetime.now().isoformat(),
+            "model_class": f"{type(model).__module__}.{type(model).__name__}",
+            "feature_schema": {
+                "features": list(feature_names),
+                "dtype": "float64",
+                "hash": schema_hash(feature_names),
+            },
+            "classes": classes.tolist() if classes is not None else None,
+            "sha256": file_sha256(path),
+            "size_bytes": os.path.getsize(path),
+            "params": params if params is not None else _model_params(model),
+            "metrics": metrics or {},
+            "training": training or {},
+        }
+        _write_json(os.path.join(directory, METADATA), metadata)
+        if promote:
+            self.promote(name, version)
+        return metadata
+
+    def promote(self, name, version):
+        """Activar `version`: los procesos que usan el registro la toman en la próxima comprobación"""
+        if not os.path.exists(self._dir(name, version, METADATA)):
+            raise FileNotFoundError(f"No existe la versión {version} de {name}")
+        _write_json(self._dir(name, CURRENT), {"version": version, "promoted_at": datetime.now().isoformat()})
+        with self._lock:
+            self._pointers.pop(name, None)
+
+    def current_version(self, name):
+        try:
+            with open(self._dir(name, CURRENT)) as f:
+                return json.load(f)["version"]
+        except FileNotFoundError:
+            return None
+
+    # --- lectura -----------------------------------------------------------
+
+    def get(self, name):
+        """LoadedModel con la versión activa de `name` (carga perezosa) o None si no hay modelo"""
+        now = time.monotonic()
+        with self._lock:
+            # None en caché también cuenta: un modelo ausente no se busca en cada predicción
+            cached = name in self._loaded
+            pointer = self._pointers.get(name)
+            if cached and pointer is not None and now - pointer[1] < self.check_interval:
+                return self._loaded[name]
+            try:
+                mtime = os.path.getmtime(self._dir(name, CURRENT))
+            except FileNotFoundError:
+                mtime = None
+            if cached and pointer is not None and pointer[0] == mtime:
+                self._pointers[name] = (mtime, now)
+                return self._loaded[name]
+
+        # La carga ocurre fuera del lock: las predicciones en curso siguen con la versión anterior
+        started = time.perf_counter()
+        try:
+            candidate = self._load(name) if mtime is not None else self._load_legacy(name)
+        except Exception as e:
+            # Una versión dañada o incompatible no reemplaza a la que ya está sirviendo
+            print(f"❌ Error cargando modelo {name}: {str(e)}")
+            with self._lock:
+                self._pointers[name] = (mtime, now)
+                self._loaded.setdefault(name, None)
+                return self._loaded[name]
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._pointers[name] = (mtime, now)
+            if candidate is None:
+                self._loaded[name] = None
+                if name not in self._warned:
+                    self._warned.add(name)
+                    print(f"⚠️ Modelo {name} no registrado en {self.root}: se usa la heurística "
+                          f"(entrenarlo con train_models.py)")
+                return None
+            previous = self._loaded.get(name)
+            if previous is None or previous.version != candidate.version:
+                self.metrics["loads"] += 1
+                self.metrics["load_seconds"] += elapsed
+                if previous is not None:
+                    self.metrics["swaps"] += 1
+                    print(f"🔄 Modelo {name}: {previous.version} -> {candidate.version}")
+                self._loaded[name] = candidate
+            self._warned.discard(name)
+            return self._loaded[name]
+
+    def _load(self, name):
+        version = self.current_version(name)
+        with self._lock:
+            loaded = self._loaded.get(name)
+        if loaded is not None and loaded.version == version:
+            return loaded
+        with open(self._dir(name, version, METADATA)) as f:
+            metadata = json.load(f)
+        self.check_schema(metadata)
+        path = self._dir(name, version, ARTIFACT)
+
+        def load_artifact():
+            if self.verify_hash and file_sha256(path) != metadata["sha256"]:
+                raise ValueError(f"El artefacto de {name} {version} no coincide con su sha256")
+            return joblib.load(path, mmap_mode=self.mmap_mode)
+
+        model = self._load_compiled(name, version, load_artifact) if self.compiled else load_artifact()
+        compiled = f" (inferencia compilada, {model.flat.n_nodes} nodos)" if hasattr(model, "flat") else ""
+        print(f"✅ Modelo {name} {version} cargado{compiled}")
+        return LoadedModel(name, version, model, metadata)
+
+    def _load_compiled(self, name, version, load_artifact):
+        """CompiledForest desde flat/ (mmap, sin cargar el pickle), compilado en memoria o el modelo tal cual"""
+        from forest_inference import FLAT_DIR, CompiledForest, FlatForest, compile_forest
+
+        flat_dir = self._dir(name, version, FLAT_DIR)
+        if os.path.isdir(flat_dir):
+            flat = FlatForest.load(flat_dir, mmap_mode=self.mmap_mode, verify_hash=self.verify_hash)
+            return CompiledForest(flat, load_artifact, self.compiled_max_rows)
+        model = load_artifact()
+        flat = compile_forest(model)
+        return CompiledForest(flat, lambda: model, self.compiled_max_rows) if flat is not None else model
+
+    def _load_legacy(self, name):
+        """Compatibilidad con models/*.pkl sin registrar (sin esquema: se asume FEATURE_NAMES)"""
+        path = os.path.join(self.root, LEGACY_FILES.get(name, f"{name}.pkl"))
+        if not os.path.exists(path):
+            return None
+        model = joblib.load(path, mmap_mode=self.mmap_mode)
+        metadata = {"name": name, "version": "legacy", "sha256": file_sha256(path),
+                    "feature_schema": {"features": list(self.feature_names),
+                                       "hash": schema_hash(self.feature_names)}}
+        print(f"⚠️ Modelo {name} cargado desde {path} sin registrar (versión 'legacy')")
+        return LoadedModel(name, "legacy", model, metadata)
+
+    def check_schema(self, metadata):
+        features = tuple(metadata["feature_schema"]["features"])
+        if features != self.feature_names:
+            raise ModelSchemaError(
+                f"{metadata['name']} {metadata['version']} espera {list(features)}, "
+                f"el registro entrega {list(self.feature_names)}"
+            )
+
+    def snapshot(self, names):
+        """{nombre: LoadedModel} de los modelos disponibles (una versión fija por llamada)"""
+        result = {}
+        for name in names:
+            loaded = self.get(name)
+            if loaded is not None:
+                result[name] = loaded
+            else:
+                self.metrics["fallbacks"] += 1
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "root": self.root,
+                "loaded": {name: loaded.version if loaded else None for name, loaded in self._loaded.items()},
+                **self.metrics,
+            }
+
+
+def _model_params(model):
+    try:
+        return {key: value for key, value in model.get_params().items()
+                if isinstance(value, (str, int, float, bool, type(None)))}
+    except AttributeError:
+        return {}
+
+
+def model_registry_from_env():
+    """ModelRegistry configurado con MODEL_REGISTRY_*"""
+    return ModelRegistry(
+        os.getenv("MODEL_REGISTRY_PATH") or os.path.join(PROJECT_ROOT, "models"),
+        check_interval=float(os.getenv("MODEL_REGISTRY_CHECK_INTERVAL", "5")),
+        verify_hash=os.getenv("MODEL_REGISTRY_VERIFY_HASH", "true").lower() == "true",
+        compiled=os.getenv("MODEL_REGISTRY_COMPILED", "false").lower() == "true",
+        compiled_max_rows=int(os.getenv("MODEL_REGISTRY_COMPILED_MAX_ROWS", "256")),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registro versionado de modelos de ML")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    listar = sub.add_parser("list", help="versiones registradas")
+    listar.add_argument("name", nargs="?")
+    show = sub.add_parser("show", help="metadata de una versión")
+    show.add_argument("name")
+    show.add_argument("version", nargs="?")
+    promote = sub.add_parser("promote", help="activar una versión")
+    promote.add_argument("name")
+    promote.add_argument("version")
+    importar = sub.add_parser("import", help="registrar un pickle existente")
+    importar.add_argument("name")
+    importar.add_argument("path")
+    importar.add_argument("--no-promote", action="store_true")
+    args = parser.parse_args()
+
+    registry = model_registry_from_env()
+    if args.comando == "list":
+        names = [args.name] if args.name else sorted(
+            entry for entry in os.listdir(registry.root) if os.path.isdir(os.path.join(registry.root, entry))
+        ) if os.path.isdir(registry.root) else []
+        for name in names:
+            current = registry.current_version(name)
+            print(f"📦 {name}")
+            for metadata in registry.versions(name):
+                marca = "⭐" if metadata["version"] == current else "  "
+                print(f"   {marca} {metadata['version']}  {metadata['created_at']}  "
+                      f"{metadata['size_bytes'] / 1e6:.1f} MB  {json.dumps(metadata['metrics'])}")
+    elif args.comando == "show":
+        version = args.version or registry.current_version(args.name)
+        with open(registry._dir(args.name, version, METADATA)) as f:
+            print(f.read())
+    elif args.comando == "promote":
+        registry.promote(args.name, args.version)
+        print(f"✅ {args.name} {args.version} activa")
+    else:
+        metadata = registry.register(args.name, joblib.load(args.path), promote=not args.no_promote,
+                                     training={"imported_from": os.path.abspath(args.path)})
+        print(f"✅ {args.name} registrado como {metadata['version']}")
+
+
+if __name__ == "__main__":
+    main()
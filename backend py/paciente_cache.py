@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Caché de lectura para el detalle de pacientes
+LRU en memoria con TTL y límite de bytes, con un backend compartido opcional
+(Redis o un proceso local que lo sustituye) para varios workers de la API
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def encode_value(value):
+    """Los registros se guardan serializados: tamaño medible y copias independientes"""
+    return json.dumps(value, default=_json_default, separators=(",", ":")).encode()
+
+
+def decode_value(data):
+    return json.loads(data)
+
+
+class RedisCacheBackend:
+    """Backend compartido sobre Redis"""
+
+    def __init__(self, url, prefix="predisalud:paciente:"):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("redis no está instalado (pip install redis)")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5)
+
+    def get(self, key):
+        return self._client.get(self.prefix + key)
+
+    def set(self, key, data, ttl):
+        self._client.set(self.prefix + key, data, ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._client.delete(self.prefix + key)
+
+
+class LocalCacheStore:
+    """Diccionario con expiración servido por el proceso local de caché"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            return entry[0]
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._entries[key] = (data, time.time() + ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def _cache_manager_class():
+    from multiprocessing.managers import BaseManager
+
+    class CacheManager(BaseManager):
+        pass
+
+    return CacheManager
+
+
+def serve_local_cache(host="127.0.0.1", port=6390, authkey=b"predisalud"):
+    """Levantar el proceso de caché compartida en lugar de Redis"""
+    store = LocalCacheStore()
+    manager_class = _cache_manager_class()
+    manager_class.register("get_store", callable=lambda: store)
+    manager = manager_class(address=(host, port), authkey=authkey)
+    print(f"🗄️ Caché de pacientes escuchando en {host}:{port}")
+    manager.get_server().serve_forever()
+
+
+class LocalProcessCacheBackend:
+    """Backend compartido servido por serve_local_cache()"""
+
+    def __init__(self, host="127.0.0.1", port=6390, authkey=b"predisalud"):
+        manager_class = _cache_manager_class()
+        manager_class.register("get_store")
+        self._manager = manager_class(address=(host, port), authkey=authkey)
+        self._manager.connect()
+        self._store = self._manager.get_store()
+        # Los proxies de multiprocessing no son seguros entre hilos
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._store.get(key)
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._store.set(key, data, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._store.delete(key)
+
+
+def backend_from_url(url):
+    """redis://... o local://host:port; vacío = solo caché en memoria"""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCacheBackend(url)
+    if url.startswith("local://"):
+        host, _, port = url[len("local://"):].partition(":")
+        return LocalProcessCacheBackend(host or "127.0.0.1", int(port or 6390))
+    raise ValueError(f"Backend de caché no soportado: {url}")
+
+
+class PacienteCache:
+    """LRU con TTL y límite de memoria; consulta el backend compartido antes que el warehouse"""
+
+    def __init__(self, ttl=300.0, max_entries=10000, max_bytes=64 * 1024 * 1024, backend=None, local_ttl=5.0):
+        self.ttl = ttl
+        # Con backend compartido la copia local vive poco: otros workers pueden invalidar
+        self.local_ttl = min(ttl, local_ttl) if backend is not None else ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Cargas en curso por clave: [cargas, generación]; invalidate() sube la generación
+        self._loads = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._shared_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+        self._backend_errors = 0
+
+    def _store_local(self, key, data, now, generation=None):
+        if len(data) > self.max_bytes:
+            return False
+        with self._lock:
+            if generation is not None and self._generation(key) != generation:
+                # Se invalidó mientras se cargaba: el registro leído ya no es el vigente
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (data, now)
+            self._bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._evictions += 1
+        return True
+
+    def _generation(self, key):
+        load = self._loads.get(key)
+        return load[1] if load is not None else None
+
+    def _backend_call(self, method, *args):
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            with self._lock:
+                self._backend_errors += 1
+            print(f"⚠️ Error en caché compartida ({method}): {str(e)}")
+            return None
+
+    def peek_local(self, key):
+        """Solo la copia en memoria (no bloquea: apto para el event loop); no cuenta fallos"""
+        key = str(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] >= self.local_ttl:
+                del self._entries[key]
+                self._bytes -= len(entry[0])
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return decode_value(entry[0])
+
+    def get(self, key):
+        key = str(key)
+        now = time.monotonic()
+        value = self.peek_local(key)
+        if value is not None:
+            return value
+        if self.backend is not None:
+            data = self._backend_call("get", key)
+            if data is not None:
+                self._store_local(key, data, now)
+                with self._lock:
+                    self._shared_hits += 1
+                return decode_value(data)
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def set(self, key, value):
+        key = str(key)
+        data = encode_value(value)
+        self._store_local(key, data, time.monotonic())
+        if self.backend is not None:
+            self._backend_call("set", key, data, self.ttl)
+
+    def get_or_load(self, key, loader):
+        """Devolver el registro cacheado o cargarlo con loader() (None = no existe, no se cachea)"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        key = str(key)
+        with self._lock:
+            load = self._loads.setdefault(key, [0, 0])
+            load[0] += 1
+            generation = load[1]
+        try:
+            value = loader()
+            if value is None:
+                return None
+            data = encode_value(value)
+            if self._store_local(key, data, time.monotonic(), generation) and self.backend is not None:
+                self._backend_call("set", key, data, self.ttl)
+                with self._lock:
+                    stale = self._generation(key) != generation
+                if stale:
+                    # invalidate() borró la clave compartida antes de este set
+                    self._backend_call("delete", key)
+            return decode_value(data)
+        finally:
+            with self._lock:
+                load[0] -= 1
+                if load[0] == 0:
+                    del self._loads[key]
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(str(key), None)
+                if entry is not None:
+                    self._bytes -= len(entry[0])
+                load = self._loads.get(str(key))
+                if load is not None:
+                    load[1] += 1
+                self._invalidations += 1
+        if self.backend is not None:
+            for key in keys:
+                self._backend_call("delete", str(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._hits + self._shared_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "local_ttl": self.local_ttl,
+                "hits": self._hits,
+                "shared_hits": self._shared_hits,
+                "misses": self._misses,
+                "hit_ratio": round((self._hits + self._shared_hits) / lookups, 4) if lookups else None,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "backend_errors": self._backend_errors,
+            }
+
+
+def paciente_cache_from_env():
+    """PacienteCache configurada con PACIENTES_CACHE_*"""
+    url = os.getenv("PACIENTES_CACHE_BACKEND", "")
+    try:
+        backend = backend_from_url(url)
+    except Exception as e:
+        print(f"⚠️ Caché compartida no disponible ({url}): {str(e)}; se usa solo memoria local")
+        backend = None
+    return PacienteCache(
+        ttl=float(os.getenv("PACIENTES_CACHE_TTL", "300")),
+        max_entries=int(os.getenv("PACIENTES_CACHE_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.getenv("PACIENTES_CACHE_MAX_MB", "64")) * 1024 * 1024,
+        backend=backend,
+        local_ttl=float(os.getenv("PACIENTES_CACHE_LOCAL_TTL", "5")),
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Proceso de caché compartida de pacientes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    serve_local_cache(args.host, args.port)
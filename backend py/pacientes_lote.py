@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Registro masivo de pacientes
+Deduplica DNIs con una sola consulta por bloque e inserta con executemany por lotes;
+la verificación blockchain se encola en el outbox dentro del mismo commit
+"""
+
+import csv
+import io
+import uuid
+
+from blockchain_outbox import encolar_verificaciones
+
+# Columnas del INSERT de pacientes (FECHA_REGISTRO y VERIFICACION_BLOCKCHAIN las fija el SQL)
+INSERT_COLUMNS = (
+    "ID_PACIENTE", "NOMBRE", "APELLIDO", "FECHA_NACIMIENTO", "GENERO", "DNI", "TELEFONO",
+    "EMAIL", "DIRECCION", "CIUDAD", "CODIGO_POSTAL", "GRUPO_SANGUINEO",
+    "ALERGIAS", "MEDICAMENTOS", "ANTECEDENTES",
+    "CONTACTO_EMERGENCIA_NOMBRE", "CONTACTO_EMERGENCIA_RELACION", "CONTACTO_EMERGENCIA_TELEFONO",
+    "CONSENTIMIENTO_DATOS", "CONSENTIMIENTO_EMERGENCIA", "CONSENTIMIENTO_INVESTIGACION",
+)
+
+INSERT_PACIENTE_SQL = f"""
+    INSERT INTO PACIENTES (
+        {", ".join(INSERT_COLUMNS)},
+        FECHA_REGISTRO, VERIFICACION_BLOCKCHAIN
+    ) VALUES (
+        {", ".join(["%s"] * len(INSERT_COLUMNS))}, CURRENT_TIMESTAMP(), FALSE
+    )
+"""
+
+# Máximo de valores en un IN (...) por consulta
+DEDUP_CHUNK_SIZE = 1000
+
+
+def nuevo_paciente_id():
+    """ID de paciente con el mismo formato que el registro individual"""
+    return f"P{str(uuid.uuid4())[:8].upper()}"
+
+
+def paciente_insert_params(paciente_id, paciente):
+    """Parámetros de INSERT_PACIENTE_SQL para un PacienteRegistro"""
+    return (
+        paciente_id, paciente.nombre, paciente.apellidos, paciente.fecha_nacimiento,
+        paciente.genero, paciente.dni, paciente.telefono, paciente.email,
+        paciente.direccion, paciente.ciudad, paciente.codigo_postal,
+        paciente.grupo_sanguineo, paciente.alergias, paciente.medicamentos,
+        paciente.antecedentes, paciente.contacto_emergencia_nombre,
+        paciente.contacto_emergencia_relacion, paciente.contacto_emergencia_telefono,
+        paciente.consentimiento_datos, paciente.consentimiento_emergencia,
+        paciente.consentimiento_investigacion
+    )
+
+
+def dnis_existentes(conn, dnis):
+    """DNIs que ya están en PACIENTES (una consulta por bloque de DEDUP_CHUNK_SIZE)"""
+    encontrados = set()
+    dnis = list(dnis)
+    cur = conn.cursor()
+    try:
+        for start in range(0, len(dnis), DEDUP_CHUNK_SIZE):
+            chunk = dnis[start:start + DEDUP_CHUNK_SIZE]
+            placeholders = ", ".join(["%s"] * len(chunk))
+            cur.execute(f"SELECT DNI FROM PACIENTES WHERE DNI IN ({placeholders})", chunk)
+            encontrados.update(row[0] for row in cur.fetchall())
+    finally:
+        cur.close()
+    return encontrados
+
+
+def leer_csv_pacientes(texto):
+    """Filas del CSV como dicts; las celdas vacías se tratan como ausentes"""
+    reader = csv.DictReader(io.StringIO(texto))
+    filas = []
+    for row in reader:
+        filas.append({
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if key and value is not None and value.strip() != ""
+        })
+    return filas
+
+
+def registrar_lote(conn, pacientes, batch_size=1000):
+    """
+    Registrar una lista de (indice, PacienteRegistro).
+    Devuelve un resultado por fila: registrado, duplicado o error.
+    """
+    resultados = {}
+    existentes = dnis_existentes(conn, {p.dni for _, p in pacientes})
+
+    pendientes = []
+    vistos = set()
+    for indice, paciente in pacientes:
+        if paciente.dni in existentes or paciente.dni in vistos:
+            resultados[indice] = {
+                "fila": indice, "dni": paciente.dni, "status": "duplicado",
+                "error": "Ya existe un paciente con este DNI" if paciente.dni in existentes
+                         else "DNI repetido dentro del lote"
+            }
+            continue
+        vistos.add(paciente.dni)
+        pendientes.append((indice, nuevo_paciente_id(), paciente))
+
+    cur = conn.cursor()
+    try:
+        for start in range(0, len(pendientes), batch_size):
+            lote = pendientes[start:start + batch_size]
+            try:
+                params = [(paciente_id, paciente_insert_params(paciente_id, paciente))
+                          for _, paciente_id, paciente in lote]
+                cur.executemany(INSERT_PACIENTE_SQL, [p for _, p in params])
+                encolar_verificaciones(cur, params)
+                conn.commit()
+                for indice, paciente_id, paciente in lote:
+                    resultados[indice] = {
+                        "fila": indice, "dni": paciente.dni, "status": "registrado",
+                        "paciente_id": paciente_id, "blockchain_status": "PENDIENTE"
+                    }
+            except Exception as e:
+                conn.rollback()
+                for indice, _, paciente in lote:
+                    resultados[indice] = {
+                        "fila": indice, "dni": paciente.dni, "status": "error", "error": str(e)
+                    }
+    finally:
+        cur.close()
+
+    return resultados
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Consultas de pacientes con paginación por cursor (keyset) y filtros
+Ordena por (FECHA_REGISTRO, ID_PACIENTE) descendente sin OFFSET
+"""
+
+import base64
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# Columnas devueltas por el listado y su nombre en la respuesta JSON
+PACIENTE_COLUMNS = (
+    ("ID_PACIENTE", "id"),
+    ("NOMBRE", "nombre"),
+    ("APELLIDO", "apellidos"),
+    ("DNI", "dni"),
+    ("TELEFONO", "telefono"),
+    ("FECHA_NACIMIENTO", "fecha_nacimiento"),
+    ("GENERO", "genero"),
+    ("VERIFICACION_BLOCKCHAIN", "blockchain_verified"),
+    ("FECHA_REGISTRO", "fecha_registro"),
+)
+
+_SELECT_LIST = ", ".join(column for column, _ in PACIENTE_COLUMNS)
+_KEYS = tuple(key for _, key in PACIENTE_COLUMNS)
+_IDX_ID = 0
+_IDX_FECHA_NACIMIENTO = 5
+_IDX_FECHA_REGISTRO = 8
+
+
+class InvalidCursorError(ValueError):
+    """El cursor de paginación no es válido"""
+
+
+def _timestamp_text(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value)
+
+
+def encode_cursor(fecha_registro, id_paciente):
+    """Cursor opaco con la posición del último paciente devuelto"""
+    raw = json.dumps([_timestamp_text(fecha_registro), id_paciente], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Devuelve (fecha_registro, id_paciente) o lanza InvalidCursorError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        fecha_registro, id_paciente = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(fecha_registro), str(id_paciente)
+    except Exception:
+        raise InvalidCursorError("Cursor de paginación inválido")
+
+
+def build_filters(genero=None, verificado=None, desde=None, hasta=None):
+    """Cláusulas WHERE y parámetros para los filtros del listado"""
+    clauses, params = [], []
+    if genero:
+        clauses.append("GENERO = %s")
+        params.append(genero)
+    if verificado is not None:
+        clauses.append("VERIFICACION_BLOCKCHAIN = %s")
+        params.append(bool(verificado))
+    if desde:
+        clauses.append("FECHA_REGISTRO >= %s")
+        params.append(desde.isoformat() if isinstance(desde, date) else str(desde))
+    if hasta:
+        # 'hasta' es inclusivo: se compara contra el inicio del día siguiente
+        if isinstance(hasta, date):
+            clauses.append("FECHA_REGISTRO < %s")
+            params.append((hasta + timedelta(days=1)).isoformat())
+        else:
+            clauses.append("FECHA_REGISTRO <= %s")
+            params.append(str(hasta))
+    return clauses, params
+
+
+def build_page_query(filters, cursor=None, limit=None):
+    """SELECT del listado; con limit pide una fila extra para saber si hay más páginas"""
+    clauses, params = list(filters[0]), list(filters[1])
+    if cursor:
+        fecha_registro, id_paciente = cursor
+        clauses.append("(FECHA_REGISTRO < %s OR (FECHA_REGISTRO = %s AND ID_PACIENTE < %s))")
+        params.extend([fecha_registro, fecha_registro, id_paciente])
+    sql = f"SELECT {_SELECT_LIST} FROM PACIENTES"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY FECHA_REGISTRO DESC, ID_PACIENTE DESC"
+    if limit is not None:
+        sql += f" LIMIT {int(limit) + 1}"
+    return sql, params
+
+
+def build_count_query(filters):
+    clauses, params = filters
+    sql = "SELECT COUNT(*) FROM PACIENTES"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql, list(params)
+
+
+def row_to_paciente(row):
+    """Fila del SELECT -> dict de la respuesta"""
+    paciente = dict(zip(_KEYS, row))
+    paciente["fecha_nacimiento"] = str(row[_IDX_FECHA_NACIMIENTO])
+    paciente["fecha_registro"] = _timestamp_text(row[_IDX_FECHA_REGISTRO]) if row[_IDX_FECHA_REGISTRO] is not None else None
+    return paciente
+
+
+def next_cursor_for(rows):
+    """Cursor que apunta después de la última fila de la página"""
+    last = rows[-1]
+    return encode_cursor(last[_IDX_FECHA_REGISTRO], last[_IDX_ID])
+
+
+def fetch_page(conn, filters, cursor=None, limit=50):
+    """Ejecutar una página del listado: (filas, next_cursor)"""
+    sql, params = build_page_query(filters, cursor, limit)
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (next_cursor_for(rows) if has_more and rows else None)
+
+
+class CountCache:
+    """Conteos por combinación de filtros, válidos durante `ttl` segundos"""
+
+    def __init__(self, ttl=60.0, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[1] < self.ttl:
+                return entry[0]
+        value = compute()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                del self._entries[oldest]
+            self._entries[key] = (value, now)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def count_pacientes(conn, filters):
+    sql, params = build_count_query(filters)
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Hash de contraseñas (bcrypt) en un pool de procesos dedicado
+Las rutas de login/registro no ocupan el worker de la API con trabajo de CPU;
+incluye límite de intentos por usuario e IP y rehash cuando cambia el costo configurado
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from async_executors import BoundedExecutor
+
+# CryptContext por proceso y por costo (se construye una vez en cada worker)
+_contexts = {}
+
+
+def _context(rounds):
+    context = _contexts.get(rounds)
+    if context is None:
+        from passlib.context import CryptContext
+
+        # min = max = rounds: cualquier hash con otro costo se marca para rehash
+        context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto",
+            bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds, bcrypt__max_rounds=rounds,
+        )
+        _contexts[rounds] = context
+    return context
+
+
+def hash_password(password, rounds):
+    """Hash bcrypt con el costo indicado (se ejecuta en el pool de procesos)"""
+    return _context(rounds).hash(password)
+
+
+def verify_password(password, hashed, rounds):
+    """(válida, nuevo_hash): nuevo_hash no es None si el hash usa otro costo"""
+    if not hashed:
+        return False, None
+    try:
+        return _context(rounds).verify_and_update(password, hashed)
+    except ValueError:
+        # Hash con formato desconocido
+        return False, None
+
+
+class PasswordHasher:
+    """bcrypt en procesos con cola acotada (ExecutorSaturatedError -> 503 + Retry-After)"""
+
+    def __init__(self, rounds=12, workers=None, max_queue=None, retry_after=1):
+        self.rounds = rounds
+        self.executor = BoundedExecutor(
+            "bcrypt", workers or os.cpu_count() or 1,
+            max_queue=max_queue, retry_after=retry_after, processes=True
+        )
+
+    async def hash(self, password):
+        return await self.executor.run(hash_password, password, self.rounds)
+
+    async def verify(self, password, hashed):
+        return await self.executor.run(verify_password, password, hashed, self.rounds)
+
+    def hash_sync(self, password):
+        return self.executor.call(hash_password, password, self.rounds)
+
+    def verify_sync(self, password, hashed):
+        return self.executor.call(verify_password, password, hashed, self.rounds)
+
+    def metrics(self):
+        return {"rounds": self.rounds, **self.executor.metrics()}
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+def password_hasher_from_env():
+    """PasswordHasher configurado con BCRYPT_*"""
+    workers = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+    return PasswordHasher(
+        rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+        workers=workers,
+        max_queue=int(os.getenv("BCRYPT_QUEUE", str(workers * 8))),
+        retry_after=int(os.getenv("BCRYPT_RETRY_AFTER", "1")),
+    )
+
+
+class LoginRateLimiter:
+    """
+    Ventanas deslizantes de intentos de login por (usuario, IP) y por IP
+    Los intentos desde otra IP no bloquean la cuenta; una IP que prueba muchos usuarios
+    se frena con su propio límite
+    """
+
+    def __init__(self, max_attempts=10, window=60.0, max_users=100000, max_attempts_per_ip=100):
+        self.max_attempts = max_attempts
+        self.max_attempts_per_ip = max_attempts_per_ip
+        self.window = window
+        self.max_users = max_users
+        # Ordenados por último intento: al llenarse se descarta el menos reciente
+        self._attempts = OrderedDict()
+        self._ip_attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, username, client_ip=None):
+        """Registrar un intento; devuelve 0 si se permite o los segundos a esperar"""
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._bucket(self._attempts, self._key(username, client_ip), now)
+            limits = [(attempts, self.max_attempts)]
+            if client_ip:
+                limits.append((self._bucket(self._ip_attempts, client_ip, now), self.max_attempts_per_ip))
+            wait = max(self._wait(bucket, limit, now) for bucket, limit in limits)
+            if wait:
+                return wait
+            for bucket, _ in limits:
+                bucket.append(now)
+            return 0
+
+    def reset(self, username, client_ip=None):
+        """Login correcto: se olvidan los fallos del usuario desde esa IP (no el límite de la IP)"""
+        with self._lock:
+            self._attempts.pop(self._key(username, client_ip), None)
+
+    @staticmethod
+    def _key(username, client_ip):
+        return (username or "").lower(), client_ip or ""
+
+    def _bucket(self, buckets, key, now):
+        attempts = buckets.get(key)
+        if attempts is None:
+            if len(buckets) >= self.max_users:
+                self._purge(buckets, now)
+            while len(buckets) >= self.max_users:
+                # Todas activas: se descarta la de intento más antiguo en lugar de crecer sin límite
+                buckets.popitem(last=False)
+            attempts = buckets[key] = deque()
+        else:
+            buckets.move_to_end(key)
+        while attempts and now - attempts[0] >= self.window:
+            attempts.popleft()
+        return attempts
+
+    def _wait(self, attempts, limit, now):
+        if len(attempts) < limit:
+            return 0
+        return max(1, int(self.window - (now - attempts[0])) + 1)
+
+    def _purge(self, buckets, now):
+        stale = [key for key, attempts in buckets.items()
+                 if not attempts or now - attempts[-1] >= self.window]
+        for key in stale:
+            del buckets[key]
+
+
+def login_rate_limiter_from_env():
+    return LoginRateLimiter(
+        max_attempts=int(os.getenv("LOGIN_MAX_ATTEMPTS", "10")),
+        window=float(os.getenv("LOGIN_WINDOW_SECONDS", "60")),
+        max_attempts_per_ip=int(os.getenv("LOGIN_MAX_ATTEMPTS_PER_IP", "100")),
+    )
@@ -153,6 +153,8 @@ def test_blockchain_connection():
         if status['connected']:
             print("✅ Conexión a blockchain exitosa")
             print(f"📊 Último bloque: {status['latest_block']}")
+            # Direcciones recién desplegadas, leídas por el registro compartido
+            print(f"📋 Contratos configurados: {blockchain.registry.deployed()}")
             return True
         else:
             print("❌ No se pudo conectar a blockchain")
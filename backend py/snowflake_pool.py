@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Pool de conexiones Snowflake compartido por las APIs
+Evita el handshake completo de snowflake.connector.connect en cada request
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """No se pudo obtener una conexión del pool dentro del tiempo límite"""
+
+
+class _PooledConnection:
+    """Conexión física con sus marcas de tiempo"""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+def _default_connect(**config):
+    import snowflake.connector
+    return snowflake.connector.connect(**config)
+
+
+class SnowflakeConnectionPool:
+    """Pool acotado de conexiones con health check, expiración por inactividad y vida máxima"""
+
+    def __init__(self, config, max_size=10, min_size=0, checkout_timeout=30.0,
+                 idle_timeout=300.0, max_lifetime=3600.0, ping_after=60.0,
+                 reap_interval=30.0, connect=None):
+        self.config = dict(config)
+        self.max_size = max_size
+        self.min_size = min_size
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self._connect = connect or _default_connect
+
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}
+        self._total = 0
+        self._closed = False
+
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "connect_errors": 0,
+            "evicted_idle": 0,
+            "evicted_lifetime": 0,
+            "health_check_failures": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "connect_time_total": 0.0,
+            "connect_time_max": 0.0,
+        }
+
+        self._reaper = None
+        if reap_interval:
+            self._reaper = threading.Thread(
+                target=self._reap_loop, args=(reap_interval,),
+                name="snowflake-pool-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    # ----- ciclo de vida de conexiones físicas -----
+
+    def _open(self):
+        start = time.perf_counter()
+        try:
+            conn = self._connect(**self.config)
+        except Exception:
+            with self._lock:
+                self._total -= 1
+                self._stats["connect_errors"] += 1
+                self._lock.notify()
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["connects"] += 1
+            self._stats["connect_time_total"] += elapsed
+            self._stats["connect_time_max"] = max(self._stats["connect_time_max"], elapsed)
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, pooled, now):
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            return "evicted_lifetime"
+        if self.idle_timeout and now - pooled.last_used > self.idle_timeout:
+            return "evicted_idle"
+        return None
+
+    def _healthy(self, pooled, now):
+        """Verifica la conexión; solo hace round-trip si estuvo inactiva un rato"""
+        conn = pooled.conn
+        try:
+            if getattr(conn, "is_closed", None) and conn.is_closed():
+                return False
+            if self.ping_after is not None and now - pooled.last_used >= self.ping_after:
+                cur = conn.cursor()
+                try:
+                    cur.execute("SELECT 1")
+                    cur.fetchone()
+                finally:
+                    cur.close()
+            return True
+        except Exception:
+            return False
+
+    # ----- checkout / checkin -----
+
+    def acquire(self, timeout=None):
+        """Obtener una conexión; lanza PoolTimeoutError si el pool está saturado"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        while True:
+            pooled = None
+            create = False
+            stale = []
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("El pool de conexiones está cerrado")
+                while pooled is None and not create:
+                    now = time.monotonic()
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        reason = self._expired(candidate, now)
+                        if reason:
+                            self._total -= 1
+                            self._stats[reason] += 1
+                            stale.append(candidate)
+                            continue
+                        pooled = candidate
+                        break
+                    if pooled is None and self._total < self.max_size:
+                        self._total += 1
+                        create = True
+                    if pooled is None and not create:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            raise PoolTimeoutError(
+                                f"Pool Snowflake saturado ({self.max_size} conexiones en uso)"
+                            )
+                        self._lock.wait(remaining)
+
+            for candidate in stale:
+                self._discard(candidate)
+
+            if create:
+                pooled = self._open()
+            elif not self._healthy(pooled, time.monotonic()):
+                with self._lock:
+                    self._total -= 1
+                    self._stats["health_check_failures"] += 1
+                    self._lock.notify()
+                self._discard(pooled)
+                continue
+
+            waited = time.monotonic() - start
+            with self._lock:
+                self._in_use[id(pooled.conn)] = pooled
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total"] += waited
+                self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            return pooled.conn
+
+    def release(self, conn, discard=False):
+        """Devolver una conexión al pool (o descartarla si quedó inutilizable)"""
+        with self._lock:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            return
+
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        now = time.monotonic()
+        with self._lock:
+            if discard or self._closed or (self.max_lifetime and now - pooled.created_at > self.max_lifetime):
+                self._total -= 1
+                if not discard and not self._closed:
+                    self._stats["evicted_lifetime"] += 1
+                self._lock.notify()
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+                self._lock.notify()
+                return
+        self._discard(pooled)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager: with pool.connection() as conn: ..."""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            self.release(conn, discard=is_connection_broken(conn))
+            raise
+        else:
+            self.release(conn)
+
+    def ping(self, timeout=5.0):
+        """Verificar que Snowflake responde usando una conexión del pool"""
+        with self.connection(timeout) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+        return True
+
+    # ----- mantenimiento -----
+
+    def evict_idle(self):
+        """Cerrar conexiones inactivas o que superaron su vida máxima"""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            keep = deque()
+            for pooled in self._idle:
+                reason = self._expired(pooled, now)
+                if reason and self._total - len(stale) > self.min_size:
+                    self._stats[reason] += 1
+                    stale.append(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+            self._total -= len(stale)
+            if stale:
+                self._lock.notify(len(stale))
+        for pooled in stale:
+            self._discard(pooled)
+        return len(stale)
+
+    def warmup(self):
+        """Abrir min_size conexiones por adelantado"""
+        while True:
+            with self._lock:
+                if self._total >= self.min_size or self._closed:
+                    return
+                self._total += 1
+            pooled = self._open()
+            with self._lock:
+                self._idle.append(pooled)
+                self._lock.notify()
+
+    def _reap_loop(self, interval):
+        while not self._closed:
+            time.sleep(interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                print(f"⚠️ Error limpiando pool Snowflake: {str(e)}")
+
+    def close(self):
+        """Cerrar todas las conexiones inactivas; las prestadas se cierran al devolverse"""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._total -= len(idle)
+            self._lock.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def metrics(self):
+        """Métricas del pool para monitoreo"""
+        with self._lock:
+            stats = dict(self._stats)
+            in_use = len(self._in_use)
+            idle = len(self._idle)
+            total = self._total
+        checkouts = stats["checkouts"] or 1
+        connects = stats["connects"] or 1
+        return {
+            "max_size": self.max_size,
+            "size": total,
+            "in_use": in_use,
+            "idle": idle,
+            "checkouts": stats["checkouts"],
+            "timeouts": stats["timeouts"],
+            "connects": stats["connects"],
+            "connect_errors": stats["connect_errors"],
+            "evicted_idle": stats["evicted_idle"],
+            "evicted_lifetime": stats["evicted_lifetime"],
+            "health_check_failures": stats["health_check_failures"],
+            "wait_time_avg_ms": round(stats["wait_time_total"] / checkouts * 1000, 3),
+            "wait_time_max_ms": round(stats["wait_time_max"] * 1000, 3),
+            "connect_latency_avg_ms": round(stats["connect_time_total"] / connects * 1000, 3),
+            "connect_latency_max_ms": round(stats["connect_time_max"] * 1000, 3),
+        }
+
+
+def is_connection_broken(conn):
+    """Si la conexión quedó cerrada tras un error, no se devuelve al pool"""
+    try:
+        return bool(getattr(conn, "is_closed", None) and conn.is_closed())
+    except Exception:
+        return True
+
+
+# ----- pool compartido por proceso -----
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def snowflake_config_from_env():
+    """Parámetros de conexión SNOWFLAKE_* (para scripts fuera de las APIs)"""
+    return {
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "database": os.getenv("SNOWFLAKE_DATABASE"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+    }
+
+
+def get_pool(config, **kwargs):
+    """Pool compartido por proceso para una configuración de conexión dada"""
+    key = tuple(sorted((k, str(v)) for k, v in config.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = {
+                "max_size": int(os.getenv("SNOWFLAKE_POOL_MAX_SIZE", "10")),
+                "min_size": int(os.getenv("SNOWFLAKE_POOL_MIN_SIZE", "0")),
+                "checkout_timeout": float(os.getenv("SNOWFLAKE_POOL_TIMEOUT", "30")),
+                "idle_timeout": float(os.getenv("SNOWFLAKE_POOL_IDLE_TIMEOUT", "300")),
+                "max_lifetime": float(os.getenv("SNOWFLAKE_POOL_MAX_LIFETIME", "3600")),
+                "ping_after": float(os.getenv("SNOWFLAKE_POOL_PING_AFTER", "60")),
+            }
+            options.update(kwargs)
+            pool = SnowflakeConnectionPool(config, **options)
+            _pools[key] = pool
+        return pool
+
+
+def make_connection_dependency(pool):
+    """Crear una dependencia FastAPI que presta una conexión del pool por request"""
+    from fastapi import HTTPException
+
+    def get_db_connection():
+        try:
+            conn = pool.acquire()
+        except PoolTimeoutError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except Exception as e:
+            print(f"Error conectando a Snowflake: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error de conexión a la base de datos")
+        try:
+            yield conn
+        except Exception:
+            pool.release(conn, discard=is_connection_broken(conn))
+            raise
+        else:
+            pool.release(conn)
+
+    return get_db_connection
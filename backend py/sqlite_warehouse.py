@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Base de datos local que imita a Snowflake para benchmarks y pruebas sin warehouse
+Acepta el mismo SQL que usan las APIs (%s, %(nombre)s, CURRENT_TIMESTAMP())
+"""
+
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS PACIENTES (
+    ID_PACIENTE TEXT PRIMARY KEY,
+    NOMBRE TEXT, APELLIDO TEXT, FECHA_NACIMIENTO TEXT, GENERO TEXT,
+    DNI TEXT, TELEFONO TEXT, EMAIL TEXT, DIRECCION TEXT, CIUDAD TEXT,
+    CODIGO_POSTAL TEXT, GRUPO_SANGUINEO TEXT, ALERGIAS TEXT, MEDICAMENTOS TEXT,
+    ANTECEDENTES TEXT, CONTACTO_EMERGENCIA_NOMBRE TEXT,
+    CONTACTO_EMERGENCIA_RELACION TEXT, CONTACTO_EMERGENCIA_TELEFONO TEXT,
+    CONSENTIMIENTO_DATOS BOOLEAN, CONSENTIMIENTO_EMERGENCIA BOOLEAN,
+    CONSENTIMIENTO_INVESTIGACION BOOLEAN,
+    DOMICILIO_COMPLETO TEXT, MUNICIPIO TEXT, ANTECEDENTES_PERSONALES TEXT,
+    FECHA_CONSULTA TEXT, HORA_CONSULTA TEXT, SINTOMAS TEXT, CLASIFICACION_RIESGO TEXT,
+    FECHA_REGISTRO TIMESTAMP, VERIFICACION_BLOCKCHAIN BOOLEAN DEFAULT FALSE,
+    ACTIVO BOOLEAN DEFAULT TRUE
+);
+CREATE INDEX IF NOT EXISTS IDX_PACIENTES_DNI ON PACIENTES (DNI);
+CREATE TABLE IF NOT EXISTS USUARIOS (
+    ID_USUARIO TEXT, NOMBRE_USUARIO TEXT, USERNAME TEXT, PASSWORD TEXT,
+    PASSWORD_HASH TEXT, EMAIL TEXT, ROL TEXT, FECHA_REGISTRO TIMESTAMP,
+    ACTIVO BOOLEAN DEFAULT TRUE
+);
+CREATE TABLE IF NOT EXISTS CONSULTAS (
+    ID_CONSULTA TEXT PRIMARY KEY, ID_PACIENTE TEXT, ID_USUARIO TEXT,
+    FECHA_CONSULTA TEXT, MOTIVO_CONSULTA TEXT, SINTOMAS TEXT,
+    ESTADO_CONSULTA TEXT, FECHA_CREACION TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS REGISTROS_ANCLADOS (
+    HASH_REGISTRO TEXT PRIMARY KEY, ID_PACIENTE TEXT, DIAGNOSTICO TEXT,
+    TRATAMIENTO TEXT, TIMESTAMP_REGISTRO INTEGER, DOCTOR TEXT, RAIZ_MERKLE TEXT,
+    PRUEBA_MERKLE TEXT, INDICE_LOTE INTEGER, TX_HASH TEXT, BLOQUE INTEGER,
+    ESTADO TEXT DEFAULT 'PENDIENTE', FECHA_CREACION TIMESTAMP, FECHA_ANCLAJE TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS OUTBOX_BLOCKCHAIN (
+    ID_JOB TEXT PRIMARY KEY, ID_PACIENTE TEXT, HASH_DATOS TEXT, ESTADO TEXT DEFAULT 'PENDIENTE',
+    INTENTOS INTEGER DEFAULT 0, ULTIMO_ERROR TEXT, PROXIMO_INTENTO REAL DEFAULT 0,
+    RECLAMADO_POR TEXT, RECLAMADO_EN REAL, RAIZ_MERKLE TEXT, PRUEBA_MERKLE TEXT, TX_HASH TEXT,
+    BLOQUE INTEGER, FECHA_CREACION TIMESTAMP, FECHA_CONFIRMACION TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS IDX_OUTBOX_ESTADO ON OUTBOX_BLOCKCHAIN (ESTADO, PROXIMO_INTENTO);
+"""
+
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+
+
+def _translate(sql):
+    """Adaptar el SQL estilo Snowflake/pyformat a sqlite"""
+    sql = _NAMED_PARAM.sub(r":\1", sql)
+    sql = sql.replace("%s", "?")
+    sql = sql.replace("CURRENT_TIMESTAMP()", "CURRENT_TIMESTAMP")
+    sql = sql.replace("CURRENT_DATE()", "CURRENT_DATE")
+    return sql
+
+
+class SQLiteCursor:
+    """Cursor con la interfaz mínima de snowflake.connector usada en el proyecto"""
+
+    def __init__(self, conn, latency):
+        self._cursor = conn.cursor()
+        self._latency = latency
+
+    def _round_trip(self):
+        if self._latency:
+            time.sleep(self._latency)
+
+    def execute(self, sql, params=None):
+        self._round_trip()
+        self._cursor.execute(_translate(sql), params or ())
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._round_trip()
+        self._cursor.executemany(_translate(sql), seq_of_params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """Conexión con la interfaz mínima de snowflake.connector"""
+
+    def __init__(self, path, latency, connect_latency):
+        if connect_latency:
+            time.sleep(connect_latency)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._latency = latency
+        self._closed = False
+
+    def cursor(self):
+        return SQLiteCursor(self._conn, self._latency)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._closed = True
+        self._conn.close()
+
+    def is_closed(self):
+        return self._closed
+
+
+class SQLiteWarehouse:
+    """Base sqlite en disco que sustituye a Snowflake; se usa como connect= del pool"""
+
+    def __init__(self, path=None, latency=0.0, connect_latency=0.0):
+        self.path = path or os.path.join(tempfile.mkdtemp(prefix="predisalud_"), "warehouse.db")
+        self.latency = latency
+        self.connect_latency = connect_latency
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.commit()
+        conn.close()
+
+    def connect(self, **config):
+        """Firma compatible con snowflake.connector.connect(**config)"""
+        return SQLiteConnection(self.path, self.latency, self.connect_latency)
+
+    def seed_pacientes(self, count, seed=42):
+        """Insertar pacientes sintéticos"""
+        rng = random.Random(seed)
+        base = datetime(2024, 1, 1)
+        rows = []
+        for i in range(count):
+            rows.append((
+                f"P{i:08d}",
+                f"Nombre{i}", f"Apellido{i}",
+                (base - timedelta(days=rng.randint(6000, 30000))).date().isoformat(),
+                rng.choice(["M", "F"]), f"{10000000 + i}", f"55{rng.randint(10000000, 99999999)}",
+                (base + timedelta(minutes=i)).isoformat(sep=" "),
+                rng.random() < 0.7,
+            ))
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.executemany("""
+            INSERT INTO PACIENTES (ID_PACIENTE, NOMBRE, APELLIDO, FECHA_NACIMIENTO, GENERO,
+                                   DNI, TELEFONO, FECHA_REGISTRO, VERIFICACION_BLOCKCHAIN)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+        conn.close()
+        return len(rows)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Páginas HTML de PrediSalud/templates servidas desde memoria
+Se indexan una vez al arrancar, con variantes gzip/brotli precomprimidas,
+ETag fuerte, Cache-Control y respuestas 304
+"""
+
+import gzip
+import hashlib
+import os
+from email.utils import formatdate
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Rutas que no coinciden con el nombre del archivo: ruta -> archivo en templates
+PAGE_ALIASES = {
+    "/": "index.html",
+    "/login": "login.html",
+    "/login-new": "login.html",
+    "/dashboard": "dashboard_mejorado.html",
+    "/dashboard.html": "dashboard_mejorado.html",
+    "/registro": "registro.html",
+    "/calendar.html": "appoinment.html",
+    # Páginas de la plantilla que no existen, redirigidas a páginas relevantes
+    "/form_elements.html": "registro_pacientes.html",
+    "/table_basic.html": "table-databases.html",
+    "/table_advanced.html": "table-databases.html",
+    "/table_datatables.html": "table-databases.html",
+    "/chart-inline.html": "dashboard-analytics.html",
+    "/chart-chartjs.html": "dashboard-analytics.html",
+    "/chart-apexcharts.html": "dashboard-analytics.html",
+    "/form_advanced.html": "dashboard-analytics.html",
+    "/form_wizard.html": "dashboard-analytics.html",
+    "/datamaps.html": "grupos_riesgo_professional.html",
+    "/form_validation.html": "grupos_riesgo_professional.html",
+}
+
+# Por debajo de este tamaño comprimir no compensa
+MIN_COMPRESS_SIZE = 512
+
+
+def _accepted_encodings(header):
+    """Codificaciones aceptadas con q > 0 según Accept-Encoding"""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+class StaticPage:
+    """Una página HTML con sus variantes comprimidas"""
+
+    def __init__(self, path, body, mtime):
+        self.path = path
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.variants = {"identity": (body, self.etag)}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = (compressed, f'"{digest}-gzip"')
+            if BROTLI_AVAILABLE:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = (compressed, f'"{digest}-br"')
+        self._etags = {etag for _, etag in self.variants.values()}
+
+    def select(self, accept_encoding):
+        """(codificación, cuerpo, etag) preferida: br > gzip > identity"""
+        accepted = _accepted_encodings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in self.variants and (coding in accepted or "*" in accepted):
+                body, etag = self.variants[coding]
+                return coding, body, etag
+        body, etag = self.variants["identity"]
+        return "identity", body, etag
+
+    def not_modified(self, if_none_match):
+        """If-None-Match coincide con alguna variante (comparación débil, RFC 9110)"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag in self._etags:
+                return True
+        return False
+
+
+class StaticPageTable:
+    """Tabla de rutas -> páginas construida una sola vez al arrancar"""
+
+    def __init__(self, directory, aliases=None, fallback="index.html", max_age=300):
+        self.directory = directory
+        self.fallback = fallback
+        self.cache_control = f"public, max-age={int(max_age)}"
+        self.pages = {}
+        self.routes = {}
+        self._load(aliases or {})
+
+    def _load(self, aliases):
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".html"):
+                continue
+            full_path = os.path.join(self.directory, name)
+            if not os.path.isfile(full_path):
+                continue
+            with open(full_path, "rb") as f:
+                body = f.read()
+            self.pages[name] = StaticPage(full_path, body, os.path.getmtime(full_path))
+            self.routes[f"/{name}"] = self.pages[name]
+        for route, name in aliases.items():
+            if name in self.pages:
+                self.routes[route] = self.pages[name]
+            else:
+                print(f"⚠️ Página {name} no encontrada para la ruta {route}; se sirve {self.fallback}")
+        if self.fallback not in self.pages:
+            raise FileNotFoundError(f"Falta la página por defecto {self.fallback} en {self.directory}")
+
+    def page_for(self, route):
+        """Página de la ruta, o la página por defecto si no existe"""
+        return self.routes.get(route) or self.pages[self.fallback]
+
+    def response(self, request, page):
+        from fastapi.responses import Response
+
+        coding, body, etag = page.select(request.headers.get("accept-encoding"))
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Last-Modified": page.last_modified,
+            "Vary": "Accept-Encoding",
+        }
+        if page.not_modified(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(content=body, media_type="text/html; charset=utf-8", headers=headers)
+
+    def install(self, app):
+        """Registrar una ruta GET por alias y la ruta genérica /{page_name}.html"""
+        from fastapi import Request
+
+        def make_endpoint(page):
+            async def serve_page(request: Request):
+                return self.response(request, page)
+            return serve_page
+
+        # Las rutas .html (incluidos los alias) las resuelve la ruta genérica
+        for route, page in self.routes.items():
+            if not route.endswith(".html"):
+                app.add_api_route(route, make_endpoint(page), methods=["GET"], include_in_schema=False)
+
+        @app.get("/{page_name}.html", include_in_schema=False)
+        async def serve_html_page(page_name: str, request: Request):
+            """Páginas de templates; las desconocidas reciben la página por defecto"""
+            return self.response(request, self.page_for(f"/{page_name}.html"))
+
+    def metrics(self):
+        return {
+            "pages": len(self.pages),
+            "routes": len(self.routes),
+            "bytes": {
+                coding: sum(len(p.variants[coding][0]) for p in self.pages.values() if coding in p.variants)
+                for coding in ("identity", "gzip", "br")
+            },
+            "brotli": BROTLI_AVAILABLE,
+        }
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Prueba de concurrencia de la dependencia de conexiones async
+Más requests que conexiones en el pool: ninguno debe quedar esperando el checkout_timeout
+(las esperas por conexión no pueden ocupar los workers del warehouse)
+"""
+
+import asyncio
+import time
+
+from async_executors import BoundedExecutor, make_async_connection_dependency
+from snowflake_pool import SnowflakeConnectionPool
+from sqlite_warehouse import SQLiteWarehouse
+
+
+def _consulta(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COUNT(*) FROM PACIENTES")
+        cur.fetchone()
+    finally:
+        cur.close()
+    time.sleep(0.05)
+
+
+async def _request(get_db_connection, executor):
+    # Igual que FastAPI: tomar la conexión, usarla en el executor y cerrar la dependencia
+    dependency = get_db_connection()
+    conn = await dependency.__anext__()
+    try:
+        await executor.run(_consulta, conn)
+    finally:
+        try:
+            await dependency.__anext__()
+        except StopAsyncIteration:
+            pass
+
+
+def test_mas_requests_que_conexiones():
+    """Pool de 4, 4 workers, 8 requests concurrentes de 50 ms: todos terminan sin timeout"""
+    warehouse = SQLiteWarehouse()
+    pool = SnowflakeConnectionPool({}, max_size=4, checkout_timeout=3.0, connect=warehouse.connect)
+    executor = BoundedExecutor("warehouse", 4, max_queue=8)
+    get_db_connection = make_async_connection_dependency(pool, executor)
+
+    async def run_all():
+        return await asyncio.gather(
+            *[_request(get_db_connection, executor) for _ in range(8)], return_exceptions=True
+        )
+
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(run_all())
+        elapsed = time.perf_counter() - start
+    finally:
+        executor.shutdown()
+        get_db_connection.acquirer.shutdown()
+        pool.close()
+
+    errores = [r for r in results if isinstance(r, Exception)]
+    assert not errores, f"Requests fallidos: {errores}"
+    # Dos tandas de 50 ms; cualquier espera del checkout_timeout (3 s) es un bloqueo
+    assert elapsed < 1.5, f"Los requests tardaron {elapsed:.2f}s"
+    print(f"✅ 8 requests con un pool de 4 conexiones en {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    test_mas_requests_que_conexiones()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Prueba de la inferencia compilada con los parámetros de entrenamiento reales
+Bosques con max_depth, min_samples_leaf=2 y class_weight='balanced' (hojas impuras, pesos no
+enteros): FlatForest debe reproducir predict_proba de sklearn bit a bit y exportarse al registro
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from forest_inference import FLAT_DIR, FlatForest, export_version, matches_sklearn
+from model_registry import ModelRegistry
+from train_models import MODELS
+
+FEATURES = 9
+
+
+def _training_data(rows=4000, seed=7):
+    # Tres clases desbalanceadas con ruido: hojas mezcladas como en los datos clínicos
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 1, (rows, FEATURES))
+    score = X[:, 0] + 0.5 * X[:, 1] + rng.normal(0, 1, rows)
+    y = np.digitize(score, [0.8, 2.0])
+    return X, y
+
+
+def _train(name, n_jobs=-1, estimators=60):
+    from sklearn.ensemble import RandomForestClassifier
+
+    # Mismos parámetros que train_model (train_models.py), con menos árboles
+    params = {
+        "n_estimators": estimators,
+        "max_depth": MODELS[name]['max_depth'],
+        "min_samples_leaf": 2,
+        "class_weight": "balanced",
+        "random_state": 42,
+    }
+    X, y = _training_data()
+    return RandomForestClassifier(n_jobs=n_jobs, **params).fit(X, y)
+
+
+def test_coincide_con_sklearn_con_parametros_de_entrenamiento():
+    for name in MODELS:
+        model = _train(name)
+        flat = FlatForest.from_sklearn(model)
+        assert matches_sklearn(model, flat, rows=5000), f"{name}: predicciones distintas a sklearn"
+        # matches_sklearn compara con un hilo pero no cambia la configuración del modelo
+        assert model.n_jobs == -1
+        # Un paciente a la vez, como en el servicio
+        X = np.random.default_rng(1).normal(0, 2, (200, FEATURES))
+        model.n_jobs = 1
+        for row in X:
+            assert np.array_equal(model.predict_proba(row.reshape(1, -1)), flat.predict_proba(row)), name
+
+
+def test_export_version_en_el_registro():
+    name = "risk_classification"
+    model = _train(name)
+    registry = ModelRegistry(tempfile.mkdtemp(prefix="modelos_"), feature_names=[f"f{i}" for i in range(FEATURES)])
+    metadata = registry.register(name, model)
+    directory = registry._dir(name, metadata["version"])
+
+    flat = export_version(directory, model, rows=5000)
+    loaded = FlatForest.load(os.path.join(directory, FLAT_DIR), verify_hash=True)
+    X = np.random.default_rng(2).normal(0, 2, (1000, FEATURES))
+    assert np.array_equal(loaded.predict_proba(X), flat.predict_proba(X))
+
+
+if __name__ == "__main__":
+    test_coincide_con_sklearn_con_parametros_de_entrenamiento()
+    test_export_version_en_el_registro()
+    print("✅ Inferencia compilada idéntica a sklearn con los parámetros de train_models.py")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Verificación de JWT compartida por las APIs
+Cachea los claims ya verificados por digest del token hasta su `exp` (LRU acotado)
+y mantiene una lista de tokens revocados por /api/auth/logout
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+
+class InvalidTokenError(Exception):
+    """Token ausente, inválido, expirado o revocado"""
+
+    def __init__(self, detail="Token inválido"):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def token_from_header(authorization):
+    """Extraer el token de 'Authorization: Bearer <token>'"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise InvalidTokenError("Token requerido")
+    return authorization.split(" ", 1)[1].strip()
+
+
+def _digest(token):
+    # Solo se guarda el hash: el cache no retiene tokens utilizables
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenVerifier:
+    """jwt.decode con cache de claims por token y revocación hasta la expiración"""
+
+    def __init__(self, secret_key, algorithm="HS256", max_entries=10000, max_ttl=300.0):
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        # Tokens sin 'exp' solo se cachean este tiempo
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._rejected = 0
+
+    def _expires_at(self, claims, now):
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            return float(exp)
+        return now + self.max_ttl
+
+    def _purge_revoked(self, now):
+        expired = [key for key, expires_at in self._revoked.items() if expires_at <= now]
+        for key in expired:
+            del self._revoked[key]
+
+    def verify(self, token):
+        """Claims del token; lanza InvalidTokenError si no es válido"""
+        key = _digest(token)
+        now = time.time()
+        with self._lock:
+            if key in self._revoked:
+                self._rejected += 1
+                raise InvalidTokenError("Token revocado")
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return dict(claims)
+                del self._entries[key]
+                self._rejected += 1
+                raise InvalidTokenError("Token expirado")
+            self._misses += 1
+
+        try:
+            claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except jwt.ExpiredSignatureError:
+            with self._lock:
+                self._rejected += 1
+            raise InvalidTokenError("Token expirado")
+        except Exception:
+            with self._lock:
+                self._rejected += 1
+            raise InvalidTokenError("Token inválido")
+        if claims.get("sub") is None:
+            with self._lock:
+                self._rejected += 1
+            raise InvalidTokenError("Token inválido")
+
+        with self._lock:
+            # Un logout concurrente pudo revocarlo mientras se decodificaba
+            if key in self._revoked:
+                self._rejected += 1
+                raise InvalidTokenError("Token revocado")
+            self._entries[key] = (claims, self._expires_at(claims, now))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(claims)
+
+    def verify_header(self, authorization):
+        return self.verify(token_from_header(authorization))
+
+    def revoke(self, token):
+        """Revocar un token hasta su expiración (logout)"""
+        try:
+            claims = self.verify(token)
+        except InvalidTokenError:
+            # Inválido, expirado o ya revocado: no hay nada que revocar
+            return False
+        key = _digest(token)
+        now = time.time()
+        with self._lock:
+            self._purge_revoked(now)
+            self._revoked[key] = self._expires_at(claims, now)
+            self._entries.pop(key, None)
+        return True
+
+    def metrics(self):
+        with self._lock:
+            self._purge_revoked(time.time())
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "revoked": len(self._revoked),
+                "hits": self._hits,
+                "misses": self._misses,
+                "rejected": self._rejected,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Entrenamiento de los modelos de riesgo, enfermedad y readmisión
+Construye conjuntos de entrenamiento correctos en el tiempo desde el warehouse o desde los CSV
+de `archivos csv/`: para cada fecha de corte T se calculan las siete características con los
+datos hasta T (mismo cálculo que feature_store.materialize) y la etiqueta con lo ocurrido
+después de T. Entrena bosques en paralelo, valida con folds agrupados por paciente repartidos
+entre núcleos y registra los artefactos en el registro de modelos
+
+Etiquetas (no hay desenlaces clínicos explícitos; se usan los registros posteriores al corte):
+    readmission_risk     1 si el paciente vuelve a consulta en READMISSION_DAYS tras T
+    disease_prediction   ID_ENFERMEDAD del primer diagnóstico en RISK_HORIZON_DAYS tras T
+    risk_classification  0/1/2 (BAJO/MEDIO/ALTO) según uso en RISK_HORIZON_DAYS: ninguna
+                         consulta, alguna, o una urgencia / 3 o más consultas
+
+Uso:
+    python3 "backend py/train_models.py" --source csv
+    python3 "backend py/train_models.py" --source warehouse --n-jobs -1 --output entrenamiento.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from contract_registry import PROJECT_ROOT
+from feature_store import FEATURE_NAMES, RAW_COLUMNS, materialize
+
+CSV_DIR = os.path.join(PROJECT_ROOT, "archivos csv")
+
+READMISSION_DAYS = 30
+RISK_HORIZON_DAYS = 180
+
+# Columnas que necesita el entrenamiento de cada tabla
+TABLES = {
+    'PACIENTES': ['ID_PACIENTE', 'FECHA_NACIMIENTO', 'FECHA_REGISTRO',
+                  'CONSENTIMIENTO_DATOS', 'VERIFICACION_BLOCKCHAIN'],
+    'CONSULTAS': ['ID_CONSULTA', 'ID_PACIENTE', 'FECHA_CONSULTA', 'MOTIVO_CONSULTA'],
+    'DIAGNOSTICOS_CONSULTA': ['ID_CONSULTA', 'ID_ENFERMEDAD', 'DIAGNOSTICO', 'FECHA_DIAGNOSTICO'],
+    'TRATAMIENTOS_CONSULTA': ['ID_CONSULTA', 'ID_MEDICAMENTO', 'FECHA_PRESCRIPCION'],
+    'HISTORIAL_MEDICO': ['ID_PACIENTE', 'TIPO_REGISTRO', 'DESCRIPCION', 'FECHA_REGISTRO'],
+}
+
+DATE_COLUMNS = ('FECHA_NACIMIENTO', 'FECHA_REGISTRO', 'FECHA_CONSULTA',
+                'FECHA_DIAGNOSTICO', 'FECHA_PRESCRIPCION')
+
+# Nombre en el registro -> etiqueta, horizonte y parámetros del bosque
+MODELS = {
+    'risk_classification': {'horizon_days': RISK_HORIZON_DAYS, 'max_depth': 12},
+    'disease_prediction': {'horizon_days': RISK_HORIZON_DAYS, 'max_depth': 12},
+    'readmission_risk': {'horizon_days': READMISSION_DAYS, 'max_depth': 10},
+}
+
+
+# ----- carga de tablas -----
+
+def load_tables_csv(directory=CSV_DIR):
+    """Tablas médicas desde los CSV exportados (las columnas ausentes quedan vacías)"""
+    tables = {}
+    for table, columns in TABLES.items():
+        frame = pd.read_csv(os.path.join(directory, f"{table.lower()}.csv"))
+        tables[table] = frame.reindex(columns=columns)
+    return _normalize(tables)
+
+
+def load_tables_warehouse(conn):
+    """Tablas médicas desde el warehouse (solo las columnas que usa el entrenamiento)"""
+    tables = {}
+    cursor = conn.cursor()
+    try:
+        for table, columns in TABLES.items():
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table}")
+            tables[table] = pd.DataFrame(cursor.fetchall(), columns=columns)
+    finally:
+        cursor.close()
+    return _normalize(tables)
+
+
+def _normalize(tables):
+    for frame in tables.values():
+        for column in frame.columns:
+            if column in DATE_COLUMNS:
+                frame[column] = pd.to_datetime(frame[column], errors='coerce')
+    pacientes = tables['PACIENTES']
+    for column in ('CONSENTIMIENTO_DATOS', 'VERIFICACION_BLOCKCHAIN'):
+        pacientes[column] = pacientes[column].map(
+            lambda value: str(value).strip().upper() in ('TRUE', '1', 'T', 'YES')
+        ).astype(float)
+    # Diagnósticos y tratamientos se atribuyen al paciente de su consulta
+    consultas = tables['CONSULTAS'][['ID_CONSULTA', 'ID_PACIENTE']]
+    for table in ('DIAGNOSTICOS_CONSULTA', 'TRATAMIENTOS_CONSULTA'):
+        tables[table] = tables[table].merge(consultas, on='ID_CONSULTA', how='inner')
+    return tables
+
+
+def _epoch(series):
+    """Segundos epoch (NaN donde no hay fecha)"""
+    values = series.astype('datetime64[ns]')
+    result = values.astype('int64').astype(np.float64) / 1e9
+    result[values.isna().to_numpy()] = np.nan
+    return result
+
+
+# ----- conjunto de entrenamiento -----
+
+def raw_features_at(tables, cutoff):
+    """(ids, matriz RAW_COLUMNS) de los pacientes registrados en `cutoff` con datos hasta ese momento"""
+    pacientes = tables['PACIENTES']
+    pacientes = pacientes[pacientes['FECHA_REGISTRO'].isna() | (pacientes['FECHA_REGISTRO'] <= cutoff)]
+    ids = pacientes['ID_PACIENTE'].to_numpy()
+
+    consultas = tables['CONSULTAS']
+    consultas = consultas[consultas['FECHA_CONSULTA'] <= cutoff]
+    motivo = consultas['MOTIVO_CONSULTA'].fillna('').str.lower()
+    emergencias = consultas[motivo.str.contains('emergenc') | motivo.str.contains('urgenc')]
+
+    diagnosticos = tables['DIAGNOSTICOS_CONSULTA']
+    diagnosticos = diagnosticos[diagnosticos['FECHA_DIAGNOSTICO'] <= cutoff]
+    texto = diagnosticos['DIAGNOSTICO'].fillna('').str.lower()
+    cronicas = diagnosticos[texto.str.contains('chronic') | texto.str.contains('crónic')]
+
+    historial = tables['HISTORIAL_MEDICO']
+    historial = historial[historial['FECHA_REGISTRO'] <= cutoff]
+    historial = historial[
+        historial['TIPO_REGISTRO'].fillna('').str.lower().str.contains('cr.*nic', regex=True)
+        | historial['DESCRIPCION'].fillna('').str.lower().str.contains('chronic')
+    ]
+
+    tratamientos = tables['TRATAMIENTOS_CONSULTA']
+    tratamientos = tratamientos[tratamientos['FECHA_PRESCRIPCION'] <= cutoff]
+
+    index = pd.Index(ids)
+    counts = lambda series: series.reindex(index).fillna(0).to_numpy(dtype=np.float64)
+    raw = np.column_stack([
+        _epoch(pacientes['FECHA_NACIMIENTO']).to_numpy(),
+        counts(cronicas.groupby('ID_PACIENTE')['ID_ENFERMEDAD'].nunique())
+        + counts(historial.groupby('ID_PACIENTE').size()),
+        counts(emergencias.groupby('ID_PACIENTE').size()),
+        counts(tratamientos.groupby('ID_PACIENTE')['ID_MEDICAMENTO'].nunique()),
+        _epoch(consultas.groupby('ID_PACIENTE')['FECHA_CONSULTA'].max().reindex(index)).to_numpy(),
+        pacientes['CONSENTIMIENTO_DATOS'].to_numpy(dtype=np.float64),
+        pacientes['VERIFICACION_BLOCKCHAIN'].to_numpy(dtype=np.float64),
+    ]).reshape(len(ids), len(RAW_COLUMNS))
+    return ids, raw
+
+
+def labels_at(tables, ids, cutoff, horizon_days):
+    """Etiquetas de los tres modelos con lo ocurrido en (cutoff, cutoff + horizon]"""
+    index = pd.Index(ids)
+    end = cutoff + pd.Timedelta(days=horizon_days)
+    consultas = tables['CONSULTAS']
+    futuras = consultas[(consultas['FECHA_CONSULTA'] > cutoff) & (consultas['FECHA_CONSULTA'] <= end)]
+    visitas = futuras.groupby('ID_PACIENTE').size().reindex(index).fillna(0).to_numpy()
+    motivo = futuras['MOTIVO_CONSULTA'].fillna('').str.lower()
+    urgencias = futuras[motivo.str.contains('emergenc') | motivo.str.contains('urgenc')]
+    urgencias = urgencias.groupby('ID_PACIENTE').size().reindex(index).fillna(0).to_numpy()
+
+    diagnosticos = tables['DIAGNOSTICOS_CONSULTA']
+    futuros = diagnosticos[(diagnosticos['FECHA_DIAGNOSTICO'] > cutoff) & (diagnosticos['FECHA_DIAGNOSTICO'] <= end)]
+    primera = futuros.sort_values('FECHA_DIAGNOSTICO').groupby('ID_PACIENTE')['ID_ENFERMEDAD'].first()
+
+    return {
+        'readmission_risk': (visitas > 0).astype(int),
+        'risk_classification': np.where((urgencias > 0) | (visitas >= 3), 2, np.where(visitas > 0, 1, 0)),
+        'disease_prediction': primera.reindex(index).to_numpy(dtype=object),
+    }
+
+
+def event_range(tables):
+    fechas = pd.concat([
+        tables['CONSULTAS']['FECHA_CONSULTA'], tables['DIAGNOSTICOS_CONSULTA']['FECHA_DIAGNOSTICO'],
+        tables['TRATAMIENTOS_CONSULTA']['FECHA_PRESCRIPCION'], tables['HISTORIAL_MEDICO']['FECHA_REGISTRO'],
+    ]).dropna()
+    if fechas.empty:
+        raise ValueError("No hay eventos con fecha para construir el conjunto de entrenamiento")
+    return fechas.min(), fechas.max()
+
+
+def build_training_set(tables, name, step_days=30):
+    """
+    (X, y, grupos, cortes) para `name`: una fila por paciente y fecha de corte, cada
+    `step_days` desde el primer evento hasta que el horizonte de la etiqueta quede observado
+    """
+    horizon = MODELS[name]['horizon_days']
+    first, last = event_range(tables)
+    cutoffs = pd.date_range(first, last - pd.Timedelta(days=horizon), freq=f"{step_days}D")
+    if len(cutoffs) == 0:
+        # Histórico más corto que el horizonte: un solo corte a mitad del rango
+        cutoffs = pd.DatetimeIndex([first + (last - first) / 2])
+
+    blocks, targets, groups = [], [], []
+    for cutoff in cutoffs:
+        ids, raw = raw_features_at(tables, cutoff)
+        y = labels_at(tables, ids, cutoff, horizon)[name]
+        keep = pd.notna(y)
+        blocks.append(materialize(raw[keep], cutoff.timestamp()))
+        targets.append(y[keep])
+        groups.append(ids[keep])
+    X = np.vstack(blocks) if blocks else np.zeros((0, len(FEATURE_NAMES)))
+    y = np.concatenate(targets) if targets else np.zeros(0)
+    if name == 'disease_prediction':
+        y = y.astype(str)
+    else:
+        y = y.astype(int)
+    return X, y, np.concatenate(groups) if groups else np.zeros(0), cutoffs
+
+
+# ----- entrenamiento -----
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure_inference(model, X, single_rows=200):
+    """Latencia por paciente (p50/p99 de predict_proba sobre una fila) y filas/s en lote"""
+    rows = X[:min(single_rows, len(X))]
+    latencies = []
+    for row in rows:
+        start = time.perf_counter()
+        model.predict_proba(row.reshape(1, -1))
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    model.predict_proba(X)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "single_p50_ms": round(_percentile(latencies, 50), 3),
+        "single_p99_ms": round(_percentile(latencies, 99), 3),
+        "batch_rows": len(X),
+        "batch_rows_per_second": round(len(X) / batch_seconds, 1) if batch_seconds else None,
+    }
+
+
+def cross_validate_model(make_model, X, y, groups, folds, n_jobs, seed):
+    """Folds agrupados por paciente en paralelo (un fold por núcleo, bosques de un hilo)"""
+    from sklearn.model_selection import StratifiedGroupKFold, cross_validate
+
+    _, counts = np.unique(y, return_counts=True)
+    splits = min(folds, int(counts.min()), len(np.unique(groups)))
+    if splits < 2:
+        return {"skipped": "clases o pacientes insuficientes para validación cruzada"}
+    scoring = ['accuracy', 'f1_macro'] + (['roc_auc'] if len(counts) == 2 else [])
+    start = time.perf_counter()
+    scores = cross_validate(
+        make_model(1), X, y, groups=groups, scoring=scoring, n_jobs=n_jobs,
+        cv=StratifiedGroupKFold(n_splits=splits, shuffle=True, random_state=seed),
+    )
+    result = {"folds": splits, "seconds": round(time.perf_counter() - start, 3)}
+    for metric in scoring:
+        values = scores[f"test_{metric}"]
+        result[metric] = {"mean": round(float(np.mean(values)), 4), "std": round(float(np.std(values)), 4)}
+    return result
+
+
+def train_model(tables, name, args, registry=None):
+    """Entrenar, validar, medir y (opcionalmente) registrar un modelo; devuelve su reporte"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    X, y, groups, cutoffs = build_training_set(tables, name, args.step_days)
+    classes, counts = np.unique(y, return_counts=True)
+    report = {
+        "model": name,
+        "rows": int(len(X)),
+        "patients": int(len(np.unique(groups))),
+        "cutoffs": len(cutoffs),
+        "classes": {str(label): int(count) for label, count in zip(classes, counts)},
+    }
+    if len(classes) < 2:
+        report["skipped"] = "el conjunto de entrenamiento tiene una sola clase"
+        print(f"⚠️ {name}: {report['skipped']} ({len(X)} filas)")
+        return report
+
+    params = {
+        "n_estimators": args.estimators,
+        "max_depth": MODELS[name]['max_depth'],
+        "min_samples_leaf": args.min_samples_leaf,
+        "class_weight": "balanced",
+        "random_state": args.seed,
+    }
+    make_model = lambda n_jobs: RandomForestClassifier(n_jobs=n_jobs, **params)
+
+    report["cross_validation"] = cross_validate_model(make_model, X, y, groups, args.folds, args.n_jobs, args.seed)
+
+    start = time.perf_counter()
+    model = make_model(args.n_jobs).fit(X, y)
+    report["train_seconds"] = round(time.perf_counter() - start, 3)
+
+    # Latencia con la configuración de servicio: predicciones de un hilo
+    model.n_jobs = 1
+    report["inference"] = measure_inference(model, X)
+
+    if registry is not None:
+        import sklearn
+
+        metrics = {key: value["mean"] for key, value in report["cross_validation"].items()
+                   if isinstance(value, dict)}
+        metadata = registry.register(name, model, metrics=metrics, promote=not args.no_promote, training={
+            "source": args.source,
+            "rows": report["rows"],
+            "patients": report["patients"],
+            "cutoffs": [str(cutoffs[0]), str(cutoffs[-1])],
+            "step_days": args.step_days,
+            "horizon_days": MODELS[name]['horizon_days'],
+            "classes": report["classes"],
+            "train_seconds": report["train_seconds"],
+            "sklearn": sklearn.__version__,
+        })
+        report["version"] = metadata["version"]
+        if args.compile:
+            from forest_inference import export_version
+
+            try:
+                flat = export_version(registry._dir(name, metadata["version"]), model)
+            except Exception as e:
+                # La versión ya está registrada: se sirve con sklearn y siguen los demás modelos
+                report["compile_error"] = str(e)
+                print(f"⚠️ {name}: no se exportó la inferencia compilada: {str(e)}")
+            else:
+                report["inference_compiled"] = measure_inference(flat, X)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrenar los modelos de riesgo, enfermedad y readmisión")
+    parser.add_argument("--source", choices=("warehouse", "csv"), default="warehouse")
+    parser.add_argument("--csv-dir", default=CSV_DIR)
+    parser.add_argument("--models", nargs="+", choices=list(MODELS), default=list(MODELS))
+    parser.add_argument("--step-days", type=int, default=30, help="días entre fechas de corte")
+    parser.add_argument("--estimators", type=int, default=200)
+    parser.add_argument("--min-samples-leaf", type=int, default=2)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="núcleos para entrenar y validar")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-register", action="store_true", help="no escribir artefactos en el registro")
+    parser.add_argument("--no-promote", action="store_true", help="registrar sin activar la versión")
+    parser.add_argument("--compile", action="store_true",
+                        help="exportar también los bosques aplanados (forest_inference.py)")
+    parser.add_argument("--output", help="guardar el reporte JSON en este archivo")
+    args = parser.parse_args()
+
+    print("🧠 ENTRENAMIENTO DE MODELOS MÉDICOS")
+    print("=" * 50)
+    start = time.perf_counter()
+    if args.source == "csv":
+        tables = load_tables_csv(args.csv_dir)
+    else:
+        from snowflake_pool import get_pool, snowflake_config_from_env
+
+        with get_pool(snowflake_config_from_env()).connection() as conn:
+            tables = load_tables_warehouse(conn)
+    print(f"📥 Tablas cargadas desde {args.source} en {time.perf_counter() - start:.2f}s: "
+          f"{len(tables['PACIENTES'])} pacientes, {len(tables['CONSULTAS'])} consultas")
+
+    registry = None
+    if not args.no_register:
+        from model_registry import model_registry_from_env
+
+        registry = model_registry_from_env()
+
+    reports = []
+    for name in args.models:
+        report = train_model(tables, name, args, registry)
+        reports.append(report)
+        if "skipped" in report:
+            continue
+        cv = report["cross_validation"]
+        calidad = (f"f1_macro {cv['f1_macro']['mean']:.3f} ± {cv['f1_macro']['std']:.3f}"
+                   if "f1_macro" in cv else cv.get("skipped"))
+        print(f"✅ {name} {report.get('version', '')}: {report['rows']} filas, "
+              f"entrenado en {report['train_seconds']}s, {calidad}")
+        print(f"   ⏱️ Inferencia: p50 {report['inference']['single_p50_ms']} ms por paciente, "
+              f"{report['inference']['batch_rows_per_second']} filas/s en lote")
+        if "inference_compiled" in report:
+            print(f"   ⚡ Compilada: p50 {report['inference_compiled']['single_p50_ms']} ms por paciente")
+
+    summary = {"source": args.source, "seconds": round(time.perf_counter() - start, 3), "models": reports}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+        print(f"💾 Reporte guardado en {args.output}")
+    else:
+        print(json.dumps(summary, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Pipeline de transacciones para los contratos médicos
+Un solo hilo asigna nonces localmente, firma y envía las transacciones en orden;
+otro hilo espera los recibos de todas las transacciones en vuelo
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+from async_executors import ExecutorSaturatedError
+from gas_fees import FeeStrategy
+
+# Errores del nodo que indican un nonce desincronizado
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "invalid nonce",
+    "nonce has already been used",
+    "replacement transaction underpriced",
+)
+
+
+# El nodo ya tiene exactamente esta transacción firmada: cuenta como enviada
+ALREADY_KNOWN_ERRORS = (
+    "already known",
+    "known transaction",
+)
+
+
+def is_nonce_error(error):
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+
+def is_already_known(error):
+    message = str(error).lower()
+    return any(fragment in message for fragment in ALREADY_KNOWN_ERRORS)
+
+
+class PipelineClosedError(Exception):
+    """El pipeline se cerró antes de que la transacción se enviara o se minara"""
+
+
+class NonceManager:
+    """Nonces asignados localmente: varias transacciones pueden estar en vuelo a la vez"""
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self._next = None
+        self._lock = threading.Lock()
+        self.resyncs = 0
+
+    def _sync_locked(self):
+        self._next = self.w3.eth.get_transaction_count(self.address, "pending")
+
+    def current(self):
+        """Próximo nonce libre (consulta la cadena solo la primera vez)"""
+        with self._lock:
+            if self._next is None:
+                self._sync_locked()
+            return self._next
+
+    def confirm(self, nonce):
+        """El nodo aceptó la transacción con este nonce"""
+        with self._lock:
+            self._next = max(self._next or 0, nonce + 1)
+
+    def resync(self):
+        """Volver a leer el nonce pendiente desde la cadena"""
+        with self._lock:
+            self._sync_locked()
+            self.resyncs += 1
+            return self._next
+
+
+class PendingTransaction:
+    """Transacción encolada: `sent` se resuelve con el hash y `receipt` con el recibo"""
+
+    def __init__(self, contract_function):
+        self.contract_function = contract_function
+        self.sent = Future()
+        self.receipt = Future()
+        self.tx_hash = None
+        self.nonce = None
+        self.gas = None
+        self.fee_key = None
+        self.submitted_at = time.time()
+        # Último bloque en el que se consultó el recibo (None: aún no se consultó)
+        self.checked_block = None
+
+
+class TransactionPipeline:
+    """Cola acotada de transacciones con envío secuencial y recibos asíncronos"""
+
+    def __init__(self, w3, account, fees=None, max_pending=1000,
+                 receipt_poll=0.25, receipt_timeout=120.0, max_retries=2, retry_after=1):
+        self.w3 = w3
+        self.account = account
+        # Cuenta local (con clave) o cuenta administrada por el nodo (solo dirección)
+        self.address = getattr(account, "address", account)
+        # Gas estimado por función y tarifas EIP-1559
+        self.fees = fees or FeeStrategy(w3)
+        self.receipt_poll = receipt_poll
+        self.receipt_timeout = receipt_timeout
+        self.max_retries = max_retries
+        self.retry_after = retry_after
+        self.nonces = NonceManager(w3, self.address)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._awaiting = {}
+        self._awaiting_lock = threading.Lock()
+        self._chain_id = None
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._sent = 0
+        self._failed = 0
+        self._mined = 0
+
+    # --- API pública -------------------------------------------------------
+
+    def submit(self, contract_function):
+        """Encolar una llamada de contrato; no hace RPC en el hilo que llama"""
+        self.start()
+        pending = PendingTransaction(contract_function)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            raise ExecutorSaturatedError("blockchain-tx", self.retry_after)
+        return pending
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for target, name in ((self._send_loop, "tx-sender"), (self._receipt_loop, "tx-receipts")):
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def close(self, timeout=5.0):
+        """Detener los hilos y fallar las transacciones encoladas o sin recibo"""
+        with self._start_lock:
+            self._stop.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+        error = PipelineClosedError("Pipeline de transacciones cerrado")
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            _fail_future(pending.sent, error)
+            _fail_future(pending.receipt, error)
+        with self._awaiting_lock:
+            awaiting = list(self._awaiting.values())
+            self._awaiting.clear()
+        for pending in awaiting:
+            _fail_future(pending.receipt, error)
+
+    def metrics(self):
+        with self._awaiting_lock:
+            awaiting = len(self._awaiting)
+        return {
+            "queued": self._queue.qsize(),
+            "awaiting_receipt": awaiting,
+            "sent": self._sent,
+            "mined": self._mined,
+            "failed": self._failed,
+            "nonce_resyncs": self.nonces.resyncs,
+            "next_nonce": self.nonces._next,
+            "fees": self.fees.metrics(),
+        }
+
+    # --- envío -------------------------------------------------------------
+
+    def _send(self, pending):
+        if self._chain_id is None:
+            self._chain_id = self.w3.eth.chain_id
+        if pending.gas is None:
+            params, pending.fee_key = self.fees.transaction_params(pending.contract_function, self.address)
+            pending.gas = params["gas"]
+        else:
+            # Reintento: se mantiene el gas estimado y se refrescan las tarifas
+            params = {"gas": pending.gas, **self.fees.fees()}
+        nonce = self.nonces.current()
+        transaction = pending.contract_function.build_transaction({
+            "from": self.address,
+            "nonce": nonce,
+            "chainId": self._chain_id,
+            **params,
+        })
+        if hasattr(self.account, "key"):
+            signed = self.w3.eth.account.sign_transaction(transaction, self.account.key)
+            try:
+                tx_hash = self.w3.eth.send_raw_transaction(signed.raw_transaction)
+            except Exception as e:
+                # Reenvío de una transacción que el nodo ya recibió: su hash es el calculado localmente
+                if not is_already_known(e):
+                    raise
+                tx_hash = signed.hash
+        else:
+            tx_hash = self.w3.eth.send_transaction(transaction)
+        self.nonces.confirm(nonce)
+        pending.nonce = nonce
+        return tx_hash
+
+    def _send_with_retries(self, pending):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._send(pending)
+            except Exception as e:
+                # Cualquier fallo puede dejar el nonce local adelantado o atrasado
+                try:
+                    self.nonces.resync()
+                except Exception as sync_error:
+                    print(f"⚠️ No se pudo resincronizar el nonce: {str(sync_error)}")
+                if not is_nonce_error(e) or attempt == self.max_retries:
+                    raise
+
+    def _send_loop(self):
+        while not self._stop.is_set():
+            try:
+                pending = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._send_one(pending)
+            except Exception as e:
+                # Un elemento con error no puede terminar el hilo: los demás siguen en la cola
+                print(f"⚠️ Error enviando transacción: {str(e)}")
+                _fail_future(pending.sent, e)
+                _fail_future(pending.receipt, e)
+
+    def _send_one(self, pending):
+        try:
+            tx_hash = self._send_with_retries(pending)
+        except Exception as e:
+            self._failed += 1
+            # El llamador pudo cancelar los futures mientras se enviaba
+            _fail_future(pending.sent, e)
+            _fail_future(pending.receipt, e)
+            return
+        self._sent += 1
+        pending.tx_hash = tx_hash
+        if not _resolve_future(pending.sent, tx_hash):
+            # Cancelada por el llamador: ya está en la red, pero nadie espera su recibo
+            _fail_future(pending.receipt, PipelineClosedError("Envío cancelado por el llamador"))
+            return
+        with self._awaiting_lock:
+            closed = self._stop.is_set()
+            if not closed:
+                self._awaiting[bytes(tx_hash)] = pending
+        if closed:
+            # close() ya falló las esperas y el hilo de recibos terminó
+            _fail_future(pending.receipt, PipelineClosedError("Pipeline de transacciones cerrado"))
+
+    # --- recibos -----------------------------------------------------------
+
+    def _receipt_loop(self):
+        from web3.exceptions import TransactionNotFound
+
+        while not self._stop.wait(self.receipt_poll):
+            with self._awaiting_lock:
+                awaiting = list(self._awaiting.items())
+            if not awaiting:
+                continue
+            try:
+                block = self.w3.eth.block_number
+            except Exception as e:
+                print(f"⚠️ Error consultando el bloque actual: {str(e)}")
+                continue
+            now = time.time()
+            for key, pending in awaiting:
+                receipt = None
+                # Una consulta por transacción y bloque: las recién agregadas se consultan
+                # aunque el bloque no haya cambiado (con automine ya pueden estar minadas)
+                if pending.checked_block != block:
+                    try:
+                        receipt = self.w3.eth.get_transaction_receipt(pending.tx_hash)
+                        pending.checked_block = block
+                    except TransactionNotFound:
+                        pending.checked_block = block
+                    except Exception as e:
+                        print(f"⚠️ Error consultando recibo {pending.tx_hash.hex()}: {str(e)}")
+                if receipt is not None:
+                    self._mined += 1
+                    self._observe(pending, receipt)
+                    self._resolve(key, pending, receipt=receipt)
+                elif now - pending.submitted_at > self.receipt_timeout:
+                    self._failed += 1
+                    self._resolve(key, pending, error=TimeoutError(
+                        f"Sin recibo para {pending.tx_hash.hex()} tras {self.receipt_timeout}s"
+                    ))
+
+    def _observe(self, pending, receipt):
+        try:
+            self.fees.observe(pending.fee_key, pending.gas, receipt)
+        except Exception as e:
+            print(f"⚠️ No se pudo registrar el gas de {pending.tx_hash.hex()}: {str(e)}")
+
+    def _resolve(self, key, pending, receipt=None, error=None):
+        with self._awaiting_lock:
+            self._awaiting.pop(key, None)
+        if error is not None:
+            _fail_future(pending.receipt, error)
+        else:
+            _resolve_future(pending.receipt, receipt)
+
+
+def _fail_future(future, error):
+    # done() y set_exception no son atómicos: el llamador puede cancelar entre ambos
+    try:
+        future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+def _resolve_future(future, result):
+    """Fija el resultado si nadie canceló el future; devuelve si se fijó"""
+    try:
+        future.set_result(result)
+    except InvalidStateError:
+        return False
+    return True
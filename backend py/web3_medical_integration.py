@@ -4,20 +4,28 @@ Integración Web3 para Sistema Médico BI
 Conecta el frontend con contratos inteligentes médicos
 """
 
-import json
+import asyncio
 import os
+import threading
 from web3 import Web3
 from dotenv import load_dotenv
 from eth_account import Account
 import hashlib
 
+from async_executors import ExecutorSaturatedError
+from batch_reads import batch_reader_from_env
+from contract_registry import get_registry
+from gas_fees import fee_strategy_from_env
+from tx_pipeline import TransactionPipeline
+
 # Cargar variables de entorno
 load_dotenv()
 
 class MedicalBlockchain:
-    def __init__(self):
-        # Configuración de Web3
-        self.w3 = Web3(Web3.HTTPProvider(os.getenv('ETHEREUM_RPC_URL', 'http://127.0.0.1:8545')))
+    def __init__(self, registry=None):
+        # Web3, direcciones y ABIs compartidos por todos los módulos (sin I/O de red aquí)
+        self.registry = registry or get_registry()
+        self.w3 = self.registry.w3
         
         # Cargar direcciones de contratos
         self.load_contract_addresses()
@@ -30,218 +38,299 @@ class MedicalBlockchain:
         
         # Configurar cuenta
         self.setup_account()
+        
+        self._pipeline = None
+        self._pipeline_lock = threading.Lock()
+        
+        # Lecturas agrupadas en lotes JSON-RPC (registros inmutables en caché)
+        self.reader = batch_reader_from_env(self.w3, session=self.registry.session)
     
     def load_contract_addresses(self):
-        """Cargar direcciones de contratos desde archivo JSON"""
-        try:
-            with open('blockchain/contract-addresses.json', 'r') as f:
-                addresses = json.load(f)
-                self.medical_records_address = addresses['MedicalRecords']
-                self.patient_consent_address = addresses['PatientConsent']
-                self.medical_audit_address = addresses['MedicalAudit']
-        except FileNotFoundError:
-            print("⚠️ Archivo contract-addresses.json no encontrado")
-            print("🔧 Ejecuta: cd blockchain && npx hardhat run scripts/deploy-medical.js --network localhost")
-            # Usar direcciones por defecto para desarrollo
-            self.medical_records_address = "0x0000000000000000000000000000000000000000"
-            self.patient_consent_address = "0x0000000000000000000000000000000000000000"
-            self.medical_audit_address = "0x0000000000000000000000000000000000000000"
+        """Cargar direcciones de contratos desde el registro compartido"""
+        self.medical_records_address = self.registry.address('MedicalRecords')
+        self.patient_consent_address = self.registry.address('PatientConsent')
+        self.medical_audit_address = self.registry.address('MedicalAudit')
     
     def load_contract_abis(self):
-        """Cargar ABI de contratos desde archivos compilados"""
-        try:
-            # Cargar ABI de MedicalRecords
-            with open('blockchain/artifacts/contracts/MedicalRecords.sol/MedicalRecords.json', 'r') as f:
-                medical_records_abi = json.load(f)['abi']
-            
-            # Cargar ABI de PatientConsent
-            with open('blockchain/artifacts/contracts/PatientConsent.sol/PatientConsent.json', 'r') as f:
-                patient_consent_abi = json.load(f)['abi']
-            
-            # Cargar ABI de MedicalAudit
-            with open('blockchain/artifacts/contracts/MedicalAudit.sol/MedicalAudit.json', 'r') as f:
-                medical_audit_abi = json.load(f)['abi']
-            
-            self.medical_records_abi = medical_records_abi
-            self.patient_consent_abi = patient_consent_abi
-            self.medical_audit_abi = medical_audit_abi
-            
-        except FileNotFoundError:
-            print("⚠️ Archivos ABI no encontrados")
-            print("🔧 Ejecuta: cd blockchain && npx hardhat compile")
-            # Usar ABI básico para desarrollo
-            self.medical_records_abi = []
-            self.patient_consent_abi = []
-            self.medical_audit_abi = []
+        """Cargar ABI de contratos (leídos una vez por proceso)"""
+        self.medical_records_abi = self.registry.abi('MedicalRecords')
+        self.patient_consent_abi = self.registry.abi('PatientConsent')
+        self.medical_audit_abi = self.registry.abi('MedicalAudit')
     
     def initialize_contracts(self):
         """Inicializar instancias de contratos"""
-        self.medical_records_contract = self.w3.eth.contract(
-            address=self.medical_records_address,
-            abi=self.medical_records_abi
-        )
-        
-        self.patient_consent_contract = self.w3.eth.contract(
-            address=self.patient_consent_address,
-            abi=self.patient_consent_abi
-        )
-        
-        self.medical_audit_contract = self.w3.eth.contract(
-            address=self.medical_audit_address,
-            abi=self.medical_audit_abi
-        )
+        self.medical_records_contract = self.registry.contract('MedicalRecords')
+        self.patient_consent_contract = self.registry.contract('PatientConsent')
+        self.medical_audit_contract = self.registry.contract('MedicalAudit')
     
     def setup_account(self):
         """Configurar cuenta para transacciones"""
         private_key = os.getenv('PRIVATE_KEY')
+        self._account = None
         if private_key:
-            self.account = Account.from_key(private_key)
-            self.w3.eth.default_account = self.account.address
+            self._account = Account.from_key(private_key)
+            self.w3.eth.default_account = self._account.address
         else:
             print("⚠️ PRIVATE_KEY no configurada en .env")
-            # Usar cuenta por defecto para desarrollo
-            self.account = self.w3.eth.accounts[0] if self.w3.eth.accounts else None
     
-    def create_medical_record(self, patient_id, diagnosis, treatment):
-        """Crear registro médico en blockchain"""
+    @property
+    def account(self):
+        # Sin PRIVATE_KEY se usa la primera cuenta del nodo, consultada al primer uso
+        if self._account is None:
+            self._account = self.registry.default_account()
+        return self._account
+    
+    @property
+    def pipeline(self):
+        """Cola de transacciones con nonces locales (varias en vuelo sin colisiones)"""
+        with self._pipeline_lock:
+            if self._pipeline is None:
+                self._pipeline = TransactionPipeline(
+                    self.w3, self.account,
+                    fees=fee_strategy_from_env(self.w3),
+                    max_pending=int(os.getenv('BLOCKCHAIN_MAX_PENDING', '1000')),
+                    receipt_timeout=float(os.getenv('BLOCKCHAIN_RECEIPT_TIMEOUT', '120'))
+                )
+            return self._pipeline
+    
+    def close(self):
+        """Detener el pipeline de transacciones si llegó a crearse"""
+        if self._pipeline is not None:
+            self._pipeline.close()
+    
+    def _wait_result(self, send, formatter, timeout=None):
+        """Encolar con send() y esperar el recibo en el hilo actual (scripts y rutas síncronas)"""
         try:
-            # Construir transacción
-            transaction = self.medical_records_contract.functions.createMedicalRecord(
-                patient_id,
-                diagnosis,
-                treatment
-            ).build_transaction({
-                'from': self.account.address,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': self.w3.eth.get_transaction_count(self.account.address)
-            })
-            
-            # Firmar y enviar transacción
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, self.account.key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            
-            # Esperar confirmación
-            tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
-            # Obtener hash del registro creado
-            record_hash = tx_receipt.logs[0].topics[1]
-            
+            pending = send()
+            receipt = pending.receipt.result(timeout or self.pipeline.receipt_timeout)
+            return formatter(pending.tx_hash, receipt)
+        except ExecutorSaturatedError:
+            raise
+        except Exception as e:
             return {
-                'success': True,
-                'record_hash': record_hash.hex(),
-                'transaction_hash': tx_hash.hex(),
-                'block_number': tx_receipt.blockNumber
+                'success': False,
+                'error': str(e)
             }
-            
+    
+    async def _await_result(self, send, formatter):
+        """Encolar con send() y esperar el recibo sin bloquear el event loop"""
+        try:
+            pending = send()
+            receipt = await asyncio.wrap_future(pending.receipt)
+            return formatter(pending.tx_hash, receipt)
+        except ExecutorSaturatedError:
+            raise
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
     
+    @staticmethod
+    def _check_receipt(receipt):
+        if receipt.status == 0:
+            raise RuntimeError(f"Transacción revertida en el bloque {receipt.blockNumber}")
+    
+    @classmethod
+    def _medical_record_result(cls, tx_hash, tx_receipt):
+        cls._check_receipt(tx_receipt)
+        # Obtener hash del registro creado
+        record_hash = tx_receipt.logs[0].topics[1]
+        return {
+            'success': True,
+            'record_hash': record_hash.hex(),
+            'transaction_hash': tx_hash.hex(),
+            'block_number': tx_receipt.blockNumber
+        }
+    
+    def send_medical_record(self, patient_id, diagnosis, treatment):
+        """Encolar la creación de un registro médico; devuelve PendingTransaction"""
+        return self.pipeline.submit(
+            self.medical_records_contract.functions.createMedicalRecord(
+                patient_id,
+                diagnosis,
+                treatment
+            )
+        )
+    
+    def create_medical_record(self, patient_id, diagnosis, treatment):
+        """Crear registro médico en blockchain"""
+        return self._wait_result(
+            lambda: self.send_medical_record(patient_id, diagnosis, treatment), self._medical_record_result
+        )
+    
+    async def create_medical_record_async(self, patient_id, diagnosis, treatment):
+        """Crear registro médico en blockchain (versión async)"""
+        return await self._await_result(
+            lambda: self.send_medical_record(patient_id, diagnosis, treatment), self._medical_record_result
+        )
+    
+    @staticmethod
+    def _medical_record_dict(record):
+        return {
+            'success': True,
+            'patient_id': record[0],
+            'diagnosis': record[1],
+            'treatment': record[2],
+            'timestamp': record[3],
+            'doctor': record[4],
+            'exists': record[5]
+        }
+    
+    def get_medical_records(self, record_hashes):
+        """Obtener varios registros médicos en lotes JSON-RPC (mismo orden que record_hashes)"""
+        results = [None] * len(record_hashes)
+        args_list, positions = [], []
+        for index, record_hash in enumerate(record_hashes):
+            try:
+                args_list.append((Web3.to_bytes(hexstr=record_hash),))
+                positions.append(index)
+            except Exception as e:
+                results[index] = {'success': False, 'error': str(e)}
+        
+        # Un registro existente no cambia: se cachea por hash
+        records = self.reader.call_many(
+            self.medical_records_contract, 'getMedicalRecord', args_list,
+            cache_if=lambda record: record[5]
+        )
+        for index, record in zip(positions, records):
+            if isinstance(record, Exception):
+                results[index] = {'success': False, 'error': str(record)}
+            else:
+                results[index] = self._medical_record_dict(record)
+        return results
+    
     def get_medical_record(self, record_hash):
         """Obtener registro médico desde blockchain"""
         try:
-            # Convertir hash de string a bytes32
-            from web3 import Web3
-            record_hash_bytes = Web3.to_bytes(hexstr=record_hash)
-            
-            record = self.medical_records_contract.functions.getMedicalRecord(record_hash_bytes).call()
-            return {
-                'success': True,
-                'patient_id': record[0],
-                'diagnosis': record[1],
-                'treatment': record[2],
-                'timestamp': record[3],
-                'doctor': record[4],
-                'exists': record[5]
-            }
+            return self.get_medical_records([record_hash])[0]
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def update_patient_consent(self, data_sharing, research_participation, emergency_access):
-        """Actualizar consentimiento del paciente"""
-        try:
-            transaction = self.patient_consent_contract.functions.updateConsent(
+    def send_anchor_root(self, merkle_root, record_count):
+        """Encolar el anclaje de una raíz Merkle (un lote de registros en una transacción)"""
+        return self.pipeline.submit(
+            self.medical_records_contract.functions.anchorRecords(merkle_root, record_count)
+        )
+    
+    def root_anchored_at(self, merkle_root):
+        """Timestamp del bloque que ancló la raíz (0 si no está anclada)"""
+        return self.medical_records_contract.functions.anchoredRoots(merkle_root).call()
+    
+    def verify_anchored_record(self, record_hash, proof, merkle_root):
+        """Verificar on-chain la prueba de inclusión de un registro anclado"""
+        return self.medical_records_contract.functions.verifyAnchoredRecord(
+            record_hash, proof, merkle_root
+        ).call()
+    
+    @classmethod
+    def _consent_result(cls, tx_hash, tx_receipt):
+        cls._check_receipt(tx_receipt)
+        return {
+            'success': True,
+            'transaction_hash': tx_hash.hex(),
+            'block_number': tx_receipt.blockNumber
+        }
+    
+    def send_patient_consent(self, data_sharing, research_participation, emergency_access):
+        """Encolar la actualización de consentimiento; devuelve PendingTransaction"""
+        return self.pipeline.submit(
+            self.patient_consent_contract.functions.updateConsent(
                 data_sharing,
                 research_participation,
                 emergency_access
-            ).build_transaction({
-                'from': self.account.address,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': self.w3.eth.get_transaction_count(self.account.address)
-            })
-            
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, self.account.key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
-            return {
-                'success': True,
-                'transaction_hash': tx_hash.hex(),
-                'block_number': tx_receipt.blockNumber
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            )
+        )
+    
+    def update_patient_consent(self, data_sharing, research_participation, emergency_access):
+        """Actualizar consentimiento del paciente"""
+        return self._wait_result(
+            lambda: self.send_patient_consent(data_sharing, research_participation, emergency_access),
+            self._consent_result
+        )
+    
+    async def update_patient_consent_async(self, data_sharing, research_participation, emergency_access):
+        """Actualizar consentimiento del paciente (versión async)"""
+        return await self._await_result(
+            lambda: self.send_patient_consent(data_sharing, research_participation, emergency_access),
+            self._consent_result
+        )
+    
+    @staticmethod
+    def _consent_dict(consent):
+        return {
+            'success': True,
+            'data_sharing': consent[0],
+            'research_participation': consent[1],
+            'emergency_access': consent[2],
+            'last_updated': consent[3],
+            'patient': consent[4],
+            'exists': consent[5]
+        }
+    
+    def get_patient_consents(self, patient_addresses):
+        """Obtener consentimientos de varios pacientes en lotes JSON-RPC (sin caché: son mutables)"""
+        results = [None] * len(patient_addresses)
+        args_list, positions = [], []
+        for index, address in enumerate(patient_addresses):
+            try:
+                args_list.append((Web3.to_checksum_address(address),))
+                positions.append(index)
+            except Exception as e:
+                results[index] = {'success': False, 'error': str(e)}
+        
+        consents = self.reader.call_many(self.patient_consent_contract, 'getConsent', args_list)
+        for index, consent in zip(positions, consents):
+            if isinstance(consent, Exception):
+                results[index] = {'success': False, 'error': str(consent)}
+            else:
+                results[index] = self._consent_dict(consent)
+        return results
     
     def get_patient_consent(self, patient_address):
         """Obtener consentimiento del paciente"""
         try:
-            consent = self.patient_consent_contract.functions.getConsent(patient_address).call()
-            return {
-                'success': True,
-                'data_sharing': consent[0],
-                'research_participation': consent[1],
-                'emergency_access': consent[2],
-                'last_updated': consent[3],
-                'patient': consent[4],
-                'exists': consent[5]
-            }
+            return self.get_patient_consents([patient_address])[0]
         except Exception as e:
             return {
                 'success': False,
                 'error': str(e)
             }
     
-    def create_audit_log(self, action, details, record_hash):
-        """Crear log de auditoría"""
-        try:
-            transaction = self.medical_audit_contract.functions.createAuditLog(
+    @classmethod
+    def _audit_log_result(cls, tx_hash, tx_receipt):
+        cls._check_receipt(tx_receipt)
+        return {
+            'success': True,
+            'log_hash': tx_receipt.logs[0].topics[1].hex(),
+            'transaction_hash': tx_hash.hex(),
+            'block_number': tx_receipt.blockNumber
+        }
+    
+    def send_audit_log(self, action, details, record_hash):
+        """Encolar un log de auditoría; devuelve PendingTransaction"""
+        return self.pipeline.submit(
+            self.medical_audit_contract.functions.createAuditLog(
                 action,
                 details,
                 record_hash
-            ).build_transaction({
-                'from': self.account.address,
-                'gas': 2000000,
-                'gasPrice': self.w3.eth.gas_price,
-                'nonce': self.w3.eth.get_transaction_count(self.account.address)
-            })
-            
-            signed_txn = self.w3.eth.account.sign_transaction(transaction, self.account.key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-            
-            return {
-                'success': True,
-                'log_hash': tx_receipt.logs[0].topics[1].hex(),
-                'transaction_hash': tx_hash.hex(),
-                'block_number': tx_receipt.blockNumber
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'error': str(e)
-            }
+            )
+        )
+    
+    def create_audit_log(self, action, details, record_hash):
+        """Crear log de auditoría"""
+        return self._wait_result(
+            lambda: self.send_audit_log(action, details, record_hash), self._audit_log_result
+        )
+    
+    async def create_audit_log_async(self, action, details, record_hash):
+        """Crear log de auditoría (versión async)"""
+        return await self._await_result(
+            lambda: self.send_audit_log(action, details, record_hash), self._audit_log_result
+        )
     
     def get_connection_status(self):
         """Verificar estado de conexión a blockchain"""
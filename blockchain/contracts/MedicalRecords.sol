@@ -6,6 +6,8 @@ contract MedicalRecords {
     mapping(bytes32 => MedicalRecord) public records;
     mapping(address => bool) public authorizedDoctors;
     mapping(address => bytes32[]) public patientRecords;
+    // Raíces Merkle de lotes de registros anclados -> timestamp del anclaje
+    mapping(bytes32 => uint256) public anchoredRoots;
     
     struct MedicalRecord {
         string patientId;
@@ -19,6 +21,7 @@ contract MedicalRecords {
     event RecordCreated(bytes32 indexed recordHash, string patientId, address doctor);
     event DoctorAuthorized(address indexed doctor);
     event DoctorRevoked(address indexed doctor);
+    event RecordsAnchored(bytes32 indexed merkleRoot, uint256 recordCount, address doctor);
     
     modifier onlyOwner() {
         require(msg.sender == owner, "Not owner");
@@ -88,4 +91,31 @@ contract MedicalRecords {
     function getPatientRecords(address patient) public view returns (bytes32[] memory) {
         return patientRecords[patient];
     }
+    
+    // Anclar un lote de registros con una sola transacción (los datos quedan fuera de la cadena)
+    function anchorRecords(bytes32 merkleRoot, uint256 recordCount) public onlyAuthorizedDoctor {
+        require(merkleRoot != bytes32(0), "Empty root");
+        require(anchoredRoots[merkleRoot] == 0, "Root already anchored");
+        anchoredRoots[merkleRoot] = block.timestamp;
+        emit RecordsAnchored(merkleRoot, recordCount, msg.sender);
+    }
+    
+    // Verificar la prueba de inclusión de un registro (pares ordenados, como el backend)
+    function verifyAnchoredRecord(
+        bytes32 recordHash,
+        bytes32[] calldata proof,
+        bytes32 merkleRoot
+    ) public view returns (bool) {
+        if (anchoredRoots[merkleRoot] == 0) {
+            return false;
+        }
+        bytes32 computed = recordHash;
+        for (uint256 i = 0; i < proof.length; i++) {
+            bytes32 sibling = proof[i];
+            computed = computed <= sibling
+                ? keccak256(abi.encodePacked(computed, sibling))
+                : keccak256(abi.encodePacked(sibling, computed));
+        }
+        return computed == merkleRoot;
+    }
 } 
\ No newline at end of file
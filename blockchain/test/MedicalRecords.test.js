@@ -0,0 +1,112 @@
+const { expect } = require("chai");
+
+// Hoja de un registro, igual que record_leaf en merkle_anchor.py:
+// keccak256(abi.encode(patientId, diagnosis, treatment, timestamp, doctor))
+function recordLeaf(patientId, diagnosis, treatment, timestamp, doctor) {
+  return ethers.keccak256(
+    ethers.AbiCoder.defaultAbiCoder().encode(
+      ["string", "string", "string", "uint256", "string"],
+      [patientId, diagnosis, treatment, timestamp, doctor]
+    )
+  );
+}
+
+// Hash de un par de nodos ordenados, igual que merkle_anchor.py
+function hashPair(a, b) {
+  const [left, right] = BigInt(a) <= BigInt(b) ? [a, b] : [b, a];
+  return ethers.keccak256(ethers.concat([left, right]));
+}
+
+// Mismo algoritmo que build_merkle_tree: un nodo sin pareja sube tal cual
+function buildMerkleTree(leaves) {
+  const proofs = leaves.map(() => []);
+  const positions = leaves.map((_, i) => i);
+  let level = [...leaves];
+  while (level.length > 1) {
+    const parents = [];
+    for (let i = 0; i < level.length; i += 2) {
+      parents.push(i + 1 < level.length ? hashPair(level[i], level[i + 1]) : level[i]);
+    }
+    positions.forEach((pos, leafIndex) => {
+      const sibling = pos ^ 1;
+      if (sibling < level.length) {
+        proofs[leafIndex].push(level[sibling]);
+      }
+      positions[leafIndex] = Math.floor(pos / 2);
+    });
+    level = parents;
+  }
+  return { root: level[0], proofs };
+}
+
+function leavesFor(count) {
+  return Array.from({ length: count }, (_, i) =>
+    recordLeaf(`PAC_${String(i + 1).padStart(3, "0")}`, "Diagnóstico", "Tratamiento", 1700000000 + i, "doctor_1")
+  );
+}
+
+describe("MedicalRecords - anclaje Merkle", function () {
+  let records, owner, addr1, leaves, root;
+
+  beforeEach(async function () {
+    const MedicalRecords = await ethers.getContractFactory("MedicalRecords");
+    [owner, addr1] = await ethers.getSigners();
+    records = await MedicalRecords.deploy();
+
+    leaves = leavesFor(3);
+    // Tres hojas: el tercer nodo sube sin pareja al siguiente nivel
+    root = hashPair(hashPair(leaves[0], leaves[1]), leaves[2]);
+  });
+
+  it("Ancla una raíz y emite RecordsAnchored", async function () {
+    await expect(records.anchorRecords(root, 3))
+      .to.emit(records, "RecordsAnchored")
+      .withArgs(root, 3, owner.address);
+    expect(await records.anchoredRoots(root)).to.be.greaterThan(0);
+  });
+
+  it("Verifica pruebas de inclusión válidas", async function () {
+    await records.anchorRecords(root, 3);
+    const proof0 = [leaves[1], leaves[2]];
+    const proof2 = [hashPair(leaves[0], leaves[1])];
+    expect(await records.verifyAnchoredRecord(leaves[0], proof0, root)).to.equal(true);
+    expect(await records.verifyAnchoredRecord(leaves[2], proof2, root)).to.equal(true);
+  });
+
+  it("Acepta las pruebas de build_merkle_tree para lotes pares e impares", async function () {
+    // 1, 3, 5, 6 y 7 hojas promueven nodos sin pareja en uno o más niveles
+    for (const count of [1, 2, 3, 4, 5, 6, 7, 8]) {
+      const batch = leavesFor(count);
+      const tree = buildMerkleTree(batch);
+      await records.anchorRecords(tree.root, count);
+      for (let i = 0; i < count; i++) {
+        expect(
+          await records.verifyAnchoredRecord(batch[i], tree.proofs[i], tree.root),
+          `hoja ${i} de un lote de ${count}`
+        ).to.equal(true);
+      }
+    }
+  });
+
+  it("La hoja incluye al doctor del registro", async function () {
+    await records.anchorRecords(root, 3);
+    const otroDoctor = recordLeaf("PAC_001", "Diagnóstico", "Tratamiento", 1700000000, "doctor_2");
+    expect(await records.verifyAnchoredRecord(otroDoctor, [leaves[1], leaves[2]], root)).to.equal(false);
+  });
+
+  it("Rechaza registros alterados o raíces no ancladas", async function () {
+    const proof0 = [leaves[1], leaves[2]];
+    expect(await records.verifyAnchoredRecord(leaves[0], proof0, root)).to.equal(false);
+    await records.anchorRecords(root, 3);
+    const alterado = recordLeaf("PAC_001", "Otro diagnóstico", "Tratamiento", 1700000000, "doctor_1");
+    expect(await records.verifyAnchoredRecord(alterado, proof0, root)).to.equal(false);
+  });
+
+  it("No permite anclar la misma raíz dos veces ni a cuentas no autorizadas", async function () {
+    await records.anchorRecords(root, 3);
+    await expect(records.anchorRecords(root, 3)).to.be.revertedWith("Root already anchored");
+    await expect(
+      records.connect(addr1).anchorRecords(ethers.keccak256("0x01"), 1)
+    ).to.be.revertedWith("Not authorized doctor");
+  });
+});